@@ -1,13 +1,19 @@
 
+from dataclasses import asdict
 from datetime import datetime, timedelta
+import glob
 import json
 import logging
+from pathlib import Path
+import sys
 from lib.database import get_session, init_db
 from lib.models import Instrument
-from service.YahooFinanceService import download_history
+from service.YahooFinanceService import download_history, ingest_chart_files
+from service.trades_import_service import import_trades_csv
 from service.myYahooFinanceService import YahooSymbolParser
+from lib.repo.accounts_repository import get_account_by_name
+from lib.repo.instruments_repository import add_fx_instrument
 from lib.repo.ohlcvs_repository import load_ohlcv_from_symbol
-from lib.repo.prices_repository import load_prices_from_symbol
 
 
 logger = logging.getLogger(__name__)
@@ -31,11 +37,48 @@ def handle_load_json(args):
     try:
         parser = YahooSymbolParser(data)
         load_ohlcv_from_symbol(parser.symbol, True) # FIXME: this boolean parameter should not be fixed in code
-        load_prices_from_symbol(parser.symbol, True) # FIXME: this boolean parameter should not be fixed in code
     except Exception as ex:
-        logger.error("Error while trying to load market prices / OHLCVs")
+        logger.error("Error while trying to load OHLCVs")
         logger.error(ex)
 
+def handle_load_json_dir(args):
+    """Load every Yahoo chart JSON file of a directory (or glob) using a pool of parser processes."""
+
+    path = Path(args.path)
+    paths = sorted(str(p) for p in path.glob("*.json")) if path.is_dir() else sorted(glob.glob(args.path))
+    if not paths:
+        logger.error(f"No JSON files found for {args.path}")
+        return
+
+    workers = getattr(args, "workers", None)
+    batch_size = getattr(args, "batch_size", None) or 50
+    create_instrument = getattr(args, "create", True)
+
+    stats = ingest_chart_files(paths, int(workers) if workers else None, int(batch_size), create_instrument)
+    logger.info(
+        f"Loaded {stats['bars']} bars from {stats['parsed']} files in {stats['seconds']:.1f}s "
+        f"({stats['bars_per_second']:,.0f} bars/s), {stats['failed']} failed, {stats['skipped']} skipped"
+    )
+    return stats
+
+def handle_import_trades_csv(args):
+    """Import a broker CSV of trades in one transaction with batched inserts."""
+
+    try:
+        with open(args.file, mode="r", encoding="utf-8", newline="") as read_file:
+            result = import_trades_csv(read_file, strict=getattr(args, "strict", False))
+    except FileNotFoundError as e:
+        logger.error(f"File not found: {e}")
+        return
+
+    for error in result.errors:
+        logger.error(f"Line {error.line}: {error.message}")
+    logger.info(
+        f"{result.inserted}/{result.rows} trades imported, {result.positions_created} positions created, "
+        f"{result.positions_closed} closed{'' if result.committed else ' (rolled back)'}"
+    )
+    return result
+
 def handle_load_ticker(args):
 
     try:
@@ -52,3 +95,142 @@ def handle_load_ticker(args):
         logger.error(f"Error while trying to load prices for {args.ticker}")
         logger.error(ex)
         return
+
+def handle_add_fx_pair(args):
+    """Register an FX pair (e.g. EURUSD) as an Instrument; its history is then loaded with handle_load_ticker."""
+
+    pair = args.pair.upper().replace("/", "")
+    if len(pair) != 6:
+        logger.error(f"Invalid FX pair: {args.pair}")
+        return
+
+    with get_session() as session:
+        instrument = add_fx_instrument(session, pair[:3], pair[3:])
+        if instrument:
+            logger.info(f"FX pair registered, load its history with ticker {instrument.ticker}")
+
+
+def handle_build_close_matrix(args):
+    """Refresh the persisted close matrix (incrementally unless --full is given)."""
+
+    from service.close_matrix_service import refresh_close_matrix  # numpy: keep CLI startup light
+
+    stats = refresh_close_matrix(full=getattr(args, "full", False))
+    logger.info(f"Close matrix {stats['mode']}: {stats['instruments']} instruments x {stats['days']} days")
+    return stats
+
+def handle_sync_ohlcv_store(args):
+    """Sync the OHLCV column store from SQLite (all instruments)."""
+
+    from service.ohlcv_store_service import sync_ohlcv_store  # numpy: keep CLI startup light
+
+    return sync_ohlcv_store()
+
+def handle_verify_ohlcv_store(args):
+    """Check that the OHLCV column store matches SQLite; returns False on any mismatch."""
+
+    from service.ohlcv_store_service import verify_ohlcv_store  # numpy: keep CLI startup light
+
+    report = verify_ohlcv_store()
+    for mismatch in report["mismatches"]:
+        logger.error(f"❌ Instrument {mismatch['instrument_id']} ({mismatch['granularity']}): {mismatch['reason']}")
+    logger.info(f"OHLCV column store: {report['ok']}/{report['series']} series match SQLite")
+    return not report["mismatches"]
+
+def handle_tax_lot_report(args):
+    """Write the realized gains tax-lot report (args.year, args.account, args.format) to args.output, or stdout."""
+
+    from service.tax_lot_report_service import stream_tax_lot_report
+
+    account_id = None
+    account_name = getattr(args, "account", None)
+    if account_name:
+        with get_session() as session:
+            account = get_account_by_name(session, account_name)
+            if not account:
+                logger.error(f"Account {account_name} not found")
+                return False
+            account_id = account.id
+
+    year = getattr(args, "year", None)
+    chunks = stream_tax_lot_report(getattr(args, "format", None) or "csv", account_id=account_id,
+                                   year=int(year) if year else None, session_factory=get_session)
+    output = getattr(args, "output", None)
+    if not output:
+        for chunk in chunks:
+            sys.stdout.write(chunk)
+        return True
+
+    with open(output, "w", encoding="utf-8", newline="") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    logger.info(f"Realized gains report written to {output}")
+    return True
+
+def handle_maintain(args):
+    """
+    ANALYZE the database, then PRAGMA optimize (args.optimize) and vacuum (args.vacuum: full or incremental)
+    when asked; args.full_check runs the full integrity check. Logs the storage report, or prints it as
+    JSON with args.json. Returns False when the integrity check fails.
+    """
+
+    from service.maintenance_service import run_maintenance
+
+    report = run_maintenance(
+        analyze=not getattr(args, "no_analyze", False),
+        optimize=getattr(args, "optimize", False),
+        vacuum_mode=getattr(args, "vacuum", None),
+        full_check=getattr(args, "full_check", False),
+    )
+
+    if getattr(args, "json", False):
+        sys.stdout.write(json.dumps(asdict(report), indent=2) + "\n")
+        return report.integrity_ok
+
+    for error in report.integrity_errors:
+        logger.error(f"❌ {error}")
+    for stats in report.objects:
+        rows = f"{stats.rows:,} rows, " if stats.rows is not None else ""
+        logger.info(f"{stats.type} {stats.name}: {rows}{stats.pages:,} pages, {stats.size_bytes / 1024:,.0f} KB, "
+                    f"{stats.unused_bytes / 1024:,.0f} KB unused, {stats.fragmentation:.1f}% fragmented")
+    logger.info(
+        f"Integrity {'ok' if report.integrity_ok else 'FAILED'}, analyzed: {report.analyzed}, optimized: {report.optimized}, "
+        f"vacuum: {report.vacuum or 'no'}; {report.free_pages_before:,} free pages before, {report.free_pages_after:,} after, "
+        f"{report.reclaimed_bytes / 1024:,.0f} KB reclaimed in {report.seconds:.1f}s"
+    )
+    return report.integrity_ok
+
+def handle_apply_retention(args):
+    """
+    Compact the intraday bars past their retention into daily bars. Policies, chunk size and vacuum
+    come from the retention settings; args.granularity with args.days runs a single policy instead.
+    """
+
+    from service.retention_service import apply_retention  # numpy: keep CLI startup light
+
+    keep_days = None
+    granularity = getattr(args, "granularity", None)
+    if granularity:
+        keep_days = {granularity: int(args.days)}
+
+    report = apply_retention(keep_days, getattr(args, "chunk_size", None), getattr(args, "vacuum", None))
+    if getattr(args, "json", False):
+        sys.stdout.write(json.dumps(asdict(report), indent=2, default=str) + "\n")
+    return report
+
+def handle_partition_ohlcvs(args):
+    """Move the OHLCV bars of the main database into their per-year partitions (database.ohlcv_partitions must be on)."""
+
+    from lib.data_version import bump_data_version
+    from lib.ohlcv_partitions import is_partitioned, move_bars_to_partitions, partition_dir
+
+    if not is_partitioned():
+        logger.error("OHLCV partitions are disabled, set database.ohlcv_partitions in settings.json first")
+        return False
+
+    moved = move_bars_to_partitions(int(getattr(args, "chunk_size", None) or 5000))
+    for year, count in sorted(moved.items()):
+        logger.info(f"{year}: {count:,} bars moved")
+    bump_data_version()
+    logger.info(f"{sum(moved.values()):,} bars moved to {partition_dir()}, run maintain with vacuum to shrink the main database")
+    return moved
@@ -0,0 +1,128 @@
+import threading
+from collections import defaultdict
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from lib.database import get_write_session, is_replica_session
+from lib.models import OHLCV, Instrument, Position, Trade, Transaction
+from lib.ohlcv_partitions import is_partitioned, max_bar_id
+
+
+# ==========================================================
+# Data version used as cache key by the read services
+# ==========================================================
+#
+# Write paths in lib.repo call bump_data_version_on_commit(), naming the accounts
+# they affected when they know them: the version moves once the transaction has
+# committed, never before, so a reader seeing the new version also sees the new rows
+# (and does not cache the old ones under it). A rollback drops the pending bump.
+# Writes made by another process (e.g. a CLI import while the API runs) are detected
+# through a cheap fingerprint of the max ids of the mutable tables and invalidate
+# every account.
+
+_lock = threading.Lock()
+_version = 0
+_all_accounts_generation = 0
+_account_generations = defaultdict(int)
+_fingerprint = None
+_listeners = []
+
+
+def _read_fingerprint(session):
+    # Partitioned, ohlcvs is a UNION view: its max(id) would scan every partition
+    ohlcv_max_id = max_bar_id(session) if is_partitioned() else select(func.max(OHLCV.id)).scalar_subquery()
+    stmt = select(
+        select(func.max(Trade.id)).scalar_subquery(),
+        select(func.max(Transaction.id)).scalar_subquery(),
+        select(func.max(Position.id)).scalar_subquery(),
+        select(func.max(Instrument.id)).scalar_subquery(),
+        ohlcv_max_id,
+    )
+    return tuple(session.execute(stmt).one())
+
+
+def add_listener(callback):
+    """Call callback(account_ids) after every bump (account_ids None means every account)."""
+    _listeners.append(callback)
+
+
+def bump_data_version(account_ids=None, notify=True):
+    """
+    Mark cached results as stale.
+    account_ids limits the invalidation to those accounts; None invalidates every account.
+    """
+    global _version, _all_accounts_generation, _fingerprint
+    with _lock:
+        _version += 1
+        if account_ids is None:
+            _all_accounts_generation += 1
+        else:
+            for account_id in account_ids:
+                _account_generations[account_id] += 1
+        _fingerprint = None  # re-read lazily, our own write must not count as external
+
+    if notify:
+        for callback in _listeners:
+            callback(account_ids)
+
+
+def bump_data_version_on_commit(session, account_ids=None):
+    """Bump the data version of the accounts (None: every account) when the session's transaction commits."""
+
+    pending = session.info.setdefault("data_version_pending", {"all": False, "accounts": set()})
+    if account_ids is None:
+        pending["all"] = True
+    else:
+        pending["accounts"].update(account_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_committed(session):
+    pending = session.info.pop("data_version_pending", None)
+    if pending is not None:
+        bump_data_version(None if pending["all"] else sorted(pending["accounts"]))
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back(session):
+    session.info.pop("data_version_pending", None)
+
+
+def _check_external_writes(session):
+    global _fingerprint
+
+    if is_replica_session(session):
+        # External writes only land on disk
+        with get_write_session() as disk_session:
+            fingerprint = _read_fingerprint(disk_session)
+    else:
+        fingerprint = _read_fingerprint(session)
+
+    with _lock:
+        changed = _fingerprint is not None and fingerprint != _fingerprint
+        _fingerprint = fingerprint
+
+    if changed:
+        bump_data_version()
+        with _lock:
+            _fingerprint = fingerprint
+
+
+def get_data_version(session) -> int:
+    """Return the current data version, bumping it if another process changed the database."""
+    _check_external_writes(session)
+    with _lock:
+        return _version
+
+
+def get_account_version(session, account_id=None) -> tuple:
+    """
+    Version of the data of one account: it only changes when that account is invalidated.
+    account_id None stands for all accounts and follows the global data version.
+    """
+    _check_external_writes(session)
+    with _lock:
+        if account_id is None:
+            return (_version,)
+        return (_all_accounts_generation, _account_generations[account_id])
@@ -1,8 +1,13 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker
 from lib.models import Base
-from lib.settings_manager import get_db_path
+from lib.ohlcv_partitions import create_partitions, is_partitioned, register_partitions
+from lib.settings_manager import get_db_path, get_serving_settings
 
 
 # ==========================================================
@@ -25,28 +30,282 @@ def init_engine():
         return
 
     _engine = create_engine(db_path)
+    if is_partitioned():
+        # New bars of this year and the next always have a partition to go to
+        year = datetime.now(timezone.utc).year
+        create_partitions([year, year + 1])
+        register_partitions(_engine)
     _SessionLocal = sessionmaker(bind=_engine)
     _current_path = db_path
+    migrate_db(_engine)
     print(f"✅ Database engine initialized at {db_path}")
 
 
+# Columns added after the first release: (table, column, DDL appended to ADD COLUMN)
+ADDED_COLUMNS = [
+    ("accounts", "lot_method", "VARCHAR NOT NULL DEFAULT 'fifo'"),
+]
+
+
+# Views mapped by models flagged info={"view": True}: (name, SELECT)
+VIEWS = {
+    # Compatibility layer: closes used to be written a second time into a prices table
+    "prices": "SELECT id, instrument_id, timestamp AS date, close AS price, granularity FROM ohlcvs",
+}
+
+
+def _merge_prices_into_ohlcvs(connection):
+    """Keep the prices without an OHLCV bar as close-only bars, then drop the old prices table."""
+
+    merged = connection.execute(text(
+        "INSERT INTO main.ohlcvs (instrument_id, timestamp, granularity, open, high, low, close, volume) "
+        "SELECT p.instrument_id, p.date, p.granularity, p.price, p.price, p.price, p.price, 0 FROM main.prices p "
+        "WHERE NOT EXISTS (SELECT 1 FROM ohlcvs o WHERE o.instrument_id = p.instrument_id "
+        "AND o.timestamp = p.date AND o.granularity = p.granularity)"
+    )).rowcount
+    connection.execute(text("DROP TABLE main.prices"))
+    print(f"🔧 Merged prices into ohlcvs ({merged} bars added), prices is now a view")
+
+
+def migrate_db(engine):
+    """
+    Bring databases created by an older schema up to date (create_all never alters tables):
+    add the missing columns, fold the prices table into ohlcvs and create the views.
+    """
+
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    views = set(inspector.get_view_names())
+    with engine.begin() as connection:
+        for table, column, ddl in ADDED_COLUMNS:
+            if table in tables and column not in {c["name"] for c in inspector.get_columns(table)}:
+                connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+                print(f"🔧 Added column {table}.{column}")
+
+        if "prices" in tables and "ohlcvs" in tables:
+            _merge_prices_into_ohlcvs(connection)
+
+        if "ohlcvs" in tables:
+            for name, select in VIEWS.items():
+                if name not in views:
+                    connection.execute(text(f"CREATE VIEW main.{name} AS {select}"))
+
+
 def get_session():
     """Return a SQLAlchemy session; reinit engine if needed."""
     if _engine is None:
         init_engine()
     return _SessionLocal()
 
+
+# ==========================================================
+# Per-route engine choice
+# ==========================================================
+#
+# Write routes (and every CLI command) use the on-disk database.
+# Read-only routes use the in-memory replica when serving_mode is
+# "memory_replica", and fall back to the on-disk database otherwise.
+
+SERVING_MODE_DISK = "disk"
+SERVING_MODE_MEMORY_REPLICA = "memory_replica"
+
+
+def get_write_session():
+    """Session on the on-disk database, for routes that write."""
+    return get_session()
+
+
+def get_read_session():
+    """Session for read-only routes: the in-memory replica when enabled."""
+    if _replica["active"] is None:
+        return get_session()
+    return _replica["sessionmakers"][_replica["active"]]()
+
+
+def is_replica_session(session) -> bool:
+    return session.info.get("replica", False)
+
+
+# ----------------------------------------------------------
+# In-memory read replica
+# ----------------------------------------------------------
+#
+# Two shared-cache in-memory databases are kept: the refresh copies the
+# on-disk database into the standby one with the SQLite backup API, then
+# swaps it in, so readers are never blocked by a copy in progress.
+
+_replica = {
+    "active": None,
+    "engines": [],
+    "sessionmakers": [],
+    "anchors": [],
+    "pending_accounts": set(),
+    "pending_all": False,
+    "timer": None,
+    "debounce_seconds": 1.0,
+    "refreshes": 0,
+    "last_refresh_seconds": 0.0,
+    "failures": 0,
+    "last_error": None,
+}
+_replica_lock = threading.Lock()
+
+
+def _set_query_only(dbapi_connection, connection_record):
+    dbapi_connection.execute("PRAGMA query_only = 1")
+
+
+def init_replica():
+    """Build the in-memory replica when serving_mode is memory_replica; returns True if enabled."""
+
+    settings = get_serving_settings()
+    if settings["serving_mode"] != SERVING_MODE_MEMORY_REPLICA:
+        return False
+
+    if _engine is None:
+        init_engine()
+
+    if _replica["engines"]:
+        return True
+
+    for i in range(2):
+        uri = f"file:pip_replica_{id(_replica)}_{i}?mode=memory&cache=shared"
+        # The anchor connection keeps the shared in-memory database alive and is the backup target
+        _replica["anchors"].append(sqlite3.connect(uri, uri=True, check_same_thread=False))
+        engine = create_engine(f"sqlite:///{uri}&uri=true", connect_args={"check_same_thread": False})
+        if is_partitioned():
+            register_partitions(engine)  # the backup copies main only: read the partitions from disk
+        event.listen(engine, "connect", _set_query_only)
+        _replica["engines"].append(engine)
+        _replica["sessionmakers"].append(sessionmaker(bind=engine, info={"replica": True}))
+
+    _replica["debounce_seconds"] = settings["replica_refresh_debounce_seconds"]
+    refresh_replica()
+
+    # Writes made through lib.repo schedule a debounced refresh
+    from lib import data_version
+    data_version.add_listener(schedule_replica_refresh)
+
+    print(f"✅ In-memory read replica initialized from {_current_path}")
+    return True
+
+
+def refresh_replica():
+    """Copy the on-disk database into the standby replica and make it the active one."""
+
+    with _replica_lock:
+        standby = 0 if _replica["active"] != 0 else 1
+        started = time.perf_counter()
+
+        raw = _engine.raw_connection()
+        try:
+            for attempt in range(10):
+                try:
+                    raw.driver_connection.backup(_replica["anchors"][standby])
+                    break
+                except sqlite3.OperationalError:
+                    # A slow reader still holds the standby copy
+                    if attempt == 9:
+                        raise
+                    time.sleep(0.05)
+        finally:
+            raw.close()
+
+        _replica["active"] = standby
+        _replica["refreshes"] += 1
+        _replica["last_refresh_seconds"] = time.perf_counter() - started
+        _replica["last_error"] = None
+
+        accounts = None if _replica["pending_all"] else set(_replica["pending_accounts"])
+        _replica["pending_accounts"].clear()
+        _replica["pending_all"] = False
+
+    # Cached results computed from the previous copy are stale now
+    from lib import data_version
+    data_version.bump_data_version(accounts, notify=False)
+
+
+def _refresh_replica_scheduled():
+    """
+    Timer target: an exception would die with the timer thread, leaving the stale copy
+    served until the next write. On failure the pending accounts are kept and the
+    refresh is tried again after the debounce delay.
+    """
+
+    try:
+        refresh_replica()
+    except Exception as ex:
+        with _replica_lock:
+            _replica["failures"] += 1
+            _replica["last_error"] = f"{type(ex).__name__}: {ex}"
+        print(f"❌ Replica refresh failed, retrying in {_replica['debounce_seconds']}s: {ex}")
+        _start_refresh_timer()
+
+
+def _start_refresh_timer():
+    with _replica_lock:
+        if _replica["timer"] is not None:
+            _replica["timer"].cancel()
+        if not _replica["engines"]:
+            return  # closed meanwhile
+        _replica["timer"] = threading.Timer(_replica["debounce_seconds"], _refresh_replica_scheduled)
+        _replica["timer"].daemon = True
+        _replica["timer"].start()
+
+
+def schedule_replica_refresh(account_ids=None):
+    """Debounce: refresh once no write happened for debounce_seconds."""
+
+    with _replica_lock:
+        if account_ids is None:
+            _replica["pending_all"] = True
+        else:
+            _replica["pending_accounts"].update(account_ids)
+    _start_refresh_timer()
+
+
+def close_replica():
+    with _replica_lock:
+        if _replica["timer"] is not None:
+            _replica["timer"].cancel()
+        for engine in _replica["engines"]:
+            engine.dispose()
+        for anchor in _replica["anchors"]:
+            anchor.close()
+        _replica.update(active=None, engines=[], sessionmakers=[], anchors=[], timer=None)
+
+
+def get_replica_status() -> dict:
+    return {
+        "enabled": _replica["active"] is not None,
+        "refreshes": _replica["refreshes"],
+        "last_refresh_seconds": _replica["last_refresh_seconds"],
+        "pending_refresh": _replica["pending_all"] or bool(_replica["pending_accounts"]),
+        "failures": _replica["failures"],
+        "last_error": _replica["last_error"],
+    }
+
     
 # ----------------------------------------------------------
 # Utility functions
 # ----------------------------------------------------------
 
 def init_db():
-    """Create all tables."""
+    """Create all tables, then the views."""
     init_engine()
-    Base.metadata.create_all(_engine)
+    Base.metadata.create_all(_engine, tables=[table for table in Base.metadata.sorted_tables if not table.info.get("view")])
+    migrate_db(_engine)
     print(f"✅ Database schema created for {_current_path}")
 
+def get_raw_connection():
+    """
+    DBAPI connection (from the pool) on the on-disk database, for statements that cannot run
+    in the transaction of a session (VACUUM, PRAGMAs). Close it to give it back to the pool.
+    """
+    if _engine is None:
+        init_engine()
+    return _engine.raw_connection()
+
 def write_to_db(amount: float) -> int:
     return int(round(amount * 1000000))
 
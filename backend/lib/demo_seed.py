@@ -3,7 +3,8 @@ from datetime import datetime, timedelta
 import random
 from faker import Faker
 from lib.database import write_to_db
-from lib.models import Account, Instrument, Trade, Transaction, OHLCV
+from lib.models import Account, Instrument, Trade, Transaction
+from lib.repo.ohlcvs_repository import bulk_load_ohlcv, delete_all_ohlcvs
 
 fake = Faker()
 Faker.seed(42)
@@ -17,7 +18,7 @@ def seed_demo_data(session, reset=False):
     if reset:
         session.query(Transaction).delete()
         session.query(Trade).delete()
-        session.query(OHLCV).delete()
+        delete_all_ohlcvs(session)
         session.query(Instrument).delete()
         session.query(Account).delete()
         session.commit()
@@ -100,19 +101,8 @@ def seed_demo_data(session, reset=False):
             high_p = max(open_p, close_p) + random.randint(0, 3)
             low_p = min(open_p, close_p) - random.randint(0, 3)
             volume = random.randint(1000, 10000)
-            ohlcvs.append(
-                OHLCV(
-                    instrument_id=instr.id,
-                    timestamp=ts + timedelta(days=i),
-                    granularity="1d",
-                    open=write_to_db(open_p),
-                    high=write_to_db(high_p),
-                    low=write_to_db(low_p),
-                    close=write_to_db(close_p),
-                    volume=volume,
-                )
-            )
-    session.add_all(ohlcvs)
+            ohlcvs.append((instr.id, ts + timedelta(days=i), "1d", open_p, high_p, low_p, close_p, volume))
+    bulk_load_ohlcv(session, ohlcvs)  # routed to the year partitions when partitioned
     session.commit()
 
     return len(accounts), len(instruments), len(trades)
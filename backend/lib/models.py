@@ -43,15 +43,16 @@ class Transaction(Base):
 
 
 class Price(Base):
+    """Read-only view over ohlcvs (date = timestamp, price = close), kept for compatibility; see lib.database.VIEWS."""
     __tablename__ = "prices"
-    id = Column(Integer, primary_key=True, autoincrement=True)
+    id = Column(Integer, primary_key=True)
     instrument_id = Column(Integer, ForeignKey("instruments.id"), nullable=False)
     date = Column(UTCDateTime, nullable=False)
     price = Column(Integer, nullable=False)
     granularity = Column(String, nullable=False)
 
-    instrument = relationship("Instrument", back_populates="prices")
-    __table_args__ = (UniqueConstraint('instrument_id', 'date', 'granularity', name='_instrument_date_uc'),)
+    instrument = relationship("Instrument", viewonly=True)
+    __table_args__ = {"info": {"view": True}}
 
 
 class OHLCV(Base):
@@ -81,7 +82,6 @@ class Instrument(Base):
     description = Column(Text)
     currency = Column(CurrencyType, nullable=False)
 
-    prices = relationship("Price", back_populates="instrument", cascade="all")
     ohlcvs = relationship("OHLCV", back_populates="instrument", cascade="all")
     positions = relationship("Position", back_populates="instrument", cascade="all")
 
@@ -104,6 +104,7 @@ class Account(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String, unique=True, nullable=False)
     description = Column(Text)
+    lot_method = Column(String, nullable=False, default="fifo", server_default="fifo")  # fifo, lifo, hifo or average
 
     transactions = relationship("Transaction", back_populates="account", cascade="all")
     positions = relationship("Position", back_populates="account", cascade="all")
\ No newline at end of file
@@ -0,0 +1,295 @@
+import os
+import re
+import sqlite3
+import threading
+from datetime import timezone
+from pathlib import Path
+
+from sqlalchemy import Column, MetaData, Table, delete, event, func, insert, select, union_all
+
+from lib.models import OHLCV
+from lib.settings_manager import get_db_path, get_partition_settings
+
+
+# ==========================================================
+# Per-year OHLCV partitions
+# ==========================================================
+#
+# Optional (database.ohlcv_partitions): OHLCV bars live in one SQLite file per year,
+# <partition_dir>/ohlcvs_<year>.db, next to the main database. Every pooled connection
+# ATTACHes the partition files as ohlcv_<year> and gets a TEMP view named ohlcvs over
+# main.ohlcvs UNION ALL the partitions; temp objects shadow main ones, so every existing
+# query (ORM included) reads through the view unchanged. main.ohlcvs keeps the bars of
+# years without a partition, and the bars of databases partitioned after the fact until
+# move_bars_to_partitions() moves them.
+#
+# SQLite cannot write through a view (and triggers cannot name attached tables), so the
+# repository writes go through insert_bars() / delete_bars(), which route rows by the UTC
+# year of their timestamp. Ids stay unique across files: a partition numbers its bars
+# from year * PARTITION_ID_STRIDE, and bars moved out of main.ohlcvs keep their (smaller)
+# ids, so the bars still written to main.ohlcvs get explicit ids after every id below
+# MAIN_ID_LIMIT (main.ohlcvs has no AUTOINCREMENT and would reuse the moved ones).
+
+PARTITION_FILE = re.compile(r"^ohlcvs_(\d{4})\.db$")
+PARTITION_ID_STRIDE = 10 ** 10
+MAIN_ID_LIMIT = 1000 * PARTITION_ID_STRIDE    # partition ids start above, from year 1000
+COLUMNS = ("id", "instrument_id", "timestamp", "granularity", "open", "high", "low", "close", "volume")
+
+PARTITION_DDL = """
+CREATE TABLE IF NOT EXISTS ohlcvs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    instrument_id INTEGER NOT NULL,
+    timestamp DATETIME NOT NULL,
+    granularity VARCHAR NOT NULL,
+    open INTEGER,
+    high INTEGER,
+    low INTEGER,
+    close INTEGER,
+    volume INTEGER,
+    CONSTRAINT _instrument_timestamp_uc UNIQUE (instrument_id, timestamp, granularity)
+)
+"""
+
+_metadata = MetaData()
+_metadata_lock = threading.Lock()
+
+
+def is_partitioned() -> bool:
+    return bool(get_partition_settings()["ohlcv_partitions"])
+
+
+def partition_dir() -> Path:
+    database = Path(get_db_path().split("///", 1)[-1])
+    return database.parent / get_partition_settings()["ohlcv_partition_dir"]
+
+
+def partition_path(year: int) -> Path:
+    return partition_dir() / f"ohlcvs_{year}.db"
+
+
+def schema_name(year: int) -> str:
+    return f"ohlcv_{year}"
+
+
+def partition_years() -> list[int]:
+    """Years that have a partition file."""
+
+    directory = partition_dir()
+    if not directory.is_dir():
+        return []
+    return sorted(int(match.group(1)) for match in map(PARTITION_FILE.match, os.listdir(directory)) if match)
+
+
+def create_partitions(years) -> list[int]:
+    """Create the missing partition files of the years; returns the years created. Connections attach them on their next checkout."""
+
+    created = []
+    for year in sorted(set(years)):
+        path = partition_path(year)
+        if path.exists():
+            continue
+        path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(path)
+        try:
+            connection.execute(PARTITION_DDL)
+            connection.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('ohlcvs', ?)", (year * PARTITION_ID_STRIDE,))
+            connection.commit()
+        finally:
+            connection.close()
+        created.append(year)
+    return created
+
+
+# -----------------------
+# -- Connections
+# -----------------------
+
+def _has_main_table(dbapi_connection) -> bool:
+    return dbapi_connection.execute(
+        "SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'ohlcvs'"
+    ).fetchone() is not None
+
+
+def attach_partitions(dbapi_connection, connection_record=None):
+    """
+    (Re)attach the partition files and (re)create the TEMP union view (and the views built on
+    ohlcvs, see lib.database.VIEWS). Must run outside a transaction: at connect and checkout.
+    """
+
+    from lib.database import VIEWS
+
+    info = connection_record.info if connection_record is not None else {}
+    years = partition_years()
+    attached = {row[1] for row in dbapi_connection.execute("PRAGMA database_list")}
+
+    for year in years:
+        if schema_name(year) not in attached:
+            dbapi_connection.execute("ATTACH DATABASE ? AS " + schema_name(year), (str(partition_path(year)),))
+
+    if not _has_main_table(dbapi_connection):
+        return  # fresh database: create_all has not run yet
+
+    columns = ", ".join(COLUMNS)
+    arms = [f"SELECT {columns} FROM main.ohlcvs"] + [f"SELECT {columns} FROM {schema_name(year)}.ohlcvs" for year in years]
+    dbapi_connection.execute("DROP VIEW IF EXISTS temp.ohlcvs")
+    dbapi_connection.execute(f"CREATE TEMP VIEW ohlcvs AS {' UNION ALL '.join(arms)}")
+    for name, select_sql in VIEWS.items():
+        dbapi_connection.execute(f"DROP VIEW IF EXISTS temp.{name}")
+        dbapi_connection.execute(f"CREATE TEMP VIEW {name} AS {select_sql}")
+
+    info["ohlcv_partitions"] = tuple(years)
+
+
+def _check_partitions(dbapi_connection, connection_record, connection_proxy):
+    """Checkout hook: pick up partitions created since the connection was set up."""
+
+    if connection_record.info.get("ohlcv_partitions") != tuple(partition_years()):
+        attach_partitions(dbapi_connection, connection_record)
+
+
+def register_partitions(engine):
+    """Attach the partitions on every connection of the engine."""
+
+    event.listen(engine, "connect", attach_partitions)
+    event.listen(engine, "checkout", _check_partitions)
+
+
+def _attached_years(session) -> tuple:
+    return session.connection().connection.info.get("ohlcv_partitions", ())
+
+
+# -----------------------
+# -- Routing
+# -----------------------
+
+def _table(schema: str) -> Table:
+    with _metadata_lock:
+        table = _metadata.tables.get(f"{schema}.ohlcvs")
+        if table is None:
+            columns = [Column(column.name, column.type, primary_key=column.primary_key) for column in OHLCV.__table__.columns]
+            table = Table("ohlcvs", _metadata, *columns, schema=schema)
+        return table
+
+
+def main_table() -> Table:
+    return _table("main")
+
+
+def partition_table(year: int) -> Table:
+    return _table(schema_name(year))
+
+
+def _year(timestamp) -> int:
+    return timestamp.astimezone(timezone.utc).year
+
+
+def _next_main_id(session, years) -> int:
+    """Next id of the main id range, across main.ohlcvs and the bars moved to partitions."""
+
+    last = 0
+    for table in [main_table()] + [partition_table(year) for year in years]:
+        last = max(last, session.execute(select(func.max(table.c.id)).where(table.c.id < MAIN_ID_LIMIT)).scalar() or 0)
+    return last + 1
+
+
+def insert_bars(session, values: list[dict]) -> int:
+    """Insert OHLCV column dicts, each into the partition of its year (main.ohlcvs when there is none)."""
+
+    years = _attached_years(session)
+    by_table: dict[Table, list[dict]] = {}
+    for value in values:
+        year = _year(value["timestamp"])
+        table = partition_table(year) if year in years else main_table()
+        by_table.setdefault(table, []).append(value)
+
+    if main_table() in by_table:
+        next_id = _next_main_id(session, years)
+        by_table[main_table()] = [{**value, "id": next_id + i} for i, value in enumerate(by_table[main_table()])]
+
+    for table, rows in by_table.items():
+        session.execute(insert(table), rows)  # executemany
+    return len(values)
+
+
+def delete_bars(session, bar_ids: list[int]) -> int:
+    """Delete bars by id wherever they live; returns the number deleted."""
+
+    deleted = 0
+    for table in [main_table()] + [partition_table(year) for year in _attached_years(session)]:
+        deleted += session.execute(delete(table).where(table.c.id.in_(bar_ids))).rowcount
+    return deleted
+
+
+def max_bar_id(session):
+    """
+    Scalar expression of max(id) over main.ohlcvs and the partitions. Each table answers with a
+    primary key seek; max(id) of the union view would scan every partition.
+    """
+
+    maxima = [select(func.max(table.c.id)).scalar_subquery()
+              for table in [main_table()] + [partition_table(year) for year in _attached_years(session)]]
+    if len(maxima) == 1:
+        return maxima[0]
+    return func.max(*(func.coalesce(maximum, 0) for maximum in maxima))  # the scalar max() is NULL as soon as one argument is
+
+
+def range_source(session, start=None, end=None):
+    """
+    Selectable with the OHLCV columns over main.ohlcvs and only the partitions whose year
+    overlaps [start, end]; None when not partitioned (query the ohlcvs view as usual).
+    """
+
+    if not is_partitioned():
+        return None
+    first = _year(start) if start is not None else None
+    last = _year(end) if end is not None else None
+    tables = [main_table()] + [
+        partition_table(year) for year in _attached_years(session)
+        if (first is None or year >= first) and (last is None or year <= last)
+    ]
+    return union_all(*(select(*(table.c[name] for name in COLUMNS)) for table in tables)).subquery("ohlcvs")
+
+
+def move_bars_to_partitions(chunk_size: int = 5000) -> dict[int, int]:
+    """
+    Move the bars of main.ohlcvs into the partitions of their years (created as needed),
+    one transaction per chunk; returns {year: bars moved}.
+    """
+
+    from lib.database import get_raw_connection
+
+    raw = get_raw_connection()
+    try:
+        years = [int(row[0]) for row in raw.driver_connection.execute("SELECT DISTINCT substr(timestamp, 1, 4) FROM main.ohlcvs")]
+    finally:
+        raw.close()
+    create_partitions(years)
+
+    moved: dict[int, int] = {}
+    columns = ", ".join(COLUMNS)
+    raw = get_raw_connection()  # checked out again: attaches the new partitions
+    try:
+        connection = raw.driver_connection
+        after_id = 0
+        while True:
+            rows = connection.execute(
+                "SELECT id, substr(timestamp, 1, 4) FROM main.ohlcvs WHERE id > ? ORDER BY id LIMIT ?", (after_id, chunk_size)
+            ).fetchall()
+            if not rows:
+                break
+            after_id = rows[-1][0]
+
+            by_year: dict[int, list[int]] = {}
+            for bar_id, year in rows:
+                by_year.setdefault(int(year), []).append(bar_id)
+            for year, ids in by_year.items():
+                marks = ", ".join("?" * len(ids))
+                # A bar already in its partition is a duplicate: the partition copy wins
+                connection.execute(f"INSERT OR IGNORE INTO {schema_name(year)}.ohlcvs ({columns}) "
+                                   f"SELECT {columns} FROM main.ohlcvs WHERE id IN ({marks})", ids)
+                connection.execute(f"DELETE FROM main.ohlcvs WHERE id IN ({marks})", ids)
+                moved[year] = moved.get(year, 0) + len(ids)
+            connection.commit()
+    finally:
+        raw.close()
+    return moved
@@ -1,5 +1,6 @@
 
 from lib.models import Account
+from lib.data_version import bump_data_version_on_commit
 
 
 def add_account(session, name, description):
@@ -10,6 +11,8 @@ def add_account(session, name, description):
     )
     try:
         session.add(account)
+        session.flush()
+        bump_data_version_on_commit(session, [account.id])
         session.commit()
         print(f"🗑️ Added account ID {account.id}")
     except Exception as e:
@@ -24,12 +27,24 @@ def get_all_accounts(_session):
 def get_account_by_name(session, account_name):
     return session.query(Account).filter_by(name=account_name).first()
 
+def get_lot_methods(session) -> dict[int, str]:
+    """Return {account_id: lot_method}."""
+    return dict(session.query(Account.id, Account.lot_method).all())
+
+def set_lot_method(session, account, lot_method):
+    account.lot_method = lot_method
+    bump_data_version_on_commit(session, [account.id])
+    session.commit()
+    print(f"🧮 Account {account.name} now matches lots with {lot_method}")
+    return account
+
 def delete_account(session, account_id):
     account = session.get(Account, account_id)
     if account:
         try:
             # Attempt to delete the account
             session.delete(account)
+            bump_data_version_on_commit(session, [account_id])
             session.commit()
             print(f"🗑️ Deleted account ID {account_id}")
         except Exception as e:
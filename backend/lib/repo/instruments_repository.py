@@ -1,14 +1,21 @@
 
+from sqlalchemy import func
+
 from lib.models import Instrument
+from lib.data_version import bump_data_version_on_commit
+from lib.repo.ohlcvs_repository import delete_ohlcvs_for_instrument
 
 from logging_config import setup_logger
 log = setup_logger(__name__)
 
+FX_CATEGORY = "fx"
+
 def add_instrument(session, isin, name, ticker=None, category=None, currency="EUR"):
 
     instrument = Instrument(isin=isin, name=name, ticker=ticker, category=category, currency=currency)
     try:
         session.add(instrument)
+        bump_data_version_on_commit(session, [])  # no account holds a new instrument yet
         session.commit()
         log.info(f"🗑️ Added instrument ID {instrument.id}")
     except Exception as e:
@@ -17,21 +24,87 @@ def add_instrument(session, isin, name, ticker=None, category=None, currency="EU
         return False    
     return True
 
+def add_fx_instrument(session, base_currency, quote_currency):
+    """Create the Instrument holding the OHLCV series of an FX pair (Yahoo ticker convention, e.g. EURUSD=X)."""
+
+    instrument = Instrument(
+        ticker=f"{base_currency}{quote_currency}=X",
+        name=f"{base_currency}/{quote_currency}",
+        category=FX_CATEGORY,
+        currency=quote_currency,
+    )
+    try:
+        session.add(instrument)
+        bump_data_version_on_commit(session, [])  # no account holds a new instrument yet
+        session.commit()
+        log.info(f"💱 Added FX instrument {instrument.ticker} (ID {instrument.id})")
+    except Exception as e:
+        session.rollback()
+        log.error(f"⚠️ Cannot add FX instrument {base_currency}/{quote_currency}: {e}")
+        return None
+    return instrument
+
+def get_fx_instruments(session):
+    return session.query(Instrument).filter_by(category=FX_CATEGORY).all()
+
+def get_or_create_instruments_by_ticker(session, symbols: list[dict], create_instrument: bool = True) -> dict[str, int]:
+    """
+    Resolve {ticker: instrument_id} for the given symbol metadata with one query,
+    creating all missing instruments in bulk when create_instrument is set.
+    """
+
+    tickers = {symbol["ticker"] for symbol in symbols}
+    existing = session.query(Instrument.ticker, Instrument.id).filter(Instrument.ticker.in_(tickers)).all()
+    ids = {ticker: instrument_id for ticker, instrument_id in existing}
+
+    if create_instrument:
+        missing = {}
+        for symbol in symbols:
+            if symbol["ticker"] not in ids and symbol["ticker"] not in missing:
+                missing[symbol["ticker"]] = Instrument(
+                    ticker=symbol["ticker"],
+                    name=symbol["name"] or symbol["ticker"],
+                    name_long=symbol.get("long_name"),
+                    currency=symbol["currency"],
+                )
+        if missing:
+            session.add_all(missing.values())
+            session.flush()
+            ids.update({ticker: instrument.id for ticker, instrument in missing.items()})
+            log.info(f"➕ Created {len(missing)} instruments")
+
+    return ids
+
 def get_instrument_by_isin(session, isin):
     return session.query(Instrument).filter_by(isin=isin).first()
 
 def get_instrument_by_ticker(session, ticker):
     return session.query(Instrument).filter_by(ticker=ticker,).first()
 
+def get_instrument_categories(session, inst_ids: list[int]) -> dict[int, str]:
+    """Return {instrument_id: category} (None when unset)."""
+    return dict(session.query(Instrument.id, Instrument.category).filter(Instrument.id.in_(inst_ids)).all())
+
 def get_all_instruments(session):
     return session.query(Instrument).all()
 
+def get_instruments_fingerprint(session) -> tuple[int, int]:
+    """(count, max id) of the instruments: only grows in step while instruments are just being added."""
+    count, max_id = session.query(func.count(Instrument.id), func.max(Instrument.id)).one()
+    return count, max_id or 0
+
+def get_instruments_after_id(session, after_id: int = 0):
+    return session.query(Instrument).filter(Instrument.id > after_id).order_by(Instrument.id).all()
+
 def delete_instrument(session, instrument_id):
     instrument = session.get(Instrument, instrument_id)
     if instrument:
         try:
             # Attempt to delete the instrument
+            delete_ohlcvs_for_instrument(session, instrument_id)
+            session.expire(instrument, ["ohlcvs"])
             session.delete(instrument)
+            bump_data_version_on_commit(session)
             session.commit()
             log.info(f"🗑️ Deleted instrument ID {instrument_id}")
         except Exception as e:
@@ -1,11 +1,16 @@
 
 # No pandas dependencies
-import pytz
-from sqlalchemy import desc, select, func
+from typing import TYPE_CHECKING
+from sqlalchemy import delete, desc, insert, select, func
 from sqlalchemy.orm import aliased
 from lib.database import get_session, write_to_db, read_from_db
 from lib.models import OHLCV, Instrument
-from service.myYahooFinanceService import YahooSymbol
+from lib.data_version import bump_data_version_on_commit
+from lib.ohlcv_partitions import delete_bars, insert_bars, is_partitioned, range_source
+from lib.repo.positions_repository import get_account_ids_for_instrument, get_account_ids_for_instrument_list
+
+if TYPE_CHECKING:
+    from service.myYahooFinanceService import YahooSymbol
 
 from logging_config import setup_logger
 log = setup_logger(__name__)
@@ -13,9 +18,22 @@ log = setup_logger(__name__)
 DEFAULT_TIMEZONE = "Europe/Rome"
 
 
+def _insert_bars(session, values: list[dict]):
+    """Insert OHLCV column dicts, routed to their year partitions when partitioned (see lib.ohlcv_partitions)."""
+    if is_partitioned():
+        insert_bars(session, values)
+    else:
+        session.execute(insert(OHLCV), values)  # executemany
+
+def _delete_bars(session, bar_ids: list[int]) -> int:
+    if is_partitioned():
+        return delete_bars(session, bar_ids)
+    return session.execute(delete(OHLCV).where(OHLCV.id.in_(bar_ids))).rowcount
+
 def add_price(session, instrument, timestamp, granularity, open, close, high=0.0, low=0.0, volume=0.0):
+    """Insert one bar; returns its column values (no ORM object: the bar may live in a partition)."""
 
-    ohlcv = OHLCV(
+    ohlcv = dict(
         instrument_id=instrument.id, 
         timestamp=timestamp, 
         granularity=granularity,
@@ -25,8 +43,8 @@ def add_price(session, instrument, timestamp, granularity, open, close, high=0.0
         close=write_to_db(close),
         volume=write_to_db(volume)
     )
-    session.add(ohlcv)
-    session.flush() # ensures IDs and defaults are populated
+    _insert_bars(session, [ohlcv])
+    bump_data_version_on_commit(session, get_account_ids_for_instrument(session, instrument.id))
     print(f"💰 Added OHLCV for {instrument.name}")
     return ohlcv
 
@@ -41,6 +59,12 @@ def get_latest_price(session, inst_id):
     )
     return session.scalar(stmt)
 
+def get_latest_timestamps(session) -> dict:
+    """Return {instrument_id: latest OHLCV timestamp}."""
+
+    stmt = select(OHLCV.instrument_id, func.max(OHLCV.timestamp)).group_by(OHLCV.instrument_id)
+    return dict(session.execute(stmt).all())
+
 def get_latest_prices(session):
 
     ohlcv_alias = aliased(OHLCV)
@@ -78,7 +102,199 @@ def get_latest_closing_price(session, instrument_id):
     
     return read_from_db(last_price_row.close) if last_price_row else None
 
-def load_ohlcv_from_symbol(symbol: YahooSymbol, granularity: str, instrument: Instrument):
+def get_closes_for_instrument_list(session, inst_ids: list[int], granularity: str = None):
+    """Return (instrument_id, timestamp, close) rows ordered by instrument and timestamp."""
+
+    stmt = (
+        select(OHLCV.instrument_id, OHLCV.timestamp, OHLCV.close)
+        .where(OHLCV.instrument_id.in_(inst_ids))
+        .order_by(OHLCV.instrument_id, OHLCV.timestamp)
+    )
+    if granularity:
+        stmt = stmt.where(OHLCV.granularity == granularity)
+    return session.execute(stmt).all()
+
+def get_closes_as_of(session, inst_ids: list[int], as_of) -> dict:
+    """
+    Return {instrument_id: (timestamp, close)} of the last bar at or before as_of.
+    The max timestamp per instrument is a seek on the (instrument_id, timestamp, ...) unique index.
+    """
+
+    last_timestamp = (
+        select(func.max(OHLCV.timestamp))
+        .where(OHLCV.instrument_id == Instrument.id, OHLCV.timestamp <= as_of)
+        .correlate(Instrument)
+        .scalar_subquery()
+    )
+    latest = (
+        select(Instrument.id.label("instrument_id"), last_timestamp.label("timestamp"))
+        .where(Instrument.id.in_(inst_ids))
+        .subquery()
+    )
+    stmt = (
+        select(OHLCV.instrument_id, OHLCV.timestamp, OHLCV.close)
+        .join(latest, (OHLCV.instrument_id == latest.c.instrument_id) & (OHLCV.timestamp == latest.c.timestamp))
+    )
+    return {instrument_id: (timestamp, close) for instrument_id, timestamp, close in session.execute(stmt).all()}
+
+def get_ohlcv_fingerprint(session, inst_ids: list[int]):
+    """Cheap (count, max id) pair that changes whenever OHLCVs are added or removed for the instruments."""
+
+    stmt = (
+        select(func.count(OHLCV.id), func.max(OHLCV.id))
+        .where(OHLCV.instrument_id.in_(inst_ids))
+    )
+    return tuple(session.execute(stmt).one())
+
+def get_granularity_fingerprint(session, granularity: str):
+    """(count, max id) of the OHLCVs of one granularity: it changes whenever bars are added or removed."""
+
+    stmt = select(func.count(OHLCV.id), func.max(OHLCV.id)).where(OHLCV.granularity == granularity)
+    count, max_id = session.execute(stmt).one()
+    return count, max_id or 0
+
+def get_closes_after_id(session, granularity: str, after_id: int = 0):
+    """Return (instrument_id, timestamp, close) rows of one granularity with id > after_id."""
+
+    stmt = (
+        select(OHLCV.instrument_id, OHLCV.timestamp, OHLCV.close)
+        .where(OHLCV.granularity == granularity, OHLCV.id > after_id)
+    )
+    return session.execute(stmt).all()
+
+def delete_ohlcvs_for_instrument(session, instrument_id: int) -> int:
+    """Delete every bar of an instrument (ahead of deleting the instrument: ORM cascades cannot write through the partition view)."""
+
+    bar_ids = list(session.execute(select(OHLCV.id).where(OHLCV.instrument_id == instrument_id)).scalars())
+    return _delete_bars(session, bar_ids) if bar_ids else 0
+
+def delete_all_ohlcvs(session) -> int:
+    """Delete every bar, wherever it lives."""
+
+    bar_ids = list(session.execute(select(OHLCV.id)).scalars())
+    return _delete_bars(session, bar_ids) if bar_ids else 0
+
+def get_series_counts(session, inst_ids: list[int] = None) -> dict:
+    """Return {(instrument_id, granularity): number of bars}."""
+
+    stmt = select(OHLCV.instrument_id, OHLCV.granularity, func.count(OHLCV.id)).group_by(OHLCV.instrument_id, OHLCV.granularity)
+    if inst_ids is not None:
+        stmt = stmt.where(OHLCV.instrument_id.in_(inst_ids))
+    return {(instrument_id, granularity): count for instrument_id, granularity, count in session.execute(stmt).all()}
+
+def get_series_fingerprints(session, weights: dict[str, int], modulus: int, inst_ids: list[int] = None) -> dict:
+    """
+    Return {(instrument_id, granularity): (number of bars, last timestamp, checksum)}. The checksum
+    sums, over the bars, the weighted sum of the weights' columns (values as stored, NULL as 0)
+    modulo modulus, so changed values show even when the number of bars did not change.
+    """
+
+    row_sum = sum(func.coalesce(getattr(OHLCV, name), 0) * weight for name, weight in weights.items())
+    stmt = (
+        select(OHLCV.instrument_id, OHLCV.granularity, func.count(OHLCV.id), func.max(OHLCV.timestamp), func.sum(row_sum % modulus))
+        .group_by(OHLCV.instrument_id, OHLCV.granularity)
+    )
+    if inst_ids is not None:
+        stmt = stmt.where(OHLCV.instrument_id.in_(inst_ids))
+    return {(instrument_id, granularity): (count, last, checksum or 0) for instrument_id, granularity, count, last, checksum in session.execute(stmt).all()}
+
+def get_ohlcv_rows(session, instrument_id: int, granularity: str, after=None, start=None, end=None):
+    """
+    Return the (timestamp, open, high, low, close, volume) rows of one series ordered by timestamp,
+    values as stored. after is exclusive, start and end inclusive.
+    """
+
+    # Partitioned: only the partitions overlapping the range are read
+    lower = max((bound for bound in (after, start) if bound is not None), default=None)
+    source = range_source(session, lower, end)
+    bars = source.c if source is not None else OHLCV
+
+    stmt = (
+        select(bars.timestamp, bars.open, bars.high, bars.low, bars.close, bars.volume)
+        .where(bars.instrument_id == instrument_id, bars.granularity == granularity)
+        .order_by(bars.timestamp)
+    )
+    if after is not None:
+        stmt = stmt.where(bars.timestamp > after)
+    if start is not None:
+        stmt = stmt.where(bars.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(bars.timestamp <= end)
+    return session.execute(stmt).all()
+
+def get_instrument_ids_with_bars_before(session, granularity: str, before) -> list[int]:
+    """Instruments having bars of the granularity older than before."""
+
+    stmt = select(OHLCV.instrument_id).where(OHLCV.granularity == granularity, OHLCV.timestamp < before).distinct()
+    return sorted(session.execute(stmt).scalars().all())
+
+def get_bars_before(session, instrument_id: int, granularity: str, before, limit: int = None):
+    """
+    Return the (id, timestamp, open, high, low, close, volume) rows of one series older than before,
+    oldest first, values as stored.
+    """
+
+    stmt = (
+        select(OHLCV.id, OHLCV.timestamp, OHLCV.open, OHLCV.high, OHLCV.low, OHLCV.close, OHLCV.volume)
+        .where(OHLCV.instrument_id == instrument_id, OHLCV.granularity == granularity, OHLCV.timestamp < before)
+        .order_by(OHLCV.timestamp)
+        .limit(limit)
+    )
+    return session.execute(stmt).all()
+
+def replace_bars(session, instrument_id: int, bar_ids: list[int], values: list[dict]) -> int:
+    """
+    Delete the bars of an instrument by id and insert the given bars (OHLCV column dicts,
+    values as stored) in their place. Runs inside the caller's transaction; returns the number deleted.
+    """
+
+    if values:
+        _insert_bars(session, values)
+    deleted = _delete_bars(session, bar_ids) if bar_ids else 0
+    if values or deleted:
+        bump_data_version_on_commit(session, get_account_ids_for_instrument(session, instrument_id))
+    return deleted
+
+def bulk_load_ohlcv(session, rows: list[tuple]) -> int:
+    """
+    Insert (instrument_id, timestamp, granularity, open, high, low, close, volume) rows,
+    many instruments at once, skipping the ones already stored. Prices are floats.
+    Runs inside the caller's transaction; returns the number of rows inserted.
+    """
+
+    if not rows:
+        return 0
+
+    inst_ids = sorted({row[0] for row in rows})
+    existing = set(
+        session.execute(
+            select(OHLCV.instrument_id, OHLCV.timestamp, OHLCV.granularity).where(OHLCV.instrument_id.in_(inst_ids))
+        ).all()
+    )
+
+    values = []
+    for instrument_id, timestamp, granularity, open, high, low, close, volume in rows:
+        key = (instrument_id, timestamp, granularity)
+        if key in existing:
+            continue
+        existing.add(key)
+        values.append({
+            "instrument_id": instrument_id,
+            "timestamp": timestamp,
+            "granularity": granularity,
+            "open": write_to_db(open) if open is not None else 0,
+            "high": write_to_db(high) if high is not None else 0,
+            "low": write_to_db(low) if low is not None else 0,
+            "close": write_to_db(close) if close is not None else 0,
+            "volume": int(volume or 0),
+        })
+
+    if values:
+        _insert_bars(session, values)
+        bump_data_version_on_commit(session, get_account_ids_for_instrument_list(session, inst_ids))
+    return len(values)
+
+def load_ohlcv_from_symbol(symbol: "YahooSymbol", granularity: str, instrument: Instrument):
 
     ochlv_data = symbol.ochlv
     if not ochlv_data:
@@ -97,13 +313,14 @@ def load_ohlcv_from_symbol(symbol: YahooSymbol, granularity: str, instrument: In
             ).all()
         )
 
+        values = []
         for row in ochlv_data:
             dt = row["timestamp"]  # aware datetime from YahooSymbol
             if dt in existing_timestamps:
                 skipped += 1
                 continue
 
-            entry = OHLCV(
+            values.append(dict(
                 instrument_id=instrument.id,
                 timestamp=dt,
                 granularity=granularity,
@@ -112,11 +329,12 @@ def load_ohlcv_from_symbol(symbol: YahooSymbol, granularity: str, instrument: In
                 low=write_to_db(int(row["low"] or 0)) if row["low"] is not None else 0,
                 close=write_to_db(int(row["close"] or 0)) if row["close"] is not None else 0,
                 volume=int(row["volume"] or 0) if row["volume"] is not None else 0,
-            )
-
-            session.add(entry)
+            ))
             inserted += 1
 
+        if values:
+            _insert_bars(session, values)
+        bump_data_version_on_commit(session, get_account_ids_for_instrument(session, instrument.id))
         session.commit()
 
     print(f"Inserted {inserted} new OHLCV rows, skipped {skipped} existing.")
@@ -126,7 +344,7 @@ def load_ohlcv_from_yfinance_dataframe(dataframe, granularity: str, instrument:
 
     if dataframe.empty:
         print("No OHLCV data to insert.")
-        return
+        return 0
     
     inserted = 0
     skipped = 0
@@ -140,13 +358,14 @@ def load_ohlcv_from_yfinance_dataframe(dataframe, granularity: str, instrument:
             ).all()
         )
 
+        values = []
         for ts, row in dataframe.iterrows():
             
             if ts.to_pydatetime() in existing_timestamps:
                 skipped += 1
                 continue
 
-            entry = OHLCV(
+            values.append(dict(
                 instrument_id=instrument.id,
                 timestamp=ts,
                 granularity=granularity,
@@ -155,11 +374,13 @@ def load_ohlcv_from_yfinance_dataframe(dataframe, granularity: str, instrument:
                 low=write_to_db(row["Low"]),
                 close=write_to_db(row["Close"]),
                 volume=int(row["Volume"] or 0),
-            )
-
-            session.add(entry)
+            ))
             inserted += 1
 
+        if values:
+            _insert_bars(session, values)
+        bump_data_version_on_commit(session, get_account_ids_for_instrument(session, instrument.id))
         session.commit()
 
     print(f"Inserted {inserted} new OHLCV rows, skipped {skipped} existing.")
+    return inserted
@@ -1,6 +1,7 @@
 
 from sqlalchemy import select
 from lib.models import Position
+from lib.data_version import bump_data_version_on_commit
 from logging_config import setup_logger
 log = setup_logger(__name__)
 
@@ -12,12 +13,26 @@ def get_all_positions(session, account=None):
         stmt = stmt.filter_by(account_id=account.id)
     return session.scalars(stmt).all()
 
+def get_account_ids_for_instrument(session, instrument_id) -> list[int]:
+    """Accounts holding (or having held) a position on the instrument."""
+
+    stmt = select(Position.account_id).where(Position.instrument_id == instrument_id).distinct()
+    return list(session.scalars(stmt).all())
+
+def get_account_ids_for_instrument_list(session, inst_ids: list[int]) -> list[int]:
+    """Accounts holding (or having held) a position on any of the instruments."""
+
+    stmt = select(Position.account_id).where(Position.instrument_id.in_(inst_ids)).distinct()
+    return list(session.scalars(stmt).all())
+
 def delete_position(session, position_id):
     position = session.get(Position, position_id)
     if position:
+        account_id = position.account_id
         try:
             # Attempt to delete the Position
             session.delete(position)
+            bump_data_version_on_commit(session, [account_id])
             session.commit()
             log.info(f"🗑️ Deleted Position ID {position_id}")
         except Exception as e:
@@ -1,121 +1,35 @@
 
 # No pandas dependency
-import pytz
 from sqlalchemy import func, select
 from sqlalchemy.orm import aliased
-from lib.database import get_session, read_from_db, write_to_db
-from lib.models import Price, Instrument, UTCDateTime
-from service.myYahooFinanceService import YahooSymbol
+from lib.models import OHLCV, Instrument
 
 from logging_config import setup_logger
 log = setup_logger(__name__)
 
-DEFAULT_TIMEZONE = "Europe/Rome"
 
-
-def load_prices_from_symbol(symbol: YahooSymbol, granularity: str, instrument: Instrument):
-    """
-    Given a YahooSymbol with 'ochlv' dicts,
-    inserts MarketPrice rows for the instrument identified by ticker.
-    """
-
-    ochlv_data = symbol.ochlv
-    if not ochlv_data:
-        print("No OHLCV data to insert.")
-        return
-    
-    inserted = 0
-    skipped = 0
-
-    with get_session() as session, session.begin():
-
-        # Pre-fetch existing timestamps for this symbol
-        existing_timestamps = set(
-            session.scalars(
-                select(Price.date).where(Price.instrument_id == instrument.id)
-            ).all()
-        )
-
-        for row in ochlv_data:
-            dt = row["timestamp"]
-            if dt in existing_timestamps:
-                skipped += 1
-                continue
-
-            entry = Price(
-                instrument_id=instrument.id,
-                date=dt,
-                price=write_to_db(int(row["close"] or 0)) if row["close"] is not None else 0,
-                granularity=granularity
-            )
-
-            session.add(entry)
-            inserted += 1
-
-        session.commit()
-
-    print(f"Inserted {inserted} new prices, skipped {skipped} duplicates.")
-
-def load_prices_from_yfinance_dataframe(dataframe, granularity: str, instrument: Instrument):
-    """
-    Given a yfinance DataFrame with 'timestamp' and 'close' columns,
-    inserts MarketPrice rows for the instrument identified by ticker.
-    """
-
-    if dataframe.empty:
-        print("No OHLCV data to insert.")
-        return
-    
-    inserted = 0
-    skipped = 0
-
-    with get_session() as session, session.begin():
-
-        # Pre-fetch existing timestamps for this symbol
-        existing_timestamps = set(
-            session.scalars(
-                select(Price.date).where(Price.instrument_id == instrument.id)
-            ).all()
-        )
-
-        for ts, row in dataframe.iterrows():
-            if ts.to_pydatetime() in existing_timestamps:
-                skipped += 1
-                continue
-
-            entry = Price(
-                instrument_id=instrument.id,
-                date=ts,
-                price=write_to_db(row["Close"]),
-                granularity=granularity
-            )
-
-            session.add(entry)
-            inserted += 1
-
-        session.commit()
-
-    print(f"Inserted {inserted} new prices, skipped {skipped} duplicates.")
+# Closes are read from ohlcvs, the single store of market data: the prices table
+# became a view over it (see lib.database.VIEWS) and nothing writes prices anymore.
 
 
 def get_latest_prices_for_instrument_list(session, inst_ids: list[int]):
     
     subquery = (
         select(
-            Price.instrument_id,
-            func.max(Price.date).label("latest_date")
+            OHLCV.instrument_id,
+            func.max(OHLCV.timestamp).label("latest_date")
         )
-        .where(Price.instrument_id.in_(inst_ids))
-        .group_by(Price.instrument_id)
+        .where(OHLCV.instrument_id.in_(inst_ids))
+        .group_by(OHLCV.instrument_id)
         .subquery()
     )
 
     stmt = (
-        select(Price.instrument_id, Price.price, subquery.c.latest_date.label("date"))
+        select(OHLCV.instrument_id, OHLCV.close.label("price"), subquery.c.latest_date.label("date"))
         .join(
             subquery,
-            (Price.instrument_id == subquery.c.instrument_id) &
-            (Price.date == subquery.c.latest_date)
+            (OHLCV.instrument_id == subquery.c.instrument_id) &
+            (OHLCV.timestamp == subquery.c.latest_date)
         )
     )
 
@@ -126,9 +40,9 @@ def get_latest_price(session, inst_id):
     """Return the latest market price for an instrument, or None."""
     
     stmt = (
-        select(Price.price)
-        .where(Price.instrument_id == inst_id)
-        .order_by(Price.date.desc())
+        select(OHLCV.close)
+        .where(OHLCV.instrument_id == inst_id)
+        .order_by(OHLCV.timestamp.desc())
         .limit(1)
     )
     return session.scalar(stmt)
@@ -138,19 +52,19 @@ def get_latest_prices(session):
     
     subquery = (
         select(
-            Price.instrument_id,
-            func.max(Price.date).label("latest_date")
+            OHLCV.instrument_id,
+            func.max(OHLCV.timestamp).label("latest_date")
         )
-        .group_by(Price.instrument_id)
+        .group_by(OHLCV.instrument_id)
         .subquery()
     )
 
     stmt = (
-        select(Price.instrument_id, Price.price, subquery.c.latest_date.label("date"))
+        select(OHLCV.instrument_id, OHLCV.close.label("price"), subquery.c.latest_date.label("date"))
         .join(
             subquery,
-            (Price.instrument_id == subquery.c.instrument_id) &
-            (Price.date == subquery.c.latest_date)
+            (OHLCV.instrument_id == subquery.c.instrument_id) &
+            (OHLCV.timestamp == subquery.c.latest_date)
         )
     )
 
@@ -169,15 +83,15 @@ def get_latest_prices_for_prices_list(session) -> list[dict]:
     # Subquery: get latest timestamp for each instrument
     latest_ts_subq = (
         select(
-            Price.instrument_id,
-            func.max(Price.date).label("latest_ts")
+            OHLCV.instrument_id,
+            func.max(OHLCV.timestamp).label("latest_ts")
         )
-        .group_by(Price.instrument_id)
+        .group_by(OHLCV.instrument_id)
         .subquery()
     )
 
     # Alias OHLCV for joining
-    price_latest = aliased(Price)
+    price_latest = aliased(OHLCV)
 
     # Main query: left join instruments with latest ohlcv data
     query = (
@@ -185,8 +99,8 @@ def get_latest_prices_for_prices_list(session) -> list[dict]:
             Instrument.name,
             Instrument.ticker,
             Instrument.currency,
-            price_latest.price,
-            price_latest.date
+            price_latest.close,
+            price_latest.timestamp
         )
         .outerjoin(
             latest_ts_subq,
@@ -195,7 +109,7 @@ def get_latest_prices_for_prices_list(session) -> list[dict]:
         .outerjoin(
             price_latest,
             (price_latest.instrument_id == latest_ts_subq.c.instrument_id)
-            & (price_latest.date == latest_ts_subq.c.latest_ts)
+            & (price_latest.timestamp == latest_ts_subq.c.latest_ts)
         )
         .order_by(Instrument.name)
     )
@@ -208,8 +122,8 @@ def get_latest_prices_for_prices_list(session) -> list[dict]:
             "instrument_ticker": r.ticker,
             "instrument_currency": r.currency.name if r.currency else None,
             "instrument_symbol": r.currency.symbol if r.currency else "",
-            "last_close": r.price,
-            "timestamp": r.date
+            "last_close": r.close,
+            "timestamp": r.timestamp
         }
         for r in results
     ]
@@ -1,8 +1,10 @@
 
 from lib.database import write_to_db
 from lib.models import Trade
+from sqlalchemy import case, func, insert, select, update
 from sqlalchemy.orm import Session
 from lib.models import Position
+from lib.data_version import bump_data_version_on_commit
 
 
 def get_all_trades(session):
@@ -22,6 +24,52 @@ def get_trades_for_position_list(session: Session, position_ids: list[int]) -> l
     )
     return trades
 
+def iter_trades_by_position(session, account_id=None, before=None, batch_size: int = 1000):
+    """
+    Stream (position_id, date, type, quantity, price) rows ordered by position then date,
+    fetched batch_size rows at a time; before (exclusive) bounds the trade dates.
+    """
+
+    stmt = (
+        select(Trade.position_id, Trade.date, Trade.type, Trade.quantity, Trade.price)
+        .join(Position, Trade.position_id == Position.id)
+        .order_by(Trade.position_id, Trade.date, Trade.id)
+        .execution_options(yield_per=batch_size)
+    )
+    if account_id is not None:
+        stmt = stmt.where(Position.account_id == account_id)
+    if before is not None:
+        stmt = stmt.where(Trade.date < before)
+    yield from session.execute(stmt)
+
+def get_open_positions_state(session) -> dict:
+    """{(account_id, instrument_id): (position_id, held quantity, last trade date)} of the positions not closed."""
+
+    signed_quantity = case((Trade.type == "buy", Trade.quantity), else_=-Trade.quantity)
+    stmt = (
+        select(Position.account_id, Position.instrument_id, Position.id, func.coalesce(func.sum(signed_quantity), 0), func.max(Trade.date))
+        .outerjoin(Trade, Trade.position_id == Position.id)
+        .where(Position.closed.is_(False))
+        .group_by(Position.id)
+        .order_by(Position.id.desc())
+    )
+    # Lowest id wins when several open positions exist for the same pair
+    return {(account_id, instrument_id): (position_id, int(quantity), last_date) for account_id, instrument_id, position_id, quantity, last_date in session.execute(stmt).all()}
+
+def bulk_insert_trades(session, rows: list[dict]) -> list[int]:
+    """Insert trade rows (prices already scaled with write_to_db) with executemany; returns their ids in order."""
+
+    if not rows:
+        return []
+    stmt = insert(Trade).returning(Trade.id, sort_by_parameter_order=True)
+    return list(session.scalars(stmt, rows).all())
+
+def update_positions_state(session, rows: list[dict]):
+    """Bulk update positions by primary key, rows being dicts with id, closed and closing_date."""
+
+    if rows:
+        session.execute(update(Position), rows)
+
 def add_trade(session, account, instrument, date, trade_type, quantity, price, description=None):
     
     # Find active position for this account and instrument
@@ -50,6 +98,7 @@ def add_trade(session, account, instrument, date, trade_type, quantity, price, d
     )
     session.add(trade)
     session.flush()  # ensures IDs and defaults are populated
+    bump_data_version_on_commit(session, [account.id])
 
     print(f"📈 Recorded trade: {trade_type.upper()} {quantity}x {instrument.ticker or instrument.name} @ {price:.2f}")
 
@@ -58,8 +107,10 @@ def add_trade(session, account, instrument, date, trade_type, quantity, price, d
 def delete_trade(session, trade_id):
     trade = session.get(Trade, trade_id)
     if trade:
+        account_id = trade.position.account_id
         session.delete(trade)
         session.flush()
+        bump_data_version_on_commit(session, [account_id])
         print(f"🗑️ Deleted trade ID {trade_id}")
         return True
     else:
@@ -4,6 +4,7 @@ from sqlalchemy.orm import Session
 from lib.models import Position
 from lib.models import Transaction
 from lib.database import write_to_db
+from lib.data_version import bump_data_version_on_commit
 
 
 def add_transaction(session, trans_type, amount, account, position_id=None, description=None):
@@ -17,6 +18,7 @@ def add_transaction(session, trans_type, amount, account, position_id=None, desc
     )
     session.add(tr)
     session.flush()  # ensures IDs and defaults are populated
+    bump_data_version_on_commit(session, [account.id])
     scope = "portfolio" if trade is None else trade.description or trade.instrument.name
     print(f"💵 Added {trans_type}: {amount:.2f} ({scope})")
     return tr
@@ -40,9 +42,11 @@ def get_transactions_for_position_list(session: Session, position_ids: list[int]
 def delete_transaction(session, transaction_id):
     transaction = session.get(Transaction, transaction_id)
     if transaction:
+        account_id = transaction.account_id
         try:
             # Attempt to delete the transaction
             session.delete(transaction)
+            bump_data_version_on_commit(session, [account_id])
             session.commit()
             print(f"🗑️ Deleted transaction ID {transaction_id}")
         except Exception as e:
@@ -5,6 +5,45 @@ import zoneinfo
 
 SETTINGS_PATH = Path("settings.json")
 
+DEFAULT_SERVING_SETTINGS = {
+    "serving_mode": "disk",
+    "replica_refresh_debounce_seconds": 1.0,
+}
+
+DEFAULT_PARTITION_SETTINGS = {
+    "ohlcv_partitions": False,                   # OHLCV bars in per-year files, see lib.ohlcv_partitions
+    "ohlcv_partition_dir": "ohlcv_partitions",   # relative to the database file
+}
+
+DEFAULT_SCHEDULER_SETTINGS = {
+    "enabled": False,
+    "interval_minutes": 60,
+    "stale_after_hours": 24,
+    "lookback_days": 365,
+}
+
+DEFAULT_CACHE_SETTINGS = {
+    "summary_max_bytes": 16 * 1024 * 1024,
+    "checkpoints_max_bytes": 32 * 1024 * 1024,
+    "http_max_bytes": 32 * 1024 * 1024,
+    "correlation_max_bytes": 8 * 1024 * 1024,
+    "risk_max_bytes": 8 * 1024 * 1024,
+}
+
+DEFAULT_ANALYTICS_SETTINGS = {
+    "data_dir": "data",
+    "close_matrix_enabled": True,
+    "close_matrix_granularity": "1d",
+    "ohlcv_store_enabled": False,
+}
+
+DEFAULT_RETENTION_SETTINGS = {
+    "enabled": False,           # also run by the price refresh scheduler
+    "keep_days": {},            # intraday granularity -> days of bars kept before compaction into daily bars
+    "chunk_size": 5000,         # bars deleted per transaction
+    "vacuum": None,             # "incremental" or "full" to give the freed pages back to the filesystem
+}
+
 def load_settings():
     if not SETTINGS_PATH.exists():
         raise FileNotFoundError(f"Settings file not found: {SETTINGS_PATH}")
@@ -19,6 +58,39 @@ def get_db_path():
     settings = load_settings()
     return settings["database"]["url"]
 
+def get_serving_settings():
+    settings = load_settings()
+    return {**DEFAULT_SERVING_SETTINGS, **settings["database"]}
+
 def get_timezone():
     settings = load_settings()
     return zoneinfo.ZoneInfo(settings["app"]["default_timezone"])
+
+def get_base_currency():
+    settings = load_settings()
+    return settings["app"].get("base_currency")
+
+def get_valuation_mode():
+    """"float" (default) or "micro": position amounts computed as exact integer micro-units."""
+    settings = load_settings()
+    return settings["app"].get("valuation_mode", "float")
+
+def get_partition_settings():
+    settings = load_settings()
+    return {**DEFAULT_PARTITION_SETTINGS, **settings["database"]}
+
+def get_scheduler_settings():
+    settings = load_settings()
+    return {**DEFAULT_SCHEDULER_SETTINGS, **settings.get("scheduler", {})}
+
+def get_cache_settings():
+    settings = load_settings()
+    return {**DEFAULT_CACHE_SETTINGS, **settings.get("cache", {})}
+
+def get_retention_settings():
+    settings = load_settings()
+    return {**DEFAULT_RETENTION_SETTINGS, **settings.get("retention", {})}
+
+def get_analytics_settings():
+    settings = load_settings()
+    return {**DEFAULT_ANALYTICS_SETTINGS, **settings.get("analytics", {})}
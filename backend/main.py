@@ -1,16 +1,168 @@
+import asyncio
+import gzip
+import json
+import threading
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, Query, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from typing import Optional
+from pydantic import BaseModel
+from dataclasses import dataclass
+from datetime import date, datetime, time, timezone
 
-from lib.database import get_session
-from lib.repo.accounts_repository import get_account_by_name
-from service.positions_service import get_positions_summary, get_positions_totals
+from lib.data_version import get_data_version
+from lib.database import close_replica, get_read_session, get_replica_status, get_write_session, init_replica
+from lib.repo.accounts_repository import get_account_by_name, set_lot_method
+from lib.lru_cache import LRUCache
+from lib.settings_manager import get_base_currency, get_cache_settings, get_timezone
+from service.batch_write_service import add_trades_batch, add_transactions_batch
+from service.close_matrix_service import get_close_matrix_status, slice_closes
+from service.correlation_service import get_correlation, get_correlation_cache
+from service.lot_matching import LOT_MATCHERS
+from service.maintenance_service import get_database_report
+from service.custom_exceptions import PortfolioException
+from service.ohlcv_store_service import is_ohlcv_store_enabled, read_ohlcv_range, read_ohlcv_range_from_db
+from service.position_updates_service import get_position_updates_hub, stop_position_updates
+from service.positions_service import convert_positions_to_base, get_positions_summary, get_positions_totals, get_summary_cache
+from service.instrument_search_service import search_instruments
 from service.instruments_service import get_all_instruments
+from service.price_scheduler import get_scheduler, start_scheduler, stop_scheduler
+from service.returns_service import get_returns
+from service.risk_service import get_risk, get_risk_cache
+from service.scenario_service import FxShock, PriceShock, Scenario, run_scenarios
+from service.tax_lot_report_service import REPORT_FORMATS, stream_tax_lot_report
 from service.transactions_service import get_all_transactions
 from service.trades_service import get_all_trades
 from service.accounts_service import get_all_accounts
 
-app = FastAPI(title="PIP Backend API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_replica()
+    start_scheduler()
+    yield
+    stop_position_updates()
+    stop_scheduler()
+    close_replica()
+
+app = FastAPI(title="PIP Backend API", lifespan=lifespan)
+
+
+# -----------------------
+# -- HTTP response cache
+# -----------------------
+#
+# GETs of the read endpoints below only depend on the database and the base currency,
+# so their encoded bodies are cached per (data version, base currency, path, query),
+# together with a gzip copy: a hit is served without JSON encoding or compression.
+
+CACHEABLE_PATHS = {
+    "/api/positions",
+    "/api/positions/totals",
+    "/api/returns",
+    "/api/risk",
+    "/api/analytics/correlation",
+    "/api/ohlcv",
+    "/api/instruments",
+    "/api/instruments/search",
+    "/api/transactions",
+    "/api/trades",
+    "/api/accounts",
+}
+GZIP_MIN_BYTES = 512
+
+@dataclass
+class CachedResponse:
+    content_type: bytes
+    body: bytes
+    gzip_body: Optional[bytes]     # None when compressing does not pay off
+
+_response_cache: Optional[LRUCache] = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache() -> LRUCache:
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = LRUCache(
+                get_cache_settings()["http_max_bytes"],
+                lambda entry: 200 + len(entry.body) + len(entry.gzip_body or b""),
+            )
+        return _response_cache
+
+def _response_cache_key(scope) -> tuple:
+    with get_read_session() as session:
+        version = get_data_version(session)
+    return version, get_base_currency(), scope["path"], scope["query_string"]
+
+def _cached_response(body: bytes, content_type: bytes) -> CachedResponse:
+    gzip_body = gzip.compress(body, compresslevel=6, mtime=0) if len(body) >= GZIP_MIN_BYTES else None
+    if gzip_body is not None and len(gzip_body) >= len(body):
+        gzip_body = None
+    return CachedResponse(content_type, body, gzip_body)
+
+class ResponseCacheMiddleware:
+    """ASGI middleware serving the cacheable GETs from get_response_cache()."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or scope["path"] not in CACHEABLE_PATHS:
+            return await self.app(scope, receive, send)
+
+        cache = get_response_cache()
+        key = await run_in_threadpool(_response_cache_key, scope)
+        accept_encoding = dict(scope["headers"]).get(b"accept-encoding", b"")
+        accepts_gzip = b"gzip" in accept_encoding
+
+        entry = cache.get(key)
+        if entry is not None:
+            return await self._send(send, entry, accepts_gzip, b"HIT")
+
+        # Miss: buffer the response, keep it when it is a successful JSON one
+        start, chunks = None, []
+
+        async def capture(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+
+        headers = dict(start["headers"])
+        content_type = headers.get(b"content-type", b"")
+        if start["status"] != 200 or not content_type.startswith(b"application/json"):
+            await send(start)
+            return await send({"type": "http.response.body", "body": b"".join(chunks)})
+
+        entry = await run_in_threadpool(_cached_response, b"".join(chunks), content_type)
+        cache.put(key, entry)
+        # Older data versions can never be hit again
+        cache.invalidate(lambda k: k[0] != key[0])
+        await self._send(send, entry, accepts_gzip, b"MISS")
+
+    @staticmethod
+    async def _send(send, entry: CachedResponse, accepts_gzip: bool, status: bytes):
+        compressed = accepts_gzip and entry.gzip_body is not None
+        body = entry.gzip_body if compressed else entry.body
+        headers = [
+            (b"content-type", entry.content_type),
+            (b"content-length", str(len(body)).encode()),
+            (b"vary", b"Accept-Encoding"),
+            (b"x-cache", status),
+        ]
+        if compressed:
+            headers.append((b"content-encoding", b"gzip"))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+# Added before CORS so that CORS wraps it and also decorates cached responses
+app.add_middleware(ResponseCacheMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,17 +173,78 @@ app.add_middleware(
 )
 
 def get_db():
-    session = get_session()
+    """Session on the on-disk database, for routes that write."""
+    session = get_write_session()
+    try:
+        yield session
+    finally:
+        session.close()
+
+def get_read_db():
+    """Session for read-only routes (served from the in-memory replica when enabled)."""
+    session = get_read_session()
     try:
         yield session
     finally:
         session.close()
 
+class TradeIn(BaseModel):
+    account_name: str
+    instrument_id: Optional[int] = None
+    isin: Optional[str] = None
+    ticker: Optional[str] = None
+    date: datetime
+    type: str
+    quantity: int
+    price: float
+    description: Optional[str] = None
+
+class TransactionIn(BaseModel):
+    account_name: str
+    position_id: Optional[int] = None
+    date: Optional[datetime] = None
+    type: str
+    amount: float
+    description: Optional[str] = None
+
+class PriceShockIn(BaseModel):
+    change: float
+    currency: Optional[str] = None
+    category: Optional[str] = None
+    ticker: Optional[str] = None
+
+class FxShockIn(BaseModel):
+    pair: str
+    change: float
+
+class ScenarioIn(BaseModel):
+    name: str
+    shocks: list[PriceShockIn] = []
+    fx_shocks: list[FxShockIn] = []
+
+class ScenariosIn(BaseModel):
+    account_name: Optional[str] = "All"
+    scenarios: list[ScenarioIn]
+
+def _end_of_day(day: Optional[date]) -> Optional[datetime]:
+    """as_of dates include the whole day, in the app timezone."""
+    if day is None:
+        return None
+    return datetime.combine(day, time.max, tzinfo=get_timezone()).astimezone(timezone.utc)
+
+def _require_base_currency():
+    base_currency = get_base_currency()
+    if not base_currency:
+        raise HTTPException(status_code=400, detail="No base_currency configured in settings")
+    return base_currency
+
 @app.get("/api/positions")
 def read_positions(
     account_name: Optional[str] = "All",
     status_filter: str = Query("all", description="all, open, or closed"),
-    db = Depends(get_db)
+    in_base_currency: bool = Query(False, description="also convert amounts into the base currency from settings"),
+    as_of: Optional[date] = Query(None, description="value positions as of the end of this day"),
+    db = Depends(get_read_db)
 ):
     include_closed = status_filter in ("all", "closed")
     include_open = status_filter in ("all", "open")
@@ -46,8 +259,12 @@ def read_positions(
         db, 
         account=account, 
         include_closed=include_closed, 
-        include_open=include_open
+        include_open=include_open,
+        as_of=_end_of_day(as_of)
     )
+
+    if in_base_currency:
+        convert_positions_to_base(db, positions, _require_base_currency())
     
     # Serialize to standard list of dicts to avoid serialization issues
     return [vars(p) for p in positions]
@@ -56,7 +273,9 @@ def read_positions(
 def read_positions_totals(
     account_name: Optional[str] = "All",
     status_filter: str = Query("all", description="all, open, or closed"),
-    db = Depends(get_db)
+    in_base_currency: bool = Query(False, description="return a single total in the base currency from settings"),
+    as_of: Optional[date] = Query(None, description="value positions as of the end of this day"),
+    db = Depends(get_read_db)
 ):
     include_closed = status_filter in ("all", "closed")
     include_open = status_filter in ("all", "open")
@@ -67,24 +286,214 @@ def read_positions_totals(
         if not account:
             raise HTTPException(status_code=404, detail="Account not found")
 
-    totals = get_positions_totals(
-        db, 
-        account=account, 
-        include_closed=include_closed, 
-        include_open=include_open
-    )
+    try:
+        totals = get_positions_totals(
+            db, 
+            account=account, 
+            include_closed=include_closed, 
+            include_open=include_open,
+            base_currency=_require_base_currency() if in_base_currency else None,
+            as_of=_end_of_day(as_of)
+        )
+    except PortfolioException as ex:
+        raise HTTPException(status_code=422, detail=str(ex))
     
     return [vars(t) for t in totals]
 
+SSE_KEEPALIVE_SECONDS = 15
+
+@app.get("/api/positions/stream")
+async def stream_positions(
+    account_name: Optional[str] = "All",
+    status_filter: str = Query("all", description="all, open, or closed"),
+):
+    """Server-sent events: a 'positions' event with the changed positions and totals after every write."""
+
+    account_id = None
+    if account_name and account_name.lower() != "all":
+        def _find_account():
+            with get_read_session() as session:
+                account = get_account_by_name(session, account_name)
+                return account.id if account else None
+        account_id = await run_in_threadpool(_find_account)
+        if account_id is None:
+            raise HTTPException(status_code=404, detail="Account not found")
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    hub = get_position_updates_hub()
+    subscription = await run_in_threadpool(
+        hub.subscribe, account_id, status_filter, lambda patch: loop.call_soon_threadsafe(queue.put_nowait, patch)
+    )
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    patch = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: positions\ndata: {json.dumps(jsonable_encoder(vars(patch)))}\n\n"
+        finally:
+            hub.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/api/returns")
+def read_returns(
+    account_name: Optional[str] = "All",
+    db = Depends(get_read_db)
+):
+    account = None
+    if account_name and account_name.lower() != "all":
+        account = get_account_by_name(db, account_name)
+        if not account:
+            raise HTTPException(status_code=404, detail="Account not found")
+
+    returns = get_returns(db, account=account)
+    return {
+        "positions": [vars(r) for r in returns["positions"]],
+        "accounts": [vars(r) for r in returns["accounts"]],
+    }
+
+@app.get("/api/analytics/closes")
+def read_analytics_closes(
+    instrument_ids: Optional[str] = Query(None, description="comma separated instrument ids, all when omitted"),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+):
+    ids = [int(i) for i in instrument_ids.split(",") if i.strip()] if instrument_ids else None
+    sliced = slice_closes(ids, start, end)
+    if sliced is None:
+        raise HTTPException(status_code=409, detail="Close matrix not built yet")
+
+    ids, days, closes = sliced
+    return {
+        "instrument_ids": ids,
+        "days": [str(day) for day in days],
+        "closes": [[None if value != value else value for value in row] for row in closes.tolist()],
+    }
+
+@app.get("/api/ohlcv")
+def read_ohlcv(
+    instrument_id: int,
+    granularity: str = "1d",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db = Depends(get_read_db)
+):
+    # Naive bounds are UTC, like the stored timestamps
+    start = start.replace(tzinfo=timezone.utc) if start and start.tzinfo is None else start
+    end = end.replace(tzinfo=timezone.utc) if end and end.tzinfo is None else end
+
+    series = read_ohlcv_range(instrument_id, granularity, start, end) if is_ohlcv_store_enabled() else None
+    if series is None:
+        series = read_ohlcv_range_from_db(db, instrument_id, granularity, start, end)
+    return vars(series)
+
+@app.get("/api/analytics/correlation")
+def read_correlation(
+    account_name: Optional[str] = "All",
+    window: int = Query(252, ge=2, le=5000, description="number of daily returns"),
+    db = Depends(get_read_db)
+):
+    account = None
+    if account_name and account_name.lower() != "all":
+        account = get_account_by_name(db, account_name)
+        if not account:
+            raise HTTPException(status_code=404, detail="Account not found")
+
+    return vars(get_correlation(db, account=account, window=window))
+
+@app.get("/api/analytics/status")
+def read_analytics_status():
+    return {"close_matrix": get_close_matrix_status()}
+
+@app.get("/api/risk")
+def read_risk(
+    account_name: Optional[str] = "All",
+    confidence: float = Query(0.95, gt=0.5, lt=1.0, description="VaR confidence level"),
+    db = Depends(get_read_db)
+):
+    account = None
+    if account_name and account_name.lower() != "all":
+        account = get_account_by_name(db, account_name)
+        if not account:
+            raise HTTPException(status_code=404, detail="Account not found")
+
+    risk = get_risk(db, account=account, confidence=confidence)
+    return {
+        "positions": [vars(r) for r in risk["positions"]],
+        "accounts": [vars(r) for r in risk["accounts"]],
+    }
+
+@app.get("/api/reports/realized-gains")
+def read_realized_gains_report(
+    year: Optional[int] = Query(None, description="tax year of the sells, all years when omitted"),
+    account_name: Optional[str] = "All",
+    format: str = Query("ndjson", description="ndjson or csv"),
+    db = Depends(get_read_db)
+):
+    if format not in REPORT_FORMATS:
+        raise HTTPException(status_code=422, detail=f"Unknown report format {format!r}, expected one of {', '.join(REPORT_FORMATS)}")
+
+    account_id = None
+    if account_name and account_name.lower() != "all":
+        account = get_account_by_name(db, account_name)
+        if not account:
+            raise HTTPException(status_code=404, detail="Account not found")
+        account_id = account.id
+
+    media_type, _ = REPORT_FORMATS[format]
+    filename = f"realized-gains-{year or 'all'}.{format}"
+    return StreamingResponse(
+        stream_tax_lot_report(format, account_id=account_id, year=year),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@app.post("/api/scenarios")
+def evaluate_scenarios(request: ScenariosIn, db = Depends(get_read_db)):
+    account = None
+    if request.account_name and request.account_name.lower() != "all":
+        account = get_account_by_name(db, request.account_name)
+        if not account:
+            raise HTTPException(status_code=404, detail="Account not found")
+
+    scenarios = [
+        Scenario(
+            name=s.name,
+            shocks=[PriceShock(**shock.model_dump()) for shock in s.shocks],
+            fx_shocks=[FxShock(**shock.model_dump()) for shock in s.fx_shocks],
+        )
+        for s in request.scenarios
+    ]
+    try:
+        results = run_scenarios(db, scenarios, account=account)
+    except PortfolioException as ex:
+        raise HTTPException(status_code=422, detail=str(ex))
+
+    return [{**vars(r), "totals": [vars(t) for t in r.totals]} for r in results]
+
 @app.get("/api/instruments")
-def read_instruments(db = Depends(get_db)):
+def read_instruments(db = Depends(get_read_db)):
     instruments = get_all_instruments(db)
     return instruments
 
+@app.get("/api/instruments/search")
+def search_instruments_index(
+    q: str = Query(..., min_length=1, description="ticker, ISIN or name, prefix or approximate"),
+    limit: int = Query(20, ge=1, le=200),
+    db = Depends(get_read_db)
+):
+    return [vars(match) for match in search_instruments(db, q, limit)]
+
 @app.get("/api/transactions")
 def read_transactions(
     account_name: Optional[str] = "All",
-    db = Depends(get_db)
+    db = Depends(get_read_db)
 ):
     account = None
     if account_name and account_name.lower() != "all":
@@ -109,7 +518,7 @@ def read_transactions(
 @app.get("/api/trades")
 def read_trades(
     account_name: Optional[str] = "All",
-    db = Depends(get_db)
+    db = Depends(get_read_db)
 ):
     account = None
     if account_name and account_name.lower() != "all":
@@ -131,14 +540,71 @@ def read_trades(
         for t in trades
     ]
 
+@app.post("/api/trades:batch")
+def create_trades_batch(trades: list[TradeIn], db = Depends(get_db)):
+    result = add_trades_batch(db, [t.model_dump() for t in trades])
+    if not result.committed:
+        raise HTTPException(status_code=422, detail={"errors": [vars(e) for e in result.errors]})
+    return {"ids": result.ids}
+
+@app.post("/api/transactions:batch")
+def create_transactions_batch(transactions: list[TransactionIn], db = Depends(get_db)):
+    result = add_transactions_batch(db, [t.model_dump() for t in transactions])
+    if not result.committed:
+        raise HTTPException(status_code=422, detail={"errors": [vars(e) for e in result.errors]})
+    return {"ids": result.ids}
+
 @app.get("/api/accounts")
-def read_accounts(db = Depends(get_db)):
+def read_accounts(db = Depends(get_read_db)):
     accounts = get_all_accounts(db)
     return [
         {
             "id": a.id,
             "name": a.name,
             "description": a.description,
+            "lot_method": a.lot_method,
         }
         for a in accounts
     ]
+
+@app.put("/api/accounts/{account_name}/lot_method")
+def update_lot_method(account_name: str, method: str, db = Depends(get_db)):
+    method = method.lower()
+    if method not in LOT_MATCHERS:
+        raise HTTPException(status_code=422, detail=f"Unknown lot method {method!r}, expected one of {', '.join(LOT_MATCHERS)}")
+    account = get_account_by_name(db, account_name)
+    if not account:
+        raise HTTPException(status_code=404, detail="Account not found")
+
+    account = set_lot_method(db, account, method)
+    return {"id": account.id, "name": account.name, "lot_method": account.lot_method}
+
+@app.get("/api/scheduler/status")
+def read_scheduler_status():
+    scheduler = get_scheduler()
+    if not scheduler:
+        return {"enabled": False}
+    return {"enabled": True, **scheduler.status()}
+
+@app.post("/api/scheduler/run")
+def run_scheduler():
+    scheduler = get_scheduler()
+    if not scheduler:
+        raise HTTPException(status_code=409, detail="Price refresh scheduler is disabled")
+    started = scheduler.trigger()
+    return {"started": started, "coalesced": not started}
+
+@app.get("/api/database/report")
+def read_database_report():
+    """Page counters and the report of the last maintenance run (from the CLI) for monitoring: no full read of the file."""
+    return get_database_report()
+
+@app.get("/api/cache/stats")
+def read_cache_stats():
+    return {
+        "positions_summary": get_summary_cache().stats(),
+        "http_responses": get_response_cache().stats(),
+        "correlation": get_correlation_cache().stats(),
+        "risk": get_risk_cache().stats(),
+        "replica": get_replica_status(),
+    }
@@ -1,15 +1,15 @@
 
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 import json
 import logging
-import yfinance as yf
-from typing import Any, Tuple
+import time
+from typing import Any, Optional, Tuple
 
 from lib.database import get_session
 from lib.models import Instrument
-from lib.repo.instruments_repository import get_instrument_by_ticker
-from lib.repo.ohlcvs_repository import load_ohlcv_from_symbol, load_ohlcv_from_yfinance_dataframe
-from lib.repo.prices_repository import load_prices_from_symbol, load_prices_from_yfinance_dataframe
+from lib.repo.instruments_repository import get_instrument_by_ticker, get_or_create_instruments_by_ticker
+from lib.repo.ohlcvs_repository import bulk_load_ohlcv, load_ohlcv_from_symbol, load_ohlcv_from_yfinance_dataframe
 from service.custom_exceptions import PortfolioException
 from service.myYahooFinanceService import YahooSymbolParser
 
@@ -19,13 +19,32 @@ log = setup_logger(__name__)
 DEFAULT_GRANULARITY = '1d'
 
 
+def refresh_history(instrument: Instrument, start_date: datetime) -> int:
+    """Download the history of the instrument since start_date and return the number of OHLCV rows inserted."""
+
+    import yfinance as yf  # pulls in pandas: only pay for it when downloading
+
+    yf_symbol = yf.Ticker(instrument.ticker)
+    df = yf_symbol.history(start=start_date, interval=DEFAULT_GRANULARITY)
+    return load_ohlcv_from_yfinance_dataframe(df, DEFAULT_GRANULARITY, instrument)
+
+
+def _after_ingestion(instrument_ids: Optional[list[int]] = None):
+    """Bring the derived stores (close matrix, OHLCV column store) up to date with new bars."""
+
+    # numpy: keep CLI startup light
+    from service.close_matrix_service import refresh_close_matrix_after_ingestion
+    from service.ohlcv_store_service import sync_ohlcv_store_after_ingestion
+
+    refresh_close_matrix_after_ingestion()
+    sync_ohlcv_store_after_ingestion(instrument_ids)
+
+
 def download_history(instrument: Instrument, start_date: datetime) -> Tuple[bool, str]:
 
     try:
-        yf_symbol = yf.Ticker(instrument.ticker)
-        df = yf_symbol.history(start=start_date, interval=DEFAULT_GRANULARITY)
-        load_ohlcv_from_yfinance_dataframe(df, DEFAULT_GRANULARITY, instrument)
-        load_prices_from_yfinance_dataframe(df, DEFAULT_GRANULARITY, instrument)
+        refresh_history(instrument, start_date)
+        _after_ingestion([instrument.id])
         return True, f"Symbol {instrument.ticker} parsed correctly"
     
     except Exception:
@@ -91,8 +110,105 @@ def parse_file(parser: YahooSymbolParser, create_instrument: bool):
         logging.exception()
         raise PortfolioException("YahooFinanceService", "Can't load data into OHLCVs") from ex
     
+    _after_ingestion([instrument.id])
+
+# -----------------------
+# -- Parallel directory ingestion
+# -----------------------
+
+def parse_chart_file(path: str) -> dict:
+    """
+    Process pool worker: parse one Yahoo chart JSON file into plain, picklable data.
+    Returns the symbol metadata plus (timestamp, open, high, low, close, volume) tuples,
+    or a dict with an 'error' key.
+    """
+
     try:
-        load_prices_from_symbol(parser.symbol, parser.symbol.data_granularity, instrument)
-    except Exception as ex:
-        logging.exception()
-        raise PortfolioException("YahooFinanceService", "Can't load data into Prices") from ex
\ No newline at end of file
+        with open(path, mode="r", encoding="utf-8") as read_file:
+            parser = YahooSymbolParser(json.load(read_file))
+    except (OSError, ValueError) as ex:
+        return {"path": path, "error": str(ex)}
+
+    symbol = parser.symbol
+    if symbol is None:
+        return {"path": path, "error": "Not a valid Yahoo chart response"}
+
+    return {
+        "path": path,
+        "ticker": symbol.ticker,
+        "name": symbol.name,
+        "long_name": symbol.long_name,
+        "currency": symbol.currency,
+        "granularity": symbol.data_granularity,
+        "rows": [
+            (row["timestamp"], row["open"], row["high"], row["low"], row["close"], row["volume"])
+            for row in symbol.ochlv if row["timestamp"] is not None
+        ],
+    }
+
+
+def _write_parsed_batch(batch: list[dict], create_instrument: bool) -> tuple[int, int]:
+    """Single writer: store a batch of parsed files in one transaction. Returns (bars inserted, files skipped)."""
+
+    with get_session() as session, session.begin():
+        instrument_ids = get_or_create_instruments_by_ticker(session, batch, create_instrument)
+
+        ohlcv_rows, skipped = [], 0
+        for parsed in batch:
+            instrument_id = instrument_ids.get(parsed["ticker"])
+            if instrument_id is None:
+                log.warning(f"No Instrument found with ticker {parsed['ticker']} ({parsed['path']})")
+                skipped += 1
+                continue
+            for timestamp, open, high, low, close, volume in parsed["rows"]:
+                ohlcv_rows.append((instrument_id, timestamp, parsed["granularity"], open, high, low, close, volume))
+
+        inserted = bulk_load_ohlcv(session, ohlcv_rows)
+
+    return inserted, skipped
+
+
+def ingest_chart_files(paths: list[str], workers: Optional[int] = None, batch_size: int = 50,
+                       create_instrument: bool = True) -> dict:
+    """
+    Parse chart files in a process pool and funnel them into a single writer,
+    which stores batch_size files (many instruments) per transaction.
+    """
+
+    started = time.perf_counter()
+    stats = {"files": len(paths), "parsed": 0, "failed": 0, "skipped": 0, "bars": 0}
+    batch = []
+
+    def flush():
+        inserted, skipped = _write_parsed_batch(batch, create_instrument)
+        stats["bars"] += inserted
+        stats["skipped"] += skipped
+        batch.clear()
+        elapsed = time.perf_counter() - started
+        log.info(
+            f"📥 {stats['parsed']}/{stats['files']} files, {stats['bars']} bars inserted "
+            f"({stats['bars'] / elapsed:,.0f} bars/s)"
+        )
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(parse_chart_file, path) for path in paths]
+        for future in as_completed(futures):
+            parsed = future.result()
+            if "error" in parsed:
+                stats["failed"] += 1
+                log.error(f"Failed to parse {parsed['path']}: {parsed['error']}")
+                continue
+            stats["parsed"] += 1
+            batch.append(parsed)
+            if len(batch) >= batch_size:
+                flush()
+
+    if batch:
+        flush()
+
+    if stats["bars"]:
+        _after_ingestion()
+
+    stats["seconds"] = time.perf_counter() - started
+    stats["bars_per_second"] = stats["bars"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
@@ -0,0 +1,145 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from sqlalchemy import insert
+
+from lib.data_version import bump_data_version_on_commit
+from lib.database import write_to_db
+from lib.models import Account, Position, Transaction
+from logging_config import setup_logger
+from service.trades_import_service import TradeBatchWriter, parse_trade_date
+
+log = setup_logger(__name__)
+
+# TransactionType values are declared with trailing commas (tuples), compare against the plain names
+TRANSACTION_TYPES = ("div", "tax", "fee")
+
+
+# -----------------------
+# -- DTO Models
+# -----------------------
+
+@dataclass
+class BatchErrorDTO:
+    index: int
+    message: str
+
+
+@dataclass
+class BatchResultDTO:
+    """Outcome of a batch write: either every row was stored (ids in input order) or none (errors)."""
+
+    ids: list[int] = field(default_factory=list)
+    errors: list[BatchErrorDTO] = field(default_factory=list)
+
+    @property
+    def committed(self) -> bool:
+        return not self.errors
+
+
+# -----------------------
+# -- Trades
+# -----------------------
+
+def add_trades_batch(session, rows: list[dict]) -> BatchResultDTO:
+    """
+    Store many trades atomically.
+    Each row: account_name, instrument_id | isin | ticker, date, type, quantity, price, description.
+    Rows are validated in order against the running position state (so a batch may buy then sell);
+    any invalid row rejects the whole batch and nothing is written.
+    """
+
+    result = BatchResultDTO()
+    writer = TradeBatchWriter(session)
+
+    for index, row in enumerate(rows):
+        try:
+            writer.add(
+                row.get("account_name"),
+                writer.resolve_instrument(row.get("isin"), row.get("ticker"), row.get("instrument_id")),
+                parse_trade_date(row["date"]),
+                row.get("type"),
+                int(row["quantity"]),
+                float(row["price"]),
+                row.get("description"),
+            )
+        except (ValueError, TypeError, KeyError) as ex:
+            result.errors.append(BatchErrorDTO(index, str(ex)))
+
+    if result.errors or not rows:
+        session.rollback()
+        return result
+
+    try:
+        result.ids = writer.flush()
+        bump_data_version_on_commit(session, writer.finish())
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+    log.info(f"📈 Added {len(result.ids)} trades in one batch")
+    return result
+
+
+# -----------------------
+# -- Transactions
+# -----------------------
+
+def add_transactions_batch(session, rows: list[dict]) -> BatchResultDTO:
+    """
+    Store many transactions atomically.
+    Each row: account_name, type (div, tax, fee), amount, optional position_id, date, description.
+    Accounts and positions are checked with one query each; rows are inserted with executemany.
+    """
+
+    result = BatchResultDTO()
+    accounts = {name: account_id for name, account_id in session.query(Account.name, Account.id).all()}
+
+    position_ids = {row["position_id"] for row in rows if row.get("position_id") is not None}
+    position_accounts = dict(
+        session.query(Position.id, Position.account_id).filter(Position.id.in_(position_ids)).all()
+    ) if position_ids else {}
+
+    values = []
+    for index, row in enumerate(rows):
+        try:
+            account_id = accounts.get((row.get("account_name") or "").strip())
+            if account_id is None:
+                raise ValueError(f"unknown account {row.get('account_name')!r}")
+
+            trans_type = (row.get("type") or "").strip().lower()
+            if trans_type not in TRANSACTION_TYPES:
+                raise ValueError(f"invalid transaction type {trans_type!r}")
+
+            position_id = row.get("position_id")
+            if position_id is not None and position_accounts.get(position_id) != account_id:
+                raise ValueError(f"position {position_id} does not belong to account {row['account_name']!r}")
+
+            date = row.get("date")
+            values.append({
+                "account_id": account_id,
+                "position_id": position_id,
+                "date": parse_trade_date(date) if date else datetime.now(timezone.utc),
+                "type": trans_type,
+                "amount": write_to_db(float(row["amount"])),
+                "description": row.get("description") or None,
+            })
+        except (ValueError, TypeError, KeyError) as ex:
+            result.errors.append(BatchErrorDTO(index, str(ex)))
+
+    if result.errors or not values:
+        session.rollback()
+        return result
+
+    try:
+        stmt = insert(Transaction).returning(Transaction.id, sort_by_parameter_order=True)
+        result.ids = list(session.scalars(stmt, values))
+        bump_data_version_on_commit(session, {value["account_id"] for value in values})
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+    log.info(f"💵 Added {len(result.ids)} transactions in one batch")
+    return result
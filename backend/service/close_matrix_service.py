@@ -0,0 +1,301 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from lib.database import get_session, read_from_db
+from lib.models import Instrument
+from lib.repo.ohlcvs_repository import get_closes_after_id, get_closes_for_instrument_list, get_granularity_fingerprint
+from lib.settings_manager import get_analytics_settings
+from logging_config import setup_logger
+
+log = setup_logger(__name__)
+
+MATRIX_FILE = "close_matrix.f8"
+META_FILE = "close_matrix.json"
+
+
+# ==========================================================
+# Dense instruments x trading days close matrix
+# ==========================================================
+#
+# The matrix is stored day-major, as a raw float64 file of shape (days, instruments),
+# so new trading days are appended at the end of the file. The sidecar JSON holds the
+# axes and the (count, max id) fingerprint of the OHLCVs it was built from. Closes are
+# forward-filled along the days; cells before an instrument's first bar are NaN.
+
+
+# -----------------------
+# -- DTO Models
+# -----------------------
+
+@dataclass
+class CloseMatrix:
+    """Read-only view on the persisted matrix; closes has shape (instruments, days)."""
+
+    granularity: str
+    instrument_ids: list[int]
+    tickers: list[str]
+    days: np.ndarray            # datetime64[D], ascending
+    closes: np.ndarray          # transposed view on the memmap, no copy
+
+    def rows(self, instrument_ids: list[int]) -> np.ndarray:
+        index = {instrument_id: i for i, instrument_id in enumerate(self.instrument_ids)}
+        return np.array([index[instrument_id] for instrument_id in instrument_ids if instrument_id in index], dtype=np.int64)
+
+    def day_range(self, start: Optional[date] = None, end: Optional[date] = None) -> slice:
+        """Slice of the day axis covering [start, end]."""
+        lo = np.searchsorted(self.days, np.datetime64(start, "D")) if start else 0
+        hi = np.searchsorted(self.days, np.datetime64(end, "D"), side="right") if end else len(self.days)
+        return slice(int(lo), int(hi))
+
+
+# -----------------------
+# -- Build / refresh
+# -----------------------
+
+def _paths() -> tuple[Path, Path]:
+    data_dir = Path(get_analytics_settings()["data_dir"])
+    return data_dir / MATRIX_FILE, data_dir / META_FILE
+
+
+def _read_meta(meta_path: Path) -> Optional[dict]:
+    if not meta_path.exists():
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_meta(meta_path: Path, meta: dict):
+    tmp_path = meta_path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+
+def _forward_fill(block: np.ndarray, seed: Optional[np.ndarray] = None) -> np.ndarray:
+    """Forward-fill NaNs along axis 0 (days), continuing from the seed row when given."""
+
+    if seed is not None:
+        block = np.vstack([seed, block])
+    valid = ~np.isnan(block)
+    source = np.where(valid, np.arange(block.shape[0])[:, None], 0)
+    np.maximum.accumulate(source, axis=0, out=source)
+    filled = block[source, np.arange(block.shape[1])]
+    return filled[1:] if seed is not None else filled
+
+
+def _scatter(rows, day_index: dict, instrument_index: dict, shape: tuple) -> np.ndarray:
+    block = np.full(shape, np.nan)
+    for instrument_id, timestamp, close in rows:
+        block[day_index[timestamp.date()], instrument_index[instrument_id]] = read_from_db(close)
+    return block
+
+
+def _tickers(session, instrument_ids: list[int]) -> list[str]:
+    tickers = dict(session.query(Instrument.id, Instrument.ticker).filter(Instrument.id.in_(instrument_ids)).all())
+    return [tickers.get(instrument_id) or "" for instrument_id in instrument_ids]
+
+
+def _build(session, granularity: str, fingerprint: tuple) -> dict:
+
+    matrix_path, meta_path = _paths()
+    rows = get_closes_after_id(session, granularity)
+
+    instrument_ids = sorted({row[0] for row in rows})
+    days = sorted({row[1].date() for row in rows})
+    block = _scatter(
+        rows,
+        {day: i for i, day in enumerate(days)},
+        {instrument_id: i for i, instrument_id in enumerate(instrument_ids)},
+        (len(days), len(instrument_ids)),
+    )
+
+    matrix_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = matrix_path.with_suffix(".tmp")
+    _forward_fill(block).tofile(tmp_path)
+    os.replace(tmp_path, matrix_path)
+
+    meta = {
+        "granularity": granularity,
+        "instrument_ids": instrument_ids,
+        "tickers": _tickers(session, instrument_ids),
+        "days": [day.isoformat() for day in days],
+        "fingerprint": list(fingerprint),
+    }
+    _write_meta(meta_path, meta)
+    return meta
+
+
+def _append(session, meta: dict, fingerprint: tuple) -> Optional[dict]:
+    """Apply the bars added since the matrix was built; None when only a full rebuild can apply them."""
+
+    matrix_path, meta_path = _paths()
+    count, max_id = meta["fingerprint"]
+    rows = get_closes_after_id(session, meta["granularity"], max_id)
+    if fingerprint[0] != count + len(rows):
+        return None  # bars were deleted
+
+    instrument_index = {instrument_id: i for i, instrument_id in enumerate(meta["instrument_ids"])}
+    last_day = date.fromisoformat(meta["days"][-1]) if meta["days"] else None
+    if not last_day or any(row[0] not in instrument_index or row[1].date() < last_day for row in rows):
+        return None  # new instruments or backfilled history
+
+    shape = (len(meta["days"]), len(instrument_index))
+    existing = np.memmap(matrix_path, dtype=np.float64, mode="r+", shape=shape)
+
+    # Bars of the last stored day overwrite its forward-filled cells
+    for instrument_id, timestamp, close in rows:
+        if timestamp.date() == last_day:
+            existing[-1, instrument_index[instrument_id]] = read_from_db(close)
+    seed = np.array(existing[-1:])
+    existing.flush()
+    del existing
+
+    new_rows = [row for row in rows if row[1].date() > last_day]
+    new_days = sorted({row[1].date() for row in new_rows})
+    if new_days:
+        block = _scatter(new_rows, {day: i for i, day in enumerate(new_days)}, instrument_index, (len(new_days), shape[1]))
+        with open(matrix_path, "ab") as f:
+            _forward_fill(block, seed).tofile(f)
+
+    meta["days"] += [day.isoformat() for day in new_days]
+    meta["fingerprint"] = list(fingerprint)
+    _write_meta(meta_path, meta)
+    return meta
+
+
+def refresh_close_matrix(full: bool = False) -> dict:
+    """
+    Bring the persisted matrix up to date with the OHLCVs, appending new trading days
+    in place when possible and rebuilding it otherwise. Returns refresh statistics.
+    """
+
+    settings = get_analytics_settings()
+    granularity = settings["close_matrix_granularity"]
+    started = time.perf_counter()
+    _, meta_path = _paths()
+
+    with get_session() as session:
+        fingerprint = get_granularity_fingerprint(session, granularity)
+        meta = None if full else _read_meta(meta_path)
+
+        if meta and meta["granularity"] != granularity:
+            meta = None
+
+        if meta and tuple(meta["fingerprint"]) == fingerprint:
+            mode = "unchanged"
+        else:
+            mode = "appended"
+            meta = _append(session, meta, fingerprint) if meta else None
+            if meta is None:
+                mode = "rebuilt"
+                meta = _build(session, granularity, fingerprint)
+
+    stats = {
+        "mode": mode,
+        "instruments": len(meta["instrument_ids"]),
+        "days": len(meta["days"]),
+        "seconds": time.perf_counter() - started,
+    }
+    log.info(f"📊 Close matrix {mode}: {stats['instruments']} instruments x {stats['days']} days in {stats['seconds']:.2f}s")
+    return stats
+
+
+def refresh_close_matrix_after_ingestion():
+    """Hook for the ingestion paths: a failed refresh must never fail the ingestion itself."""
+
+    if not get_analytics_settings()["close_matrix_enabled"]:
+        return
+    try:
+        refresh_close_matrix()
+    except Exception:
+        log.exception("Close matrix refresh failed")
+
+
+# -----------------------
+# -- Read access
+# -----------------------
+
+_loaded = {"stamp": None, "matrix": None}
+_load_lock = threading.Lock()
+
+
+def get_close_matrix() -> Optional[CloseMatrix]:
+    """Return the persisted matrix memory-mapped read-only, reopened whenever a refresh rewrote it."""
+
+    matrix_path, meta_path = _paths()
+    if not meta_path.exists():
+        return None
+
+    stamp = meta_path.stat().st_mtime_ns
+    with _load_lock:
+        if _loaded["stamp"] != stamp:
+            meta = _read_meta(meta_path)
+            shape = (len(meta["days"]), len(meta["instrument_ids"]))
+            closes = np.memmap(matrix_path, dtype=np.float64, mode="r", shape=shape) if all(shape) else np.empty(shape)
+            _loaded["matrix"] = CloseMatrix(
+                granularity=meta["granularity"],
+                instrument_ids=meta["instrument_ids"],
+                tickers=meta["tickers"],
+                days=np.array(meta["days"], dtype="datetime64[D]"),
+                closes=closes.T,
+            )
+            _loaded["stamp"] = stamp
+        return _loaded["matrix"]
+
+
+def get_close_matrix_status() -> dict:
+    matrix = get_close_matrix()
+    if matrix is None:
+        return {"built": False}
+    return {
+        "built": True,
+        "granularity": matrix.granularity,
+        "instruments": len(matrix.instrument_ids),
+        "days": len(matrix.days),
+        "first_day": str(matrix.days[0]) if len(matrix.days) else None,
+        "last_day": str(matrix.days[-1]) if len(matrix.days) else None,
+        "bytes": matrix.closes.nbytes,
+    }
+
+
+def slice_closes(instrument_ids: Optional[list[int]] = None, start: Optional[date] = None,
+                 end: Optional[date] = None) -> Optional[tuple[list[int], np.ndarray, np.ndarray]]:
+    """Return (instrument ids, days, closes[instruments, days]) for the requested rows and date range."""
+
+    matrix = get_close_matrix()
+    if matrix is None:
+        return None
+
+    rows = matrix.rows(instrument_ids) if instrument_ids else np.arange(len(matrix.instrument_ids))
+    days = matrix.day_range(start, end)
+    return [matrix.instrument_ids[i] for i in rows], matrix.days[days], np.asarray(matrix.closes[rows, days])
+
+
+def get_aligned_closes(session, instrument_ids: list[int]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return (days, closes[instruments, days]) for the instruments, in the given order, forward-filled
+    on one calendar. Sliced from the persisted matrix when it covers them, built from SQL otherwise.
+    """
+
+    matrix = get_close_matrix()
+    if matrix is not None and set(instrument_ids) <= set(matrix.instrument_ids):
+        return matrix.days, np.asarray(matrix.closes[matrix.rows(instrument_ids)])
+
+    granularity = get_analytics_settings()["close_matrix_granularity"]
+    rows = get_closes_for_instrument_list(session, instrument_ids, granularity) if instrument_ids else []
+    days = sorted({row[1].date() for row in rows})
+    block = _scatter(
+        rows,
+        {day: i for i, day in enumerate(days)},
+        {instrument_id: i for i, instrument_id in enumerate(instrument_ids)},
+        (len(days), len(instrument_ids)),
+    )
+    return np.array(days, dtype="datetime64[D]"), _forward_fill(block).T if days else block.T
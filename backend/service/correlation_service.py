@@ -0,0 +1,174 @@
+import sys
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+
+from lib.data_version import get_account_version
+from lib.lru_cache import LRUCache
+from lib.settings_manager import get_base_currency, get_cache_settings
+from logging_config import setup_logger
+from service.close_matrix_service import get_aligned_closes
+from service.positions_service import convert_positions_to_base, get_positions_summary
+
+log = setup_logger(__name__)
+
+TRADING_DAYS_PER_YEAR = 252
+DEFAULT_WINDOW = 252
+
+
+# -----------------------
+# -- DTO Models
+# -----------------------
+
+@dataclass
+class CorrelationDTO:
+    """
+    Annualized covariance and correlation of the daily log returns of the instruments held,
+    weighted by current market value (in the base currency when configured) for the portfolio volatility.
+    """
+
+    account_id: Optional[int] = None
+    window: int = DEFAULT_WINDOW
+    observations: int = 0
+    first_date: Optional[str] = None
+    last_date: Optional[str] = None
+    currency: str = ""
+    instrument_ids: list[int] = field(default_factory=list)
+    tickers: list[str] = field(default_factory=list)
+    weights: list[float] = field(default_factory=list)
+    volatilities: list[Optional[float]] = field(default_factory=list)
+    covariance: list[list[Optional[float]]] = field(default_factory=list)
+    correlation: list[list[Optional[float]]] = field(default_factory=list)
+    portfolio_volatility: Optional[float] = None
+
+
+# -----------------------
+# -- Computation
+# -----------------------
+
+def _none_if_nan(values: np.ndarray) -> list:
+    if values.ndim == 2:
+        return [_none_if_nan(row) for row in values]
+    return [float(v) if np.isfinite(v) else None for v in values]
+
+
+def log_returns(closes: np.ndarray, days: np.ndarray, window: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Daily log returns (instruments x days) of the last window days on which every instrument
+    has a close, with the days they end on.
+    """
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = np.diff(np.log(closes), axis=1)
+    complete = np.isfinite(returns).all(axis=0)
+    return returns[:, complete][:, -window:], days[1:][complete][-window:]
+
+
+def covariance_and_correlation(returns: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Annualized covariance and correlation of the rows of returns."""
+
+    n = returns.shape[0]
+    if returns.shape[1] < 2:
+        return np.full((n, n), np.nan), np.full((n, n), np.nan)
+
+    centered = returns - returns.mean(axis=1, keepdims=True)
+    covariance = centered @ centered.T / (returns.shape[1] - 1) * TRADING_DAYS_PER_YEAR
+    std = np.sqrt(np.diag(covariance))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correlation = covariance / np.outer(std, std)
+    return covariance, correlation
+
+
+def compute_correlation(session, account=None, window: int = DEFAULT_WINDOW) -> CorrelationDTO:
+
+    base_currency = get_base_currency()
+    # Holdings are the positions with a remaining quantity (closing_date is also set by partial sells)
+    positions = [pos for pos in get_positions_summary(session, account=account) if pos.remaining_quantity > 0]
+    if base_currency:
+        convert_positions_to_base(session, positions, base_currency)
+
+    # --- Market value per instrument (positions of several accounts may share one) ---
+
+    values, tickers = defaultdict(float), {}
+    for pos in positions:
+        rate = (pos.fx_rate if pos.fx_rate is not None else np.nan) if base_currency else 1.0
+        values[pos.instrument_id] += pos.remaining_quantity * pos.latest_price * rate
+        tickers[pos.instrument_id] = pos.instrument_ticker or pos.instrument_name
+
+    instrument_ids = sorted(values)
+    result = CorrelationDTO(
+        account_id=account.id if account else None,
+        window=window,
+        currency=base_currency or "",
+        instrument_ids=instrument_ids,
+        tickers=[tickers[instrument_id] for instrument_id in instrument_ids],
+    )
+    if not instrument_ids:
+        return result
+
+    market_values = np.array([values[instrument_id] for instrument_id in instrument_ids])
+    total = np.nansum(market_values)
+    weights = np.nan_to_num(market_values) / total if total else np.zeros(len(instrument_ids))
+    result.weights = weights.tolist()
+
+    # --- Returns over the window ---
+
+    days, closes = get_aligned_closes(session, instrument_ids)
+    if days.size < 2:
+        return result
+
+    returns, return_days = log_returns(closes, days, window)
+    result.observations = returns.shape[1]
+    if result.observations:
+        result.first_date, result.last_date = str(return_days[0]), str(return_days[-1])
+
+    covariance, correlation = covariance_and_correlation(returns)
+    result.covariance = _none_if_nan(covariance)
+    result.correlation = _none_if_nan(correlation)
+    result.volatilities = _none_if_nan(np.sqrt(np.diag(covariance)))
+
+    variance = weights @ covariance @ weights
+    result.portfolio_volatility = float(np.sqrt(variance)) if np.isfinite(variance) else None
+    return result
+
+
+# -----------------------
+# -- Service
+# -----------------------
+
+_cache: Optional[LRUCache] = None
+_cache_lock = threading.Lock()
+
+
+def _estimate_size(result: CorrelationDTO) -> int:
+    """The two N x N matrices dominate: a list slot plus a float object per cell."""
+    n = len(result.instrument_ids)
+    return sys.getsizeof(result) + 2 * n * n * 32 + n * 200
+
+
+def get_correlation_cache() -> LRUCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LRUCache(get_cache_settings()["correlation_max_bytes"], _estimate_size)
+        return _cache
+
+
+def get_correlation(session, account=None, window: int = DEFAULT_WINDOW) -> CorrelationDTO:
+    """Cached compute_correlation(), keyed on the window and the data version of the account."""
+
+    account_id = account.id if account else None
+    scope = (account_id, window, get_base_currency())
+    key = scope + get_account_version(session, account_id)
+
+    cache = get_correlation_cache()
+    result = cache.get(key)
+    if result is None:
+        result = compute_correlation(session, account, window)
+        # Older versions of the same scope can never be hit again
+        cache.invalidate(lambda k: k[:3] == scope and k != key)
+        cache.put(key, result)
+    return result
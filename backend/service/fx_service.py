@@ -0,0 +1,179 @@
+import bisect
+import re
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from lib.database import read_from_db
+from lib.repo.instruments_repository import get_fx_instruments
+from lib.repo.ohlcvs_repository import get_closes_for_instrument_list, get_ohlcv_fingerprint
+from logging_config import setup_logger
+
+log = setup_logger(__name__)
+
+# EURUSD=X -> 1 EUR = rate USD ; JPY=X -> 1 USD = rate JPY
+FX_TICKER_PATTERN = re.compile(r"^(?P<base>[A-Z]{3})?(?P<quote>[A-Z]{3})=X$")
+
+
+# -----------------------
+# -- Rate series
+# -----------------------
+
+@dataclass
+class FxSeries:
+    """Close rates of one FX pair, sorted by timestamp (POSIX seconds)."""
+
+    base: str
+    quote: str
+    timestamps: list[float] = field(default_factory=list)
+    rates: list[float] = field(default_factory=list)
+
+    def rate_as_of(self, ts: Optional[float]) -> Optional[float]:
+        """Latest rate at or before ts (binary search); latest known rate when ts is None."""
+        if not self.rates:
+            return None
+        if ts is None:
+            return self.rates[-1]
+        i = bisect.bisect_right(self.timestamps, ts) - 1
+        return self.rates[i] if i >= 0 else None
+
+
+class FxRateTable:
+    """In-memory as-of lookup over every FX pair stored as an Instrument."""
+
+    def __init__(self, series: list[FxSeries]):
+        self.series = {(s.base, s.quote): s for s in series}
+        self._paths = {}
+
+    def _path(self, from_ccy: str, to_ccy: str):
+        """Return a list of (series, inverted) legs converting from_ccy into to_ccy, or None."""
+
+        key = (from_ccy, to_ccy)
+        if key in self._paths:
+            return self._paths[key]
+
+        def leg(a, b):
+            if (a, b) in self.series:
+                return (self.series[(a, b)], False)
+            if (b, a) in self.series:
+                return (self.series[(b, a)], True)
+            return None
+
+        path = None
+        direct = leg(from_ccy, to_ccy)
+        if direct:
+            path = [direct]
+        else:
+            # Cross rate through a pivot currency (usually USD)
+            pivots = {c for pair in self.series for c in pair} - {from_ccy, to_ccy}
+            for pivot in sorted(pivots, key=lambda c: c != "USD"):
+                first, second = leg(from_ccy, pivot), leg(pivot, to_ccy)
+                if first and second:
+                    path = [first, second]
+                    break
+
+        self._paths[key] = path
+        return path
+
+    def rates(self, from_ccy: str, to_ccy: str, whens: list[Optional[datetime]]) -> list[Optional[float]]:
+        """Batch as-of conversion factors from_ccy -> to_ccy, one per date (None = latest)."""
+
+        if from_ccy == to_ccy:
+            return [1.0] * len(whens)
+
+        path = self._path(from_ccy, to_ccy)
+        if path is None:
+            return [None] * len(whens)
+
+        results = []
+        for when in whens:
+            ts = when.timestamp() if when is not None else None
+            factor = 1.0
+            for series, inverted in path:
+                rate = series.rate_as_of(ts)
+                if not rate:
+                    factor = None
+                    break
+                factor = factor / rate if inverted else factor * rate
+            results.append(factor)
+        return results
+
+    def rate(self, from_ccy: str, to_ccy: str, when: Optional[datetime] = None) -> Optional[float]:
+        return self.rates(from_ccy, to_ccy, [when])[0]
+
+
+# -----------------------
+# -- Cached loading
+# -----------------------
+
+_cache_lock = threading.Lock()
+_cache = {"key": None, "table": None}
+
+
+def parse_fx_ticker(ticker: str) -> Optional[tuple[str, str]]:
+    match = FX_TICKER_PATTERN.match(ticker or "")
+    if not match:
+        return None
+    return (match.group("base") or "USD", match.group("quote"))
+
+
+def get_fx_table(session) -> FxRateTable:
+    """Return the FX rate table, reloading it only when the FX OHLCV series changed."""
+
+    pairs = {}
+    for instrument in get_fx_instruments(session):
+        pair = parse_fx_ticker(instrument.ticker)
+        if pair:
+            pairs[instrument.id] = pair
+        else:
+            log.warning(f"⚠️ Ignoring FX instrument with unexpected ticker: {instrument.ticker}")
+
+    inst_ids = sorted(pairs)
+    key = (tuple(inst_ids), get_ohlcv_fingerprint(session, inst_ids) if inst_ids else None)
+
+    with _cache_lock:
+        if _cache["key"] == key:
+            return _cache["table"]
+
+        series = {inst_id: FxSeries(*pair) for inst_id, pair in pairs.items()}
+        if inst_ids:
+            for instrument_id, timestamp, close in get_closes_for_instrument_list(session, inst_ids):
+                if not close:
+                    continue
+                s = series[instrument_id]
+                s.timestamps.append(timestamp.timestamp())
+                s.rates.append(read_from_db(close))
+
+        table = FxRateTable(list(series.values()))
+        _cache["key"] = key
+        _cache["table"] = table
+        log.info(f"💱 Loaded {len(series)} FX series")
+        return table
+
+
+def convert_amounts(session, amounts: list[float], currencies: list[str], base_currency: str,
+                    dates: Optional[list[Optional[datetime]]] = None) -> tuple[list[Optional[float]], list[Optional[float]]]:
+    """
+    Convert amounts into base_currency in one batch.
+    Rates are resolved once per currency (and as-of date) instead of once per amount.
+    Returns:
+        converted amounts (None when no rate is available)
+        applied rates
+    """
+
+    table = get_fx_table(session)
+    if dates is None:
+        dates = [None] * len(amounts)
+
+    by_currency = {}
+    for i, currency in enumerate(currencies):
+        by_currency.setdefault(currency, []).append(i)
+
+    rates: list[Optional[float]] = [None] * len(amounts)
+    for currency, indexes in by_currency.items():
+        for i, rate in zip(indexes, table.rates(currency, base_currency, [dates[i] for i in indexes])):
+            rates[i] = rate
+
+    converted = [amount * rate if rate is not None else None for amount, rate in zip(amounts, rates)]
+    return converted, rates
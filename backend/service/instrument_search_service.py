@@ -0,0 +1,171 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from lib.repo.instruments_repository import get_instruments_after_id, get_instruments_fingerprint
+from logging_config import setup_logger
+
+log = setup_logger(__name__)
+
+DEFAULT_LIMIT = 20
+MIN_FUZZY_SCORE = 0.3
+MAX_PREFIX_SCAN = 1000
+FIELDS = ("ticker", "isin", "name", "name_long")
+MATCH_RANKS = {"exact": 0, "prefix": 1, "fuzzy": 2}
+
+_WORD = re.compile(r"[^\W_]+")
+
+
+# ==========================================================
+# In-memory instrument search index
+# ==========================================================
+#
+# Prefix lookups bisect a sorted array of (key, instrument id), the keys being the
+# normalized ticker, ISIN, name and long name and every word of them. Fuzzy lookups
+# score the trigrams shared with each field (Dice coefficient). Instruments are only
+# ever added by the write paths, so the index follows the (count, max id) of the
+# table: new ids are added in place, anything else rebuilds it.
+
+
+# -----------------------
+# -- DTO Models
+# -----------------------
+
+@dataclass
+class InstrumentMatchDTO:
+    """One search result; same fields as /api/instruments plus how it matched."""
+
+    id: int
+    ticker: str = ""
+    isin: str = ""
+    name: str = ""
+    name_long: str = ""
+    currency: str = ""
+    category: Optional[str] = None
+    match: str = ""        # exact, prefix or fuzzy
+    score: float = 0.0
+
+
+def _normalize(text: Optional[str]) -> str:
+    return " ".join(_WORD.findall((text or "").lower()))
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class InstrumentSearchIndex:
+
+    def __init__(self):
+        self.fingerprint = (0, 0)
+        self.records: dict[int, InstrumentMatchDTO] = {}
+        self.keys: list[tuple[str, int]] = []                  # sorted (key, instrument id)
+        self.postings: dict[str, list] = defaultdict(list)     # trigram -> [field ref]
+        self.gram_counts: dict[int, int] = {}                  # field ref -> number of trigrams
+
+    def add_all(self, instruments):
+        keys = []
+        for instrument in instruments:
+            self.records[instrument.id] = InstrumentMatchDTO(
+                id=instrument.id,
+                ticker=instrument.ticker or "",
+                isin=instrument.isin or "",
+                name=instrument.name or "",
+                name_long=instrument.name_long or "",
+                currency=instrument.currency.name if instrument.currency else "",
+                category=instrument.category,
+            )
+            for field_index, field in enumerate(FIELDS):
+                value = _normalize(getattr(instrument, field))
+                if not value:
+                    continue
+                keys.extend((key, instrument.id) for key in {value, *value.split()})
+                ref = instrument.id * len(FIELDS) + field_index  # one int per (instrument, field)
+                grams = _trigrams(value)
+                self.gram_counts[ref] = len(grams)
+                for gram in grams:
+                    self.postings[gram].append(ref)
+
+        # One merge per batch rather than one insort per key
+        self.keys.extend(keys)
+        self.keys.sort()
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT) -> list[InstrumentMatchDTO]:
+
+        q = _normalize(query)
+        if not q:
+            return []
+
+        best: dict[int, tuple] = {}  # instrument id -> (match rank, -score, match)
+
+        def _offer(instrument_id, match, score):
+            candidate = (MATCH_RANKS[match], -score, match)
+            current = best.get(instrument_id)
+            if current is None or candidate < current:
+                best[instrument_id] = candidate
+
+        # --- Prefix matches: exact keys sort first ---
+
+        start = bisect_left(self.keys, (q,))
+        for key, instrument_id in self.keys[start:start + MAX_PREFIX_SCAN]:
+            if not key.startswith(q):
+                break
+            _offer(instrument_id, "exact" if key == q else "prefix", len(q) / len(key))
+
+        # --- Fuzzy matches on shared trigrams ---
+
+        if len(best) < limit:
+            query_grams = _trigrams(q)
+            shared = Counter(ref for gram in query_grams for ref in self.postings.get(gram, ()))
+            for ref, count in shared.items():
+                score = 2 * count / (len(query_grams) + self.gram_counts[ref])
+                if score >= MIN_FUZZY_SCORE:
+                    _offer(ref // len(FIELDS), "fuzzy", score)
+
+        ranked = sorted(best.items(), key=lambda item: (item[1], self.records[item[0]].ticker))[:limit]
+        return [
+            replace(self.records[instrument_id], match=match, score=round(-negative_score, 4))
+            for instrument_id, (_, negative_score, match) in ranked
+        ]
+
+
+# -----------------------
+# -- Service
+# -----------------------
+
+_index = InstrumentSearchIndex()
+_index_lock = threading.Lock()
+
+
+def _refresh_index(session) -> InstrumentSearchIndex:
+    """Add the instruments created since the last refresh; rebuild when some were deleted. Call under _index_lock."""
+
+    global _index
+    fingerprint = get_instruments_fingerprint(session)
+    if fingerprint == _index.fingerprint:
+        return _index
+
+    count, max_id = _index.fingerprint
+    added = get_instruments_after_id(session, max_id)
+    if count + len(added) == fingerprint[0]:
+        _index.add_all(added)
+        log.info(f"🔎 Instrument search index: {len(added)} instruments added")
+    else:
+        _index = InstrumentSearchIndex()
+        _index.add_all(get_instruments_after_id(session))
+        log.info(f"🔎 Instrument search index rebuilt: {len(_index.records)} instruments")
+
+    # From what was loaded: instruments added meanwhile are picked up by the next call
+    _index.fingerprint = (len(_index.records), max(_index.records, default=0))
+    return _index
+
+
+def search_instruments(session, query: str, limit: int = DEFAULT_LIMIT) -> list[InstrumentMatchDTO]:
+    """Exact, then prefix, then fuzzy matches on ticker, ISIN, name and long name."""
+
+    with _index_lock:
+        return _refresh_index(session).search(query, limit)
@@ -0,0 +1,254 @@
+import heapq
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from service.custom_exceptions import PortfolioException
+
+FIFO = "fifo"
+LIFO = "lifo"
+HIFO = "hifo"
+AVERAGE_COST = "average"
+DEFAULT_LOT_METHOD = FIFO
+
+
+# -----------------------
+# -- DTO Models
+# -----------------------
+
+@dataclass
+class MatchedLot:
+    """Part of a sell matched against one buy lot (against the pool for average cost)."""
+
+    buy_date: Optional[datetime]
+    sell_date: datetime
+    quantity: int
+    cost: float
+    proceeds: float
+
+    @property
+    def gain(self) -> float:
+        return self.proceeds - self.cost
+
+
+class Lot:
+    __slots__ = ("qty", "cost_per_unit", "date")
+
+    def __init__(self, qty: int, cost_per_unit: float, date: datetime):
+        self.qty = qty
+        self.cost_per_unit = cost_per_unit
+        self.date = date
+
+
+# -----------------------
+# -- Matchers
+# -----------------------
+
+class LotMatcher:
+    """
+    Running lot state of one position. apply() takes the trades in date order and returns
+    the lots matched by a sell; subclasses only decide which open lot a sell consumes next.
+
+    With exact=True the sums start from int 0 instead of 0.0: fed with integer micro-unit
+    prices every amount stays an exact int (Fractions work too).
+    """
+
+    method = ""
+
+    def __init__(self, exact: bool = False):
+        self.exact = exact
+        self.total_invested = 0 if exact else 0.0
+        self.realized_pnl = 0 if exact else 0.0
+        self.opening_date: Optional[datetime] = None
+        self.closing_date: Optional[datetime] = None
+
+    # --- Lot storage, per strategy ---
+
+    def _add_lot(self, lot: Lot):
+        raise NotImplementedError
+
+    def _next_lot(self) -> Optional[Lot]:
+        """The open lot the next sell consumes, None when nothing is held."""
+        raise NotImplementedError
+
+    def _pop_lot(self):
+        raise NotImplementedError
+
+    def open_lots(self) -> list[Lot]:
+        raise NotImplementedError
+
+    def _copy_lots(self, other: "LotMatcher"):
+        raise NotImplementedError
+
+    # --- Shared logic ---
+
+    def apply(self, trade_type: str, qty: int, price: float, date: datetime) -> list[MatchedLot]:
+
+        if trade_type == "buy":
+            if self._next_lot() is None:  # First Buy trade sets the opening date
+                self.opening_date = date
+            self._add_lot(Lot(qty, price, date))
+            self.total_invested += qty * price
+            return []
+
+        matches = []
+        sell_qty = qty
+        while sell_qty > 0:
+            lot = self._next_lot()
+            if lot is None:
+                break
+
+            matched_qty = min(lot.qty, sell_qty)
+            matches.append(MatchedLot(lot.date, date, matched_qty, matched_qty * lot.cost_per_unit, matched_qty * price))
+            self.realized_pnl += matched_qty * (price - lot.cost_per_unit)
+
+            lot.qty -= matched_qty
+            sell_qty -= matched_qty
+
+            if lot.qty == 0:
+                self._pop_lot()
+                self.closing_date = date  # update closing date only when a lot is fully sold
+        return matches
+
+    def remaining(self) -> tuple[int, float]:
+        """(remaining quantity, remaining cost basis)."""
+        lots = self.open_lots()
+        return sum(lot.qty for lot in lots), sum((lot.qty * lot.cost_per_unit for lot in lots), 0 if self.exact else 0.0)
+
+    def copy(self) -> "LotMatcher":
+        other = type(self)(self.exact)
+        other.total_invested = self.total_invested
+        other.realized_pnl = self.realized_pnl
+        other.opening_date = self.opening_date
+        other.closing_date = self.closing_date
+        self._copy_lots(other)
+        return other
+
+
+class FifoMatcher(LotMatcher):
+    """Oldest lot first, on a deque."""
+
+    method = FIFO
+
+    def __init__(self, exact: bool = False):
+        super().__init__(exact)
+        self.lots: deque = deque()
+
+    def _add_lot(self, lot):
+        self.lots.append(lot)
+
+    def _next_lot(self):
+        return self.lots[0] if self.lots else None
+
+    def _pop_lot(self):
+        self.lots.popleft()
+
+    def open_lots(self):
+        return list(self.lots)
+
+    def _copy_lots(self, other):
+        other.lots = deque(Lot(lot.qty, lot.cost_per_unit, lot.date) for lot in self.lots)
+
+
+class LifoMatcher(FifoMatcher):
+    """Newest lot first, on the same deque used as a stack."""
+
+    method = LIFO
+
+    def _next_lot(self):
+        return self.lots[-1] if self.lots else None
+
+    def _pop_lot(self):
+        self.lots.pop()
+
+
+class HifoMatcher(LotMatcher):
+    """Highest cost lot first, on a heap: O(log n) per consumed lot."""
+
+    method = HIFO
+
+    def __init__(self, exact: bool = False):
+        super().__init__(exact)
+        self.heap: list = []  # (-cost_per_unit, sequence, lot); sequence keeps ties in buy order
+        self.sequence = 0
+
+    def _add_lot(self, lot):
+        heapq.heappush(self.heap, (-lot.cost_per_unit, self.sequence, lot))
+        self.sequence += 1
+
+    def _next_lot(self):
+        return self.heap[0][2] if self.heap else None
+
+    def _pop_lot(self):
+        heapq.heappop(self.heap)
+
+    def open_lots(self):
+        return [entry[2] for entry in sorted(self.heap)]
+
+    def _copy_lots(self, other):
+        other.heap = [(key, sequence, Lot(lot.qty, lot.cost_per_unit, lot.date)) for key, sequence, lot in self.heap]
+        other.sequence = self.sequence
+
+
+class AverageCostMatcher(LotMatcher):
+    """
+    A single pool valued at its average cost: O(1) per trade.
+    Matches are against the pool, dated with the opening date of the holding.
+    With integer amounts the cost removed by a sell is rounded to the nearest unit,
+    so the pool never drifts: what is not removed stays in the remaining basis.
+    """
+
+    method = AVERAGE_COST
+
+    def __init__(self, exact: bool = False):
+        super().__init__(exact)
+        self.quantity = 0
+        self.cost_basis = 0 if exact else 0.0
+
+    def apply(self, trade_type, qty, price, date):
+
+        if trade_type == "buy":
+            if self.quantity == 0:
+                self.opening_date = date
+            self.quantity += qty
+            self.cost_basis += qty * price
+            self.total_invested += qty * price
+            return []
+
+        matched_qty = min(qty, self.quantity)
+        if matched_qty == 0:
+            return []
+
+        if isinstance(self.cost_basis, int):
+            cost = (2 * self.cost_basis * matched_qty + self.quantity) // (2 * self.quantity)
+            self.realized_pnl += matched_qty * price - cost
+        else:
+            average = self.cost_basis / self.quantity
+            cost = matched_qty * average
+            self.realized_pnl += matched_qty * (price - average)
+        self.quantity -= matched_qty
+        self.cost_basis = self.cost_basis - cost if self.quantity else self.cost_basis * 0
+        if self.quantity == 0:
+            self.closing_date = date
+        return [MatchedLot(self.opening_date, date, matched_qty, cost, matched_qty * price)]
+
+    def remaining(self):
+        return self.quantity, self.cost_basis
+
+    def open_lots(self):
+        return [Lot(self.quantity, self.cost_basis / self.quantity, self.opening_date)] if self.quantity else []
+
+    def _copy_lots(self, other):
+        other.quantity = self.quantity
+        other.cost_basis = self.cost_basis
+
+
+LOT_MATCHERS = {matcher.method: matcher for matcher in (FifoMatcher, LifoMatcher, HifoMatcher, AverageCostMatcher)}
+
+
+def new_lot_matcher(method: Optional[str], exact: bool = False) -> LotMatcher:
+    try:
+        return LOT_MATCHERS[(method or DEFAULT_LOT_METHOD).lower()](exact)
+    except KeyError:
+        raise PortfolioException("lot_matching", f"Unknown lot method {method!r}, expected one of {', '.join(LOT_MATCHERS)}")
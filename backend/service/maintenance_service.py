@@ -0,0 +1,240 @@
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from lib.database import get_raw_connection
+from lib.settings_manager import get_analytics_settings, get_db_path
+from logging_config import setup_logger
+from service.custom_exceptions import PortfolioException
+
+log = setup_logger(__name__)
+
+VACUUM_FULL = "full"
+VACUUM_INCREMENTAL = "incremental"
+VACUUM_MODES = (VACUUM_FULL, VACUUM_INCREMENTAL)
+
+AUTO_VACUUM_INCREMENTAL = 2
+REPORT_FILE = "maintenance_report.json"
+
+
+# ==========================================================
+# SQLite maintenance
+# ==========================================================
+#
+# Bulk ingestion leaves the query planner without statistics and deleted bars leave
+# free pages behind. run_maintenance() checks integrity first (a damaged file is never
+# rewritten), refreshes the statistics (ANALYZE, optionally PRAGMA optimize), vacuums
+# when asked, and reports the page usage of every table and index from the dbstat
+# virtual table. Incremental vacuum needs auto_vacuum=INCREMENTAL, which only a full
+# VACUUM can switch on: the first incremental run converts the file.
+#
+# The report of the last run is kept in the data directory: monitoring reads it, plus
+# a few page counters, instead of re-reading the whole file on every poll.
+
+
+# -----------------------
+# -- DTO Models
+# -----------------------
+
+@dataclass
+class StorageObjectDTO:
+    """Page usage of a table or index. fragmentation is the % of leaf pages not following their predecessor."""
+
+    name: str
+    type: str                      # table or index
+    table: str
+    rows: Optional[int] = None     # tables only
+    pages: int = 0
+    size_bytes: int = 0
+    payload_bytes: int = 0
+    unused_bytes: int = 0
+    fragmentation: float = 0.0
+
+
+@dataclass
+class MaintenanceReportDTO:
+    database: str = ""
+    seconds: float = 0.0
+    integrity_ok: bool = True
+    integrity_errors: list[str] = field(default_factory=list)
+    analyzed: bool = False
+    optimized: bool = False
+    vacuum: Optional[str] = None   # full or incremental when run
+    auto_vacuum: int = 0           # 0 none, 1 full, 2 incremental
+    page_size: int = 0
+    pages_before: int = 0
+    free_pages_before: int = 0
+    pages_after: int = 0
+    free_pages_after: int = 0
+    file_bytes_before: int = 0
+    file_bytes_after: int = 0
+    reclaimed_bytes: int = 0
+    objects: list[StorageObjectDTO] = field(default_factory=list)
+
+
+def _pragma(connection, name: str) -> int:
+    return connection.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def _file_bytes(database: str) -> int:
+    return os.path.getsize(database) if database and os.path.exists(database) else 0
+
+
+def used_bytes(connection) -> int:
+    """Bytes of the pages in use: deletes lower it at once, the file only shrinks on vacuum."""
+    return _pragma(connection, "page_size") * (_pragma(connection, "page_count") - _pragma(connection, "freelist_count"))
+
+
+def database_file_bytes() -> int:
+    return _file_bytes(get_db_path().split("///", 1)[-1])
+
+
+def check_integrity(connection, full: bool = False) -> list[str]:
+    """Problems found by PRAGMA quick_check (integrity_check when full); empty when the file is sound."""
+
+    rows = [row[0] for row in connection.execute("PRAGMA integrity_check" if full else "PRAGMA quick_check")]
+    return [] if rows == ["ok"] else rows
+
+
+def vacuum(connection, mode: str) -> str:
+    """Run a full or incremental vacuum; returns what was actually run."""
+
+    if mode == VACUUM_INCREMENTAL:
+        if _pragma(connection, "auto_vacuum") == AUTO_VACUUM_INCREMENTAL:
+            connection.execute("PRAGMA incremental_vacuum")
+            return VACUUM_INCREMENTAL
+        log.info("🧹 Switching auto_vacuum to incremental, this needs a full VACUUM once")
+        connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+    connection.execute("VACUUM")
+    return VACUUM_FULL
+
+
+def storage_report(connection) -> list[StorageObjectDTO]:
+    """Row counts and page usage of every table and index, largest first."""
+
+    objects = {
+        name: StorageObjectDTO(name=name, type=object_type, table=table)
+        for name, object_type, table in connection.execute(
+            "SELECT name, type, tbl_name FROM sqlite_master WHERE type IN ('table', 'index')"
+        )
+    }
+
+    # Pages in b-tree order: a leaf page not right after the previous leaf is a gap
+    last_leaf, leaves, gaps = {}, {}, {}
+    rows = connection.execute("SELECT name, pageno, pagetype, payload, unused, pgsize FROM dbstat ORDER BY name, path")
+    for name, pageno, pagetype, payload, unused, pgsize in rows:
+        stats = objects.setdefault(name, StorageObjectDTO(name=name, type="table", table=name))
+        stats.pages += 1
+        stats.size_bytes += pgsize
+        stats.payload_bytes += payload
+        stats.unused_bytes += unused
+        if pagetype == "leaf":
+            if name in last_leaf and pageno != last_leaf[name] + 1:
+                gaps[name] = gaps.get(name, 0) + 1
+            last_leaf[name] = pageno
+            leaves[name] = leaves.get(name, 0) + 1
+
+    for name, stats in objects.items():
+        if leaves.get(name, 0) > 1:
+            stats.fragmentation = round(100 * gaps.get(name, 0) / (leaves[name] - 1), 2)
+        if stats.type == "table":
+            stats.rows = connection.execute(f'SELECT count(*) FROM "{name}"').fetchone()[0]
+
+    return sorted(objects.values(), key=lambda stats: (-stats.size_bytes, stats.name))
+
+
+def _report_path() -> Path:
+    return Path(get_analytics_settings()["data_dir"]) / REPORT_FILE
+
+
+def _store_report(report: MaintenanceReportDTO):
+    path = _report_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"finished_at": time.time(), **asdict(report)}, f)
+    os.replace(tmp_path, path)
+
+
+def load_last_report() -> Optional[dict]:
+    """Report of the last run_maintenance(), with its finished_at epoch seconds; None before the first run."""
+
+    path = _report_path()
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get_database_report() -> dict:
+    """Monitoring view: the page counters of the database now (PRAGMAs only) and the last maintenance report."""
+
+    raw = get_raw_connection()
+    try:
+        connection = raw.driver_connection
+        current = {
+            "database": get_db_path().split("///", 1)[-1],
+            "page_size": _pragma(connection, "page_size"),
+            "pages": _pragma(connection, "page_count"),
+            "free_pages": _pragma(connection, "freelist_count"),
+            "auto_vacuum": _pragma(connection, "auto_vacuum"),
+            "file_bytes": database_file_bytes(),
+        }
+    finally:
+        raw.close()
+    return {"current": current, "last_maintenance": load_last_report()}
+
+
+def run_maintenance(analyze: bool = True, optimize: bool = False, vacuum_mode: Optional[str] = None,
+                    full_check: bool = False) -> MaintenanceReportDTO:
+    """
+    Check integrity, then ANALYZE / PRAGMA optimize / vacuum as asked, and report the storage.
+    The report is stored for get_database_report().
+    """
+
+    if vacuum_mode is not None and vacuum_mode not in VACUUM_MODES:
+        raise PortfolioException("maintenance", f"Unknown vacuum mode {vacuum_mode!r}, expected one of {', '.join(VACUUM_MODES)}")
+
+    url = get_db_path()
+    report = MaintenanceReportDTO(database=url.split("///", 1)[-1])
+    started = time.perf_counter()
+
+    raw = get_raw_connection()
+    try:
+        connection = raw.driver_connection
+        report.page_size = _pragma(connection, "page_size")
+        report.pages_before = _pragma(connection, "page_count")
+        report.free_pages_before = _pragma(connection, "freelist_count")
+        report.file_bytes_before = _file_bytes(report.database)
+
+        report.integrity_errors = check_integrity(connection, full_check)
+        report.integrity_ok = not report.integrity_errors
+        if not report.integrity_ok:
+            log.error(f"❌ Integrity check failed: {len(report.integrity_errors)} problems, skipping maintenance")
+        else:
+            if analyze:
+                connection.execute("ANALYZE")
+                report.analyzed = True
+            if optimize:
+                connection.execute("PRAGMA optimize")
+                report.optimized = True
+            if vacuum_mode:
+                report.vacuum = vacuum(connection, vacuum_mode)
+            connection.commit()
+
+        report.auto_vacuum = _pragma(connection, "auto_vacuum")
+        report.pages_after = _pragma(connection, "page_count")
+        report.free_pages_after = _pragma(connection, "freelist_count")
+        report.objects = storage_report(connection)
+    finally:
+        raw.close()
+
+    report.file_bytes_after = _file_bytes(report.database)
+    report.reclaimed_bytes = report.file_bytes_before - report.file_bytes_after
+    report.seconds = round(time.perf_counter() - started, 3)
+    _store_report(report)
+    return report
@@ -0,0 +1,281 @@
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from lib.database import get_session
+from lib.repo.ohlcvs_repository import get_ohlcv_rows, get_series_counts, get_series_fingerprints
+from lib.settings_manager import get_analytics_settings
+from logging_config import setup_logger
+
+log = setup_logger(__name__)
+
+STORE_DIR = "ohlcv"
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# One fixed-width little-endian file per column; values are kept as stored in SQLite
+# (micro-units and integer volumes), timestamps as UTC epoch microseconds.
+COLUMNS = {
+    "open": "<i8",
+    "high": "<i8",
+    "low": "<i8",
+    "close": "<i8",
+    "volume": "<i8",
+    "timestamp": "<i8",
+}
+
+# Value checksum of a series, computed the same way by SQLite (see get_series_fingerprints)
+CHECKSUM_WEIGHTS = {"open": 1, "high": 3, "low": 5, "close": 7, "volume": 11}
+CHECKSUM_MODULUS = 1_000_000_007
+
+
+# ==========================================================
+# Memory-mapped OHLCV column store
+# ==========================================================
+#
+# Optional secondary copy of ohlcvs for chart reads, one directory per instrument and
+# granularity. SQLite stays the source of truth: the store is synced from it after
+# ingestion and verify_ohlcv_store() checks parity. The timestamp column is always
+# written last, and readers size every column from it, so a reader never sees a
+# partially appended bar. A rewrite writes every column to a temporary file first and
+# only then swaps them in, timestamp last; readers never map past the shortest column.
+
+
+# -----------------------
+# -- DTO Models
+# -----------------------
+
+@dataclass
+class OhlcvSeriesDTO:
+    """Bars of one series; prices as floats, timestamps as UTC epoch milliseconds."""
+
+    instrument_id: int
+    granularity: str
+    source: str
+    timestamps: list[int] = field(default_factory=list)
+    open: list[float] = field(default_factory=list)
+    high: list[float] = field(default_factory=list)
+    low: list[float] = field(default_factory=list)
+    close: list[float] = field(default_factory=list)
+    volume: list[int] = field(default_factory=list)
+
+
+def is_ohlcv_store_enabled() -> bool:
+    return get_analytics_settings()["ohlcv_store_enabled"]
+
+
+def _series_dir(instrument_id: int, granularity: str) -> Path:
+    return Path(get_analytics_settings()["data_dir"]) / STORE_DIR / str(instrument_id) / granularity
+
+
+def _to_micros(timestamp: datetime) -> int:
+    return (timestamp - EPOCH) // timedelta(microseconds=1)
+
+
+def _rows_to_columns(rows) -> dict[str, np.ndarray]:
+    """(timestamp, open, high, low, close, volume) rows as returned by get_ohlcv_rows -> column arrays."""
+    return {
+        "timestamp": np.array([_to_micros(row[0]) for row in rows], dtype=COLUMNS["timestamp"]),
+        "open": np.array([row[1] or 0 for row in rows], dtype=COLUMNS["open"]),
+        "high": np.array([row[2] or 0 for row in rows], dtype=COLUMNS["high"]),
+        "low": np.array([row[3] or 0 for row in rows], dtype=COLUMNS["low"]),
+        "close": np.array([row[4] or 0 for row in rows], dtype=COLUMNS["close"]),
+        "volume": np.array([row[5] or 0 for row in rows], dtype=COLUMNS["volume"]),
+    }
+
+
+# -----------------------
+# -- Read access
+# -----------------------
+
+_mapped: dict = {}
+_mapped_lock = threading.Lock()
+
+
+def _open_series(instrument_id: int, granularity: str) -> Optional[dict[str, np.ndarray]]:
+    """Memory-map the columns of one series, remapping when the timestamp file grew or was replaced."""
+
+    directory = _series_dir(instrument_id, granularity)
+    ts_path = directory / "timestamp.bin"
+    if not ts_path.exists():
+        return None
+
+    stat = ts_path.stat()
+    stamp = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+    key = (instrument_id, granularity)
+
+    with _mapped_lock:
+        cached = _mapped.get(key)
+        if cached and cached[0] == stamp:
+            return cached[1]
+
+        # A rewrite in progress may have swapped in shorter columns than the timestamps
+        length = min([stat.st_size] + [(directory / f"{name}.bin").stat().st_size for name in COLUMNS if name != "timestamp"]) // 8
+        if length == 0:
+            columns = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        else:
+            columns = {
+                name: np.memmap(directory / f"{name}.bin", dtype=dtype, mode="r", shape=(length,))
+                for name, dtype in COLUMNS.items()
+            }
+        _mapped[key] = (stamp, columns)
+        return columns
+
+
+def _checksum(columns: dict[str, np.ndarray]) -> int:
+    """Same checksum as get_series_fingerprints: np.fmod truncates like the SQLite % operator."""
+    row_sum = sum(columns[name].astype(np.int64) * weight for name, weight in CHECKSUM_WEIGHTS.items())
+    return int(np.fmod(row_sum, CHECKSUM_MODULUS).sum())
+
+
+def _series_state(instrument_id: int, granularity: str) -> tuple[int, Optional[int], int]:
+    """(number of bars, last timestamp in epoch microseconds, checksum) of a stored series."""
+    columns = _open_series(instrument_id, granularity)
+    if columns is None or len(columns["timestamp"]) == 0:
+        return 0, None, 0
+    return len(columns["timestamp"]), int(columns["timestamp"][-1]), _checksum(columns)
+
+
+def read_ohlcv_range(instrument_id: int, granularity: str, start: Optional[datetime] = None,
+                     end: Optional[datetime] = None) -> Optional[OhlcvSeriesDTO]:
+    """Bars in [start, end] located by binary search on the memory-mapped timestamps; None when not stored."""
+
+    columns = _open_series(instrument_id, granularity)
+    if columns is None:
+        return None
+
+    timestamps = columns["timestamp"]
+    lo = int(np.searchsorted(timestamps, _to_micros(start))) if start else 0
+    hi = int(np.searchsorted(timestamps, _to_micros(end), side="right")) if end else len(timestamps)
+
+    return OhlcvSeriesDTO(
+        instrument_id=instrument_id,
+        granularity=granularity,
+        source="column_store",
+        timestamps=(timestamps[lo:hi] // 1000).tolist(),
+        open=(columns["open"][lo:hi] / 1e6).tolist(),
+        high=(columns["high"][lo:hi] / 1e6).tolist(),
+        low=(columns["low"][lo:hi] / 1e6).tolist(),
+        close=(columns["close"][lo:hi] / 1e6).tolist(),
+        volume=columns["volume"][lo:hi].tolist(),
+    )
+
+
+def read_ohlcv_range_from_db(session, instrument_id: int, granularity: str, start: Optional[datetime] = None,
+                             end: Optional[datetime] = None) -> OhlcvSeriesDTO:
+    """Same result as read_ohlcv_range, read from SQLite."""
+
+    columns = _rows_to_columns(get_ohlcv_rows(session, instrument_id, granularity, start=start, end=end))
+    return OhlcvSeriesDTO(
+        instrument_id=instrument_id,
+        granularity=granularity,
+        source="sqlite",
+        timestamps=(columns["timestamp"] // 1000).tolist(),
+        open=(columns["open"] / 1e6).tolist(),
+        high=(columns["high"] / 1e6).tolist(),
+        low=(columns["low"] / 1e6).tolist(),
+        close=(columns["close"] / 1e6).tolist(),
+        volume=columns["volume"].tolist(),
+    )
+
+
+# -----------------------
+# -- Writes
+# -----------------------
+
+def _append_columns(instrument_id: int, granularity: str, columns: dict[str, np.ndarray]):
+    directory = _series_dir(instrument_id, granularity)
+    directory.mkdir(parents=True, exist_ok=True)
+    for name in COLUMNS:  # timestamp last
+        with open(directory / f"{name}.bin", "ab") as f:
+            columns[name].tofile(f)
+
+
+def _write_columns(instrument_id: int, granularity: str, columns: dict[str, np.ndarray]):
+    directory = _series_dir(instrument_id, granularity)
+    directory.mkdir(parents=True, exist_ok=True)
+    for name in COLUMNS:
+        columns[name].tofile(directory / f"{name}.tmp")
+    for name in COLUMNS:  # all written: swap them in, timestamp last
+        os.replace(directory / f"{name}.tmp", directory / f"{name}.bin")
+
+
+def _sync_series(session, instrument_id: int, granularity: str, db_state: tuple) -> str:
+    """Append the bars newer than the stored ones; rewrite the series when that is not enough."""
+
+    db_count, db_last, db_checksum = db_state
+    length, last, checksum = _series_state(instrument_id, granularity)
+    if (length, last, checksum) == (db_count, _to_micros(db_last), db_checksum):
+        return "unchanged"
+
+    after = EPOCH + timedelta(microseconds=last) if last is not None else None
+    rows = get_ohlcv_rows(session, instrument_id, granularity, after=after)
+    if length + len(rows) == db_count:
+        appended = _rows_to_columns(rows)
+        if checksum + _checksum(appended) == db_checksum:  # older bars unchanged
+            _append_columns(instrument_id, granularity, appended)
+            return "appended"
+
+    # Backfilled or deleted bars
+    _write_columns(instrument_id, granularity, _rows_to_columns(get_ohlcv_rows(session, instrument_id, granularity)))
+    return "rewritten"
+
+
+def sync_ohlcv_store(instrument_ids: Optional[list[int]] = None) -> dict:
+    """Bring the stored series of the instruments (all when None) in line with SQLite; returns counts per outcome."""
+
+    started = time.perf_counter()
+    stats = {"unchanged": 0, "appended": 0, "rewritten": 0}
+    with get_session() as session:
+        fingerprints = get_series_fingerprints(session, CHECKSUM_WEIGHTS, CHECKSUM_MODULUS, instrument_ids)
+        for (instrument_id, granularity), db_state in fingerprints.items():
+            stats[_sync_series(session, instrument_id, granularity, db_state)] += 1
+
+    stats["seconds"] = time.perf_counter() - started
+    log.info(f"🗄️ OHLCV column store synced: {stats['appended']} appended, {stats['rewritten']} rewritten in {stats['seconds']:.2f}s")
+    return stats
+
+
+def sync_ohlcv_store_after_ingestion(instrument_ids: Optional[list[int]] = None):
+    """Hook for the ingestion paths: a failed sync must never fail the ingestion itself."""
+
+    if not is_ohlcv_store_enabled():
+        return
+    try:
+        sync_ohlcv_store(instrument_ids)
+    except Exception:
+        log.exception("OHLCV column store sync failed")
+
+
+# -----------------------
+# -- Parity check
+# -----------------------
+
+def verify_ohlcv_store(instrument_ids: Optional[list[int]] = None) -> dict:
+    """Compare every stored series with SQLite, column by column."""
+
+    report = {"series": 0, "ok": 0, "mismatches": []}
+    with get_session() as session:
+        for (instrument_id, granularity) in get_series_counts(session, instrument_ids):
+            report["series"] += 1
+            expected = _rows_to_columns(get_ohlcv_rows(session, instrument_id, granularity))
+            stored = _open_series(instrument_id, granularity)
+
+            if stored is None:
+                reason = "missing"
+            elif len(stored["timestamp"]) != len(expected["timestamp"]):
+                reason = f"{len(stored['timestamp'])} bars stored, {len(expected['timestamp'])} in SQLite"
+            else:
+                differing = [name for name in COLUMNS if not np.array_equal(stored[name], expected[name])]
+                reason = f"columns differ: {', '.join(differing)}" if differing else None
+
+            if reason:
+                report["mismatches"].append({"instrument_id": instrument_id, "granularity": granularity, "reason": reason})
+            else:
+                report["ok"] += 1
+    return report
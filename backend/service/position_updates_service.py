@@ -0,0 +1,238 @@
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from lib import data_version
+from lib.database import get_session
+from lib.models import Account
+from logging_config import setup_logger
+from service.positions_service import get_positions_summary, totals_by_currency
+
+log = setup_logger(__name__)
+
+DEBOUNCE_SECONDS = 0.2
+POLL_SECONDS = 5.0       # writes made by another process are only seen by polling the data version
+
+
+# ==========================================================
+# Live position updates
+# ==========================================================
+#
+# Subscribers watch one scope (account, status filter), as the positions page does.
+# The data version listener only records which accounts were written; a worker thread
+# then recomputes the positions of the scopes on those accounts once, diffs them with
+# what was last published, and hands each subscriber a patch with only the positions
+# whose values changed (and the totals when they changed). The baseline of a scope is
+# computed and replaced under the scope's own lock, by the first subscriber and by the
+# worker alike, so later subscribers wait for it and the two never race to assign it.
+
+
+# -----------------------
+# -- DTO Models
+# -----------------------
+
+@dataclass
+class PositionsPatchDTO:
+    """Changes of a scope: upserts carry position_id plus the changed fields (all fields for new positions)."""
+
+    account_id: Optional[int]
+    status_filter: str
+    upserts: list[dict] = field(default_factory=list)
+    removed: list[int] = field(default_factory=list)
+    totals: Optional[list[dict]] = None    # None when unchanged
+
+
+@dataclass
+class _Scope:
+    account_id: Optional[int]
+    status_filter: str
+    positions: dict[int, dict] = field(default_factory=dict)   # position_id -> last published fields
+    totals: list[dict] = field(default_factory=list)
+    subscribers: dict[int, Callable] = field(default_factory=dict)
+    baselined: bool = False
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)   # guards positions, totals, baselined
+
+
+def _compute(session, account_id: Optional[int], status_filter: str) -> tuple[dict[int, dict], list[dict]]:
+    account = session.get(Account, account_id) if account_id is not None else None
+    positions = get_positions_summary(
+        session,
+        account=account,
+        include_closed=status_filter in ("all", "closed"),
+        include_open=status_filter in ("all", "open"),
+    )
+    return {pos.position_id: vars(pos) for pos in positions}, [vars(total) for total in totals_by_currency(positions)]
+
+
+def _diff_positions(scope: _Scope, positions: dict[int, dict], totals: list[dict]) -> PositionsPatchDTO:
+
+    patch = PositionsPatchDTO(scope.account_id, scope.status_filter)
+    for position_id, fields in positions.items():
+        previous = scope.positions.get(position_id)
+        if previous is None:
+            patch.upserts.append(fields)
+            continue
+        changed = {name: value for name, value in fields.items() if previous.get(name) != value}
+        if changed:
+            patch.upserts.append({"position_id": position_id, **changed})
+
+    patch.removed = [position_id for position_id in scope.positions if position_id not in positions]
+    if totals != scope.totals:
+        patch.totals = totals
+    return patch
+
+
+class PositionUpdatesHub:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._scopes: dict[tuple, _Scope] = {}
+        self._tokens = itertools.count(1)
+        self._pending_all = False
+        self._pending_accounts: set[int] = set()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+    # --- Subscriptions ---
+
+    def subscribe(self, account_id: Optional[int], status_filter: str, callback: Callable[[PositionsPatchDTO], None]) -> tuple:
+        """Register callback(patch) on a scope; returns the subscription to unsubscribe. Blocks until the scope has a baseline."""
+
+        key = (account_id, status_filter)
+        with self._lock:
+            scope = self._scopes.get(key)
+            if scope is None:
+                scope = self._scopes[key] = _Scope(account_id, status_filter)
+            token = next(self._tokens)
+            scope.subscribers[token] = callback
+
+        try:
+            with scope.lock:
+                if not scope.baselined:
+                    # Baseline the patches are computed against
+                    with get_session() as session:
+                        scope.positions, scope.totals = _compute(session, account_id, status_filter)
+                    scope.baselined = True
+        except Exception:
+            self.unsubscribe((key, token))
+            raise
+
+        self._start()
+        return key, token
+
+    def unsubscribe(self, subscription: tuple):
+        key, token = subscription
+        with self._lock:
+            scope = self._scopes.get(key)
+            if scope:
+                scope.subscribers.pop(token, None)
+                if not scope.subscribers:
+                    del self._scopes[key]
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(scope.subscribers) for scope in self._scopes.values())
+
+    # --- Change notifications ---
+
+    def notify(self, account_ids=None):
+        """Data version listener: cheap, runs in the writer's thread."""
+
+        with self._lock:
+            if account_ids is None:
+                self._pending_all = True
+            else:
+                self._pending_accounts.update(account_ids)
+        self._wakeup.set()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="position-updates", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped:
+            if not self._wakeup.wait(POLL_SECONDS):
+                self._poll_external_writes()
+                continue
+
+            # Coalesce the bumps of one write burst (e.g. an ingestion batch)
+            time.sleep(DEBOUNCE_SECONDS)
+            self._wakeup.clear()
+            if self._stopped:
+                break
+
+            with self._lock:
+                accounts = None if self._pending_all else set(self._pending_accounts)
+                self._pending_all = False
+                self._pending_accounts.clear()
+                scopes = [
+                    scope for scope in self._scopes.values()
+                    if accounts is None or scope.account_id is None or scope.account_id in accounts
+                ]
+            if accounts is not None and not accounts:
+                continue  # e.g. a new instrument no account holds yet
+
+            try:
+                self._publish(scopes)
+            except Exception:
+                log.exception("Position updates failed")
+
+    def _poll_external_writes(self):
+        if not self.subscriber_count():
+            return
+        try:
+            with get_session() as session:
+                data_version.get_data_version(session)  # bumps, and so notifies us, on external writes
+        except Exception:
+            log.exception("Data version poll failed")
+
+    def _publish(self, scopes: list[_Scope]):
+        with get_session() as session:
+            for scope in scopes:
+                with scope.lock:
+                    positions, totals = _compute(session, scope.account_id, scope.status_filter)
+                    patch = _diff_positions(scope, positions, totals) if scope.baselined else None
+                    scope.positions, scope.totals = positions, totals
+                    scope.baselined = True
+                if patch is None or not (patch.upserts or patch.removed or patch.totals is not None):
+                    continue
+
+                with self._lock:
+                    callbacks = list(scope.subscribers.values())
+                for callback in callbacks:
+                    callback(patch)
+                log.debug(f"📡 {len(patch.upserts)} position updates sent to {len(callbacks)} subscribers")
+
+
+# -----------------------
+# -- Service
+# -----------------------
+
+_hub: Optional[PositionUpdatesHub] = None
+_hub_lock = threading.Lock()
+
+
+def get_position_updates_hub() -> PositionUpdatesHub:
+    """The hub is created, and registered as data version listener, on the first subscription."""
+
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            _hub = PositionUpdatesHub()
+            data_version.add_listener(_hub.notify)
+        return _hub
+
+
+def stop_position_updates():
+    with _hub_lock:
+        if _hub is not None:
+            _hub.stop()
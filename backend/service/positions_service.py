@@ -1,16 +1,28 @@
 
-from collections import deque
+import sys
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime
 from typing import Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
     # No pandas dependency
+from lib.data_version import get_account_version
 from lib.database import read_from_db
+from lib.enums import Currency
+from lib.lru_cache import LRUCache
 from lib.models import Position, UTCDateTime
+from lib.repo.accounts_repository import get_lot_methods
+from lib.repo.ohlcvs_repository import get_closes_as_of
 from lib.repo.trades_repository import get_trades_for_position_list
 from lib.repo.positions_repository import get_all_positions
 
 from lib.repo.transactions_repository import get_transactions_for_position_list
+from lib.settings_manager import get_cache_settings, get_valuation_mode
 from logging_config import setup_logger
-from service import prices_service
+from service import fx_service, prices_service
+from service.custom_exceptions import PortfolioException
+from service.lot_matching import LotMatcher, new_lot_matcher
 
 log = setup_logger(__name__)
 
@@ -43,6 +55,7 @@ class PositionDTO:
     closing_date: Optional[UTCDateTime] = None
     remaining_quantity: int = 0
     remaining_cost_basis: float = 0.00
+    lot_method: str = ""
     
     # avg_buy_price: float = 0.00
 
@@ -55,6 +68,16 @@ class PositionDTO:
     pnl: float = 0.00
     pnl_percent: float = 0.00
 
+    # Only filled in micro valuation mode: the exact amounts, in micro-units
+    total_invested_micro: Optional[int] = None
+    pnl_micro: Optional[int] = None
+
+    # Only filled when a base currency conversion is requested
+    base_currency: str = ""
+    fx_rate: Optional[float] = None
+    total_invested_base: Optional[float] = None
+    pnl_base: Optional[float] = None
+
 
 @dataclass
 class CurrencyTotalDTO:
@@ -64,33 +87,102 @@ class CurrencyTotalDTO:
     total_invested: float = 0.00
     total_pnl: float = 0.00
 
-def _apply_fifo(session, positions: list[Position]) -> list[PositionDTO]:
+def _new_position_dto(position: Position) -> PositionDTO:
+    positionDTO = PositionDTO(position.id)
+    positionDTO.instrument_id = position.instrument.id
+    positionDTO.instrument_name = position.instrument.name
+    positionDTO.instrument_isin = position.instrument.isin
+    positionDTO.instrument_ticker = position.instrument.ticker
+    positionDTO.instrument_currency = position.instrument.currency.name
+    positionDTO.instrument_symbol = position.instrument.currency.symbol
+    return positionDTO
+
+
+# ==========================================================
+# Valuation modes
+# ==========================================================
+#
+# Amounts are stored as int micro-units. In the default "float" mode they are converted
+# to floats as they are read and every sum is a float sum. In "micro" mode prices and
+# transaction amounts are fed to the lot matchers as stored, so quantities times prices,
+# cost bases, realized and unrealized PnL stay exact ints; _fill_from_state converts
+# them once, when it writes the DTO, and keeps the exact invested amount and PnL
+# alongside (*_micro) for totals_by_currency to sum as ints.
+
+def _is_exact() -> bool:
+    return get_valuation_mode() == "micro"
+
+
+def _amount(stored: int, exact: bool):
+    """A stored amount in the units of the valuation mode: as stored when exact, float otherwise."""
+    return stored if exact else read_from_db(stored)
+
+
+def _fill_from_state(positionDTO: PositionDTO, state: LotMatcher, latest_price, transactions_amount):
+    """
+    Copy the lot matching results into the DTO and compute the PnL at latest_price.
+    latest_price and transactions_amount are in the units the state was fed with.
+    """
+
+    convert = read_from_db if state.exact else (lambda amount: amount)
+
+    positionDTO.lot_method = state.method
+    positionDTO.total_invested = convert(state.total_invested)
+    positionDTO.realized_pnl = convert(state.realized_pnl)
+    positionDTO.opening_date = state.opening_date
+    positionDTO.closing_date = state.closing_date
+    positionDTO.latest_price = convert(latest_price)
+    positionDTO.transactions_amount = convert(transactions_amount)
+
+
+    # --- Compute remaining quantity and cost basis ---
+
+    remaining_quantity, remaining_cost_basis = state.remaining()
+    positionDTO.remaining_quantity = remaining_quantity
+    positionDTO.remaining_cost_basis = convert(remaining_cost_basis)
+
+
+    # --- PnL Calculations ---
+
+    unrealized_pnl = remaining_quantity * latest_price - remaining_cost_basis
+    pnl = state.realized_pnl + unrealized_pnl + transactions_amount
+    positionDTO.unrealized_pnl = convert(unrealized_pnl)
+    positionDTO.pnl = convert(pnl)
+    if state.exact:
+        positionDTO.total_invested_micro = state.total_invested
+        positionDTO.pnl_micro = pnl
+
+    positionDTO.realized_pnl_percent = (positionDTO.realized_pnl / positionDTO.total_invested * 100) if positionDTO.total_invested > 0 else 0.0
+    positionDTO.unrealized_pnl_percent = (positionDTO.unrealized_pnl / positionDTO.remaining_cost_basis * 100) if positionDTO.remaining_cost_basis > 0 else 0.0
+
+
+def _signed_transaction_amount(transaction, exact: bool = False):
+    if transaction.type in ('div'):
+        return _amount(transaction.amount, exact)
+    return -_amount(transaction.amount, exact)
+
+
+def _apply_lot_matching(session, positions: list[Position]) -> list[PositionDTO]:
     """
-    Apply FIFO to trades of the same Instrument
-    Returns:
-        closed_trades: list of dicts with realized PnL
-        open_lots: remaining open lots (list of dicts)
+    Match the sells of every position against its buy lots, with the lot method of its account
+    (FIFO, LIFO, HIFO or average cost, see service.lot_matching).
     """
 
+    exact = _is_exact()
     all_trades = get_trades_for_position_list(session, [position.id for position in positions])
     all_transactions = get_transactions_for_position_list(session, [position.id for position in positions])
-    latest_prices = prices_service.get_latest_prices_for_instrument_list(session, [position.instrument.id for position in positions])
+    latest_prices = prices_service.get_latest_prices_for_instrument_list(session, [position.instrument.id for position in positions], micro_units=True)
+    lot_methods = get_lot_methods(session)
 
     positionDTOs = []
     for position in positions:
 
-        positionDTO = PositionDTO(position.id)
-        positionDTO.instrument_id = position.instrument.id
-        positionDTO.instrument_name = position.instrument.name
-        positionDTO.instrument_isin = position.instrument.isin
-        positionDTO.instrument_ticker = position.instrument.ticker
-        positionDTO.instrument_currency = position.instrument.currency.name
-        positionDTO.instrument_symbol = position.instrument.currency.symbol
+        positionDTO = _new_position_dto(position)
 
         # --- Get latest price for this instrument --- 
 
         latest_price_entry = next((priceDTO for priceDTO in latest_prices if priceDTO.instrument_id == position.instrument.id), None)
-        positionDTO.latest_price = latest_price_entry.price if latest_price_entry else 0.0
+        latest_price = _amount(latest_price_entry.price if latest_price_entry else 0, exact)
         positionDTO.latest_price_date = latest_price_entry.date if latest_price_entry else None
 
 
@@ -101,82 +193,218 @@ def _apply_fifo(session, positions: list[Position]) -> list[PositionDTO]:
 
         # --- Compute transactions amount --- 
 
+        transactions_amount = _amount(0, exact)
         for transaction in all_transactions: 
             if transaction.position_id == position.id:
-                if transaction.type in ('div'):
-                    positionDTO.transactions_amount += read_from_db(transaction.amount)
-                else:
-                    positionDTO.transactions_amount -= read_from_db(transaction.amount)
+                transactions_amount += _signed_transaction_amount(transaction, exact)
 
 
-        # --- Apply FIFO logic --- 
+        # --- Apply lot matching --- 
 
-        fifo_queue: deque = deque()
+        state = new_lot_matcher(lot_methods.get(position.account_id), exact)
         for current_trade in trades:
+            state.apply(current_trade.type, current_trade.quantity, _amount(current_trade.price, exact), current_trade.date)
+
+        _fill_from_state(positionDTO, state, latest_price, transactions_amount)
+
+        positionDTOs.append(positionDTO)
+
+    return positionDTOs
 
-            qty = current_trade.quantity
-            price = read_from_db(current_trade.price)
 
-            if current_trade.type == "buy":
-                
-                fifo_queue.append({"qty": qty, "cost_per_unit": price})
-                positionDTO.total_invested += qty * price
+# -----------------------
+# -- As-of checkpoints
+# -----------------------
+
+@dataclass
+class _PositionHistory:
+    """
+    Trades of one position with a lot matching checkpoint at the start of every month that has trades,
+    so the state as of any date replays at most one month of trades.
+    """
 
-                if len(fifo_queue) == 1:  # First Buy trade sets the opening date
-                    positionDTO.opening_date = current_trade.date
+    lot_method: str
+    exact: bool                          # prices and amounts in int micro-units (see Valuation modes)
+    trades: list[tuple]                  # (date, type, quantity, price) in date order
+    boundaries: list[datetime]           # checkpoint dates, ascending
+    checkpoints: list[tuple]             # (trades applied, LotMatcher) per boundary
+    transaction_dates: list[datetime]
+    transaction_totals: list[float]      # cumulative signed transaction amounts
 
-            else:  # Sell trade
+    def state_as_of(self, as_of: datetime) -> LotMatcher:
+        index = bisect_right(self.boundaries, as_of) - 1
+        applied, state = self.checkpoints[index] if index >= 0 else (0, None)
+        state = state.copy() if state else new_lot_matcher(self.lot_method, self.exact)
+        for date, trade_type, qty, price in self.trades[applied:]:
+            if date > as_of:
+                break
+            state.apply(trade_type, qty, price, date)
+        return state
 
-                sell_qty = qty
-                sell_price = price
+    def transactions_amount_as_of(self, as_of: datetime):
+        index = bisect_right(self.transaction_dates, as_of) - 1
+        return self.transaction_totals[index] if index >= 0 else _amount(0, self.exact)
 
-                while sell_qty > 0 and fifo_queue:
 
-                    oldest_lot = fifo_queue[0]
-                    matched_qty = min(oldest_lot["qty"], sell_qty)
+def _build_history(trades, transactions, lot_method: str, exact: bool = False) -> _PositionHistory:
 
-                    # Realized PnL from this matched chunk
-                    positionDTO.realized_pnl += matched_qty * (sell_price - oldest_lot["cost_per_unit"])
+    state = new_lot_matcher(lot_method, exact)
+    history = _PositionHistory(state.method, exact, [], [], [], [], [])
+    for trade in trades:
+        month_start = trade.date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        if history.trades and history.trades[-1][0] < month_start:
+            # First trade of a new month: snapshot the state of every trade before it
+            history.boundaries.append(month_start)
+            history.checkpoints.append((len(history.trades), state.copy()))
 
-                    # Reduce quantities
-                    oldest_lot["qty"] -= matched_qty
-                    sell_qty -= matched_qty
+        price = _amount(trade.price, exact)
+        history.trades.append((trade.date, trade.type, trade.quantity, price))
+        state.apply(trade.type, trade.quantity, price, trade.date)
 
+    total = _amount(0, exact)
+    for transaction in sorted(transactions, key=lambda t: t.date):
+        total += _signed_transaction_amount(transaction, exact)
+        history.transaction_dates.append(transaction.date)
+        history.transaction_totals.append(total)
 
-                    # Remove lot if fully consumed
-                    if oldest_lot["qty"] == 0:
-                        fifo_queue.popleft()
-                        positionDTO.closing_date = current_trade.date  # update closing date only when a lot is fully sold
+    return history
 
 
-        # --- Compute remaining quantity and cost basis ---
+def _estimate_history_size(entry) -> int:
+    _, history = entry
+    lots = sum(len(state.open_lots()) for _, state in history.checkpoints)
+    return 200 * len(history.trades) + 300 * len(history.checkpoints) + 250 * lots + 100 * len(history.transaction_dates)
 
-        for lot in fifo_queue:
-            positionDTO.remaining_quantity += lot["qty"]
-            positionDTO.remaining_cost_basis += lot["qty"] * lot["cost_per_unit"]
 
+_history_cache: Optional[LRUCache] = None
+_history_cache_lock = threading.Lock()
 
-        # --- PnL Calculations ---
 
-        current_value = positionDTO.remaining_quantity * positionDTO.latest_price
-        positionDTO.unrealized_pnl = current_value - positionDTO.remaining_cost_basis
+def get_history_cache() -> LRUCache:
+    global _history_cache
+    with _history_cache_lock:
+        if _history_cache is None:
+            _history_cache = LRUCache(get_cache_settings()["checkpoints_max_bytes"], _estimate_history_size)
+        return _history_cache
 
-        positionDTO.realized_pnl_percent = (positionDTO.realized_pnl / positionDTO.total_invested * 100) if positionDTO.total_invested > 0 else 0.0
-        positionDTO.unrealized_pnl_percent = (positionDTO.unrealized_pnl / positionDTO.remaining_cost_basis * 100) if positionDTO.remaining_cost_basis > 0 else 0.0
 
+def _get_position_histories(session, positions: list[Position]) -> dict[int, _PositionHistory]:
+    """Histories of the positions, rebuilt (in one batch) only for accounts written since they were cached."""
+
+    cache = get_history_cache()
+    versions = {account_id: get_account_version(session, account_id) for account_id in {p.account_id for p in positions}}
+    lot_methods = get_lot_methods(session)
+    exact = _is_exact()
+
+    histories, missing = {}, []
+    for position in positions:
+        cached = cache.get(position.id)
+        # Changing the lot method of an account bumps its version too
+        if cached is not None and cached[0] == versions[position.account_id] and cached[1].exact == exact:
+            histories[position.id] = cached[1]
+        else:
+            missing.append(position)
+
+    if missing:
+        position_ids = [position.id for position in missing]
+        trades_by_position, transactions_by_position = defaultdict(list), defaultdict(list)
+        for trade in get_trades_for_position_list(session, position_ids):
+            trades_by_position[trade.position_id].append(trade)
+        for transaction in get_transactions_for_position_list(session, position_ids):
+            transactions_by_position[transaction.position_id].append(transaction)
+
+        for position in missing:
+            history = _build_history(trades_by_position[position.id], transactions_by_position[position.id],
+                                     lot_methods.get(position.account_id), exact)
+            cache.put(position.id, (versions[position.account_id], history))
+            histories[position.id] = history
+
+    return histories
+
+
+def _apply_lot_matching_as_of(session, positions: list[Position], as_of: datetime) -> list[PositionDTO]:
+    """Same results as _apply_lot_matching on the trades and transactions up to as_of, valued at the close as of that date."""
+
+    histories = _get_position_histories(session, positions)
+    closes = get_closes_as_of(session, list({position.instrument_id for position in positions}), as_of)
+
+    positionDTOs = []
+    for position in positions:
+
+        history = histories[position.id]
+        if not history.trades or history.trades[0][0] > as_of:
+            continue  # not opened yet
+
+        positionDTO = _new_position_dto(position)
+
+        close = closes.get(position.instrument_id)
+        positionDTO.latest_price_date = close[0] if close else None
+
+        _fill_from_state(positionDTO, history.state_as_of(as_of), _amount(close[1] if close else 0, history.exact),
+                         history.transactions_amount_as_of(as_of))
 
         positionDTOs.append(positionDTO)
 
     return positionDTOs
 
 
-def get_positions_summary(session, account=None, include_closed=True, include_open=True):
+# -----------------------
+# -- Summary cache
+# -----------------------
+
+_summary_cache: Optional[LRUCache] = None
+_summary_cache_lock = threading.Lock()
+
+
+def _estimate_summary_size(positions: list[PositionDTO]) -> int:
+    if not positions:
+        return sys.getsizeof(positions)
+    sample = positions[0]
+    per_position = sys.getsizeof(sample) + sys.getsizeof(vars(sample)) + sum(sys.getsizeof(v) for v in vars(sample).values())
+    return sys.getsizeof(positions) + per_position * len(positions)
+
+
+def get_summary_cache() -> LRUCache:
+    global _summary_cache
+    with _summary_cache_lock:
+        if _summary_cache is None:
+            _summary_cache = LRUCache(get_cache_settings()["summary_max_bytes"], _estimate_summary_size)
+        return _summary_cache
+
+
+def get_positions_summary(session, account=None, include_closed=True, include_open=True, as_of=None):
     """
     Retrieve positions summary as a list of PositionDTO models.
+    Results are cached per account and status filter until a write touches that account.
+    With as_of (aware datetime) positions are valued as of that moment from the per-position checkpoints.
     """
 
+    if as_of is not None:
+        return _compute_positions_summary(session, account, include_closed, include_open, as_of)
+
+    account_id = account.id if account else None
+    scope = (account_id, include_closed, include_open)
+    key = scope + get_account_version(session, account_id) + (get_valuation_mode(),)
+
+    cache = get_summary_cache()
+    cached = cache.get(key)
+    if cached is None:
+        cached = _compute_positions_summary(session, account, include_closed, include_open)
+        # Older versions of the same scope can never be hit again
+        cache.invalidate(lambda k: k[:3] == scope and k != key)
+        cache.put(key, cached)
+
+    # Callers decorate the DTOs (e.g. base currency fields): hand out copies
+    return [replace(pos) for pos in cached]
+
+
+def _compute_positions_summary(session, account=None, include_closed=True, include_open=True, as_of=None):
+
     all_positions = get_all_positions(session, account)
-    positionsDTO = _apply_fifo(session, all_positions)
+    if as_of is None:
+        positionsDTO = _apply_lot_matching(session, all_positions)
+    else:
+        positionsDTO = _apply_lot_matching_as_of(session, all_positions, as_of)
 
     filtered_position_DTOs = []
     for pos in positionsDTO:
@@ -194,7 +422,6 @@ def get_positions_summary(session, account=None, include_closed=True, include_op
         else:
             pos.position_closed = "Closed on " + pos.closing_date.strftime("%Y-%m-%d")
 
-        pos.pnl = pos.realized_pnl + pos.unrealized_pnl + pos.transactions_amount
         pos.pnl_percent = (pos.pnl / pos.total_invested) if pos.total_invested > 0 else 0.0
 
     # Sort
@@ -207,28 +434,77 @@ def get_position_summary(session, position: Position):
         Retrieve positions summary as a pandas DataFrame.
     """
 
-    positionDTOs = _apply_fifo(session, [position])
+    positionDTOs = _apply_lot_matching(session, [position])
 
     p = positionDTOs[0]
 
-    # p.pnl = p.realized_pnl + p.unrealized_pnl
-    p.pnl = p.realized_pnl + p.unrealized_pnl + p.transactions_amount
     p.pnl_percent = ( p.pnl / p.total_invested ) if p.total_invested > 0 else 0.0
 
     return p
 
 
-def get_positions_totals(session, account=None, include_closed=True, include_open=True):
+def convert_positions_to_base(session, positions: list[PositionDTO], base_currency: str) -> list[PositionDTO]:
+    """
+    Fill the *_base fields of the given positions.
+    Rates are taken as of each position's latest price date, resolved in one batch.
+    """
+
+    dates = [pos.latest_price_date for pos in positions]
+    currencies = [pos.instrument_currency for pos in positions]
+
+    invested, rates = fx_service.convert_amounts(session, [pos.total_invested for pos in positions], currencies, base_currency, dates)
+    pnls, _ = fx_service.convert_amounts(session, [pos.pnl for pos in positions], currencies, base_currency, dates)
+
+    for pos, rate, total_invested_base, pnl_base in zip(positions, rates, invested, pnls):
+        pos.base_currency = base_currency
+        pos.fx_rate = rate
+        pos.total_invested_base = total_invested_base
+        pos.pnl_base = pnl_base
+
+    return positions
+
+
+def get_positions_totals(session, account=None, include_closed=True, include_open=True, base_currency=None, as_of=None):
     """
     Retrieve positions totals grouped by currency.
+    When base_currency is given, a single total converted into that currency is returned instead.
     """
     positions = get_positions_summary(
         session, 
         account=account, 
         include_closed=include_closed, 
-        include_open=include_open
+        include_open=include_open,
+        as_of=as_of
     )
-    
+
+    if base_currency:
+        convert_positions_to_base(session, positions, base_currency)
+
+        missing = sorted({pos.instrument_currency for pos in positions if pos.fx_rate is None})
+        if missing:
+            raise PortfolioException("positions_service", f"No FX rate available to convert {', '.join(missing)} into {base_currency}")
+
+        currency = Currency.from_code(base_currency)
+        return [
+            CurrencyTotalDTO(
+                currency=base_currency,
+                symbol=currency.symbol if currency else "",
+                total_invested=sum(pos.total_invested_base for pos in positions),
+                total_pnl=sum(pos.pnl_base for pos in positions)
+            )
+        ]
+
+    return totals_by_currency(positions)
+
+
+def totals_by_currency(positions: list[PositionDTO]) -> list[CurrencyTotalDTO]:
+    """
+    Sum invested amounts and PnL of the positions per instrument currency.
+    In micro valuation mode the exact micro-unit amounts of the positions are summed as ints,
+    and converted once per total.
+    """
+
+    exact = all(pos.pnl_micro is not None for pos in positions)
     totals_map = {}
     for pos in positions:
         curr = pos.instrument_currency
@@ -236,11 +512,20 @@ def get_positions_totals(session, account=None, include_closed=True, include_ope
             totals_map[curr] = CurrencyTotalDTO(
                 currency=curr,
                 symbol=pos.instrument_symbol,
-                total_invested=0.0,
-                total_pnl=0.0
+                total_invested=_amount(0, exact),
+                total_pnl=_amount(0, exact)
             )
-        
-        totals_map[curr].total_invested += pos.total_invested
-        totals_map[curr].total_pnl += pos.pnl
-    
+
+        if exact:
+            totals_map[curr].total_invested += pos.total_invested_micro
+            totals_map[curr].total_pnl += pos.pnl_micro
+        else:
+            totals_map[curr].total_invested += pos.total_invested
+            totals_map[curr].total_pnl += pos.pnl
+
+    if exact:
+        for total in totals_map.values():
+            total.total_invested = read_from_db(total.total_invested)
+            total.total_pnl = read_from_db(total.total_pnl)
+
     return list(totals_map.values())
\ No newline at end of file
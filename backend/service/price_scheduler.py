@@ -0,0 +1,204 @@
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from lib.database import get_session
+from lib.models import Instrument
+from lib.repo.instruments_repository import get_all_instruments
+from lib.repo.ohlcvs_repository import get_latest_timestamps
+from lib.settings_manager import get_scheduler_settings
+from logging_config import setup_logger
+from service.YahooFinanceService import refresh_history
+from service.close_matrix_service import refresh_close_matrix_after_ingestion
+from service.ohlcv_store_service import sync_ohlcv_store_after_ingestion
+from service.retention_service import apply_retention_after_refresh
+
+log = setup_logger(__name__)
+
+
+# -----------------------
+# -- DTO Models
+# -----------------------
+
+@dataclass
+class RefreshStatusDTO:
+    """Outcome of the last refresh of one instrument."""
+
+    instrument_id: int
+    ticker: str
+    last_run: Optional[datetime] = None
+    duration_seconds: float = 0.0
+    rows_inserted: int = 0
+    success: bool = True
+    message: str = ""
+
+
+# -----------------------
+# -- Scheduler
+# -----------------------
+
+class PriceRefreshScheduler:
+    """
+    Refresh stale instruments from Yahoo Finance in a background worker thread.
+    A single worker executes the runs, so they never overlap: triggers received
+    while a run is in progress are coalesced into one follow-up run.
+    """
+
+    def __init__(self, interval_minutes: float, stale_after_hours: float, lookback_days: int):
+        self.interval = timedelta(minutes=interval_minutes)
+        self.stale_after = timedelta(hours=stale_after_hours)
+        self.lookback = timedelta(days=lookback_days)
+
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        self.running = False
+        self.last_run_started: Optional[datetime] = None
+        self.last_run_duration: float = 0.0
+        self.runs = 0
+        self.coalesced_triggers = 0
+        self.instruments: dict[int, RefreshStatusDTO] = {}
+        self.last_retention = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._loop, name="price-refresh", daemon=True)
+        self._thread.start()
+        log.info(f"⏰ Price refresh scheduler started (every {self.interval})")
+
+    def stop(self, timeout: float = 10.0):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        log.info("⏰ Price refresh scheduler stopped")
+
+    def trigger(self) -> bool:
+        """Request a run now; returns False when it was coalesced with the run in progress."""
+        with self._lock:
+            if self.running:
+                self.coalesced_triggers += 1
+            self._wake.set()
+            return not self.running
+
+    def _loop(self):
+        # First run right after startup, then on the configured cadence
+        self._wake.set()
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval.total_seconds())
+            if self._stopping.is_set():
+                break
+            self._wake.clear()
+            try:
+                self.run_once()
+            except Exception:
+                log.exception("Price refresh run failed")
+
+    def _stale_instruments(self) -> list[tuple[Instrument, datetime]]:
+        now = datetime.now(timezone.utc)
+        with get_session() as session:
+            latest = get_latest_timestamps(session)
+            instruments = [instrument for instrument in get_all_instruments(session) if instrument.ticker]
+            session.expunge_all()
+
+        stale = []
+        for instrument in instruments:
+            last = latest.get(instrument.id)
+            if last is None:
+                stale.append((instrument, now - self.lookback))
+            elif now - last >= self.stale_after:
+                stale.append((instrument, last))
+        return stale
+
+    def run_once(self):
+        """Refresh every stale instrument, recording per-instrument status."""
+
+        with self._lock:
+            self.running = True
+            self.last_run_started = datetime.now(timezone.utc)
+        started = time.perf_counter()
+
+        refreshed = []
+        try:
+            for instrument, start_date in self._stale_instruments():
+                if self._stopping.is_set():
+                    break
+
+                status = RefreshStatusDTO(instrument.id, instrument.ticker, last_run=datetime.now(timezone.utc))
+                t0 = time.perf_counter()
+                try:
+                    status.rows_inserted = refresh_history(instrument, start_date)
+                    if status.rows_inserted:
+                        refreshed.append(instrument.id)
+                    status.message = f"Inserted {status.rows_inserted} rows since {start_date:%Y-%m-%d}"
+                except Exception as ex:
+                    status.success = False
+                    status.message = str(ex)
+                    log.error(f"Failed to refresh {instrument.ticker}: {ex}")
+                status.duration_seconds = time.perf_counter() - t0
+                self.instruments[instrument.id] = status
+
+            if refreshed:
+                refresh_close_matrix_after_ingestion()
+                sync_ohlcv_store_after_ingestion(refreshed)
+
+            if not self._stopping.is_set():
+                self.last_retention = apply_retention_after_refresh() or self.last_retention
+        finally:
+            with self._lock:
+                self.running = False
+                self.runs += 1
+                self.last_run_duration = time.perf_counter() - started
+
+        log.info(f"⏰ Price refresh run completed in {self.last_run_duration:.1f}s")
+
+    def status(self) -> dict:
+        return {
+            "running": self.running,
+            "interval_minutes": self.interval.total_seconds() / 60,
+            "stale_after_hours": self.stale_after.total_seconds() / 3600,
+            "last_run": self.last_run_started,
+            "last_run_duration_seconds": self.last_run_duration,
+            "runs": self.runs,
+            "coalesced_triggers": self.coalesced_triggers,
+            "instruments": [vars(status) for status in self.instruments.values()],
+            "last_retention": asdict(self.last_retention) if self.last_retention else None,
+        }
+
+
+_scheduler: Optional[PriceRefreshScheduler] = None
+
+
+def get_scheduler() -> Optional[PriceRefreshScheduler]:
+    return _scheduler
+
+
+def start_scheduler() -> Optional[PriceRefreshScheduler]:
+    """Start the scheduler when enabled in settings; used by the API lifespan."""
+    global _scheduler
+
+    settings = get_scheduler_settings()
+    if not settings["enabled"]:
+        log.info("⏰ Price refresh scheduler disabled in settings")
+        return None
+
+    _scheduler = PriceRefreshScheduler(
+        settings["interval_minutes"],
+        settings["stale_after_hours"],
+        settings["lookback_days"],
+    )
+    _scheduler.start()
+    return _scheduler
+
+
+def stop_scheduler():
+    global _scheduler
+    if _scheduler:
+        _scheduler.stop()
+        _scheduler = None
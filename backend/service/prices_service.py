@@ -9,10 +9,11 @@ class PriceDTO:
         self.price = price
         self.date = date
 
-def get_latest_prices_for_instrument_list(session, inst_ids: list[int]) -> list[PriceDTO]:
+def get_latest_prices_for_instrument_list(session, inst_ids: list[int], micro_units: bool = False) -> list[PriceDTO]:
+    """With micro_units the prices are left as stored (int micro-units)."""
 
     results = repo.get_latest_prices_for_instrument_list(session, inst_ids)
     price_dtos = []
     for instrument_id, price, date in results:
-        price_dtos.append(PriceDTO(instrument_id, read_from_db(price), date))
+        price_dtos.append(PriceDTO(instrument_id, price if micro_units else read_from_db(price), date))
     return price_dtos
\ No newline at end of file
@@ -0,0 +1,193 @@
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from itertools import groupby
+from typing import Optional
+
+from lib.database import get_raw_connection, get_session
+from lib.repo.ohlcvs_repository import get_bars_before, get_instrument_ids_with_bars_before, get_ohlcv_rows, replace_bars
+from lib.settings_manager import get_retention_settings
+from logging_config import setup_logger
+from service.close_matrix_service import refresh_close_matrix_after_ingestion
+from service.custom_exceptions import PortfolioException
+from service.maintenance_service import VACUUM_MODES, database_file_bytes, used_bytes, vacuum
+from service.ohlcv_store_service import sync_ohlcv_store_after_ingestion
+
+log = setup_logger(__name__)
+
+DAILY_GRANULARITY = "1d"
+INTRADAY_GRANULARITIES = ("1m", "2m", "5m", "15m", "30m", "60m", "90m", "1h")
+
+
+# ==========================================================
+# Intraday bar retention
+# ==========================================================
+#
+# Intraday bars older than keep_days (per granularity, counted in whole UTC days) are
+# compacted into daily bars: first open, highest high, lowest low, last close, summed
+# volume, dated with the first bar of the day. A day that already has a daily bar keeps
+# it, the provider's bar being authoritative. Every series is processed oldest first in
+# chunks of whole days, each chunk in its own transaction (daily bars written and intraday
+# bars deleted together), so the write lock is never held for long and an interrupted
+# run simply resumes where it stopped.
+
+
+# -----------------------
+# -- DTO Models
+# -----------------------
+
+@dataclass
+class GranularityRetentionDTO:
+    granularity: str
+    keep_days: int
+    cutoff: datetime
+    instruments: int = 0
+    chunks: int = 0
+    bars_deleted: int = 0
+    daily_bars_written: int = 0
+
+
+@dataclass
+class RetentionReportDTO:
+    """reclaimed_bytes is what the deletes freed inside the file; the file itself only shrinks on vacuum."""
+
+    granularities: list[GranularityRetentionDTO] = field(default_factory=list)
+    bars_deleted: int = 0
+    daily_bars_written: int = 0
+    reclaimed_bytes: int = 0
+    vacuum: Optional[str] = None
+    file_bytes_before: int = 0
+    file_bytes_after: int = 0
+    seconds: float = 0.0
+
+
+def _day_start(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+
+def _daily_bars(instrument_id: int, rows, existing_days: set[date]) -> list[dict]:
+    """One daily bar (OHLCV column dicts, values as stored) per UTC day of the rows without one yet."""
+
+    values = []
+    for day, bars in groupby(rows, key=lambda row: row.timestamp.date()):
+        if day in existing_days:
+            continue
+        bars = list(bars)
+        lows = [bar.low for bar in bars if bar.low]  # 0 stands for a missing value
+        values.append({
+            "instrument_id": instrument_id,
+            "timestamp": bars[0].timestamp,
+            "granularity": DAILY_GRANULARITY,
+            "open": bars[0].open,
+            "high": max(bar.high or 0 for bar in bars),
+            "low": min(lows) if lows else 0,
+            "close": bars[-1].close,
+            "volume": sum(bar.volume or 0 for bar in bars),
+        })
+    return values
+
+
+def _compact_series(session, instrument_id: int, stats: GranularityRetentionDTO, chunk_size: int):
+
+    while True:
+        with session.begin():
+            rows = get_bars_before(session, instrument_id, stats.granularity, stats.cutoff, chunk_size)
+            if not rows:
+                return
+
+            if len(rows) == chunk_size:
+                # Whole days only: the last day may go on in the next chunk
+                last_day = rows[-1].timestamp.date()
+                complete = [row for row in rows if row.timestamp.date() != last_day]
+                if complete:
+                    rows = complete
+                else:  # a single day longer than a chunk
+                    rows = get_bars_before(session, instrument_id, stats.granularity,
+                                           min(_day_start(last_day + timedelta(days=1)), stats.cutoff))
+
+            first_day, last_day = rows[0].timestamp.date(), rows[-1].timestamp.date()
+            existing_days = {
+                row.timestamp.date()
+                for row in get_ohlcv_rows(session, instrument_id, DAILY_GRANULARITY,
+                                          start=_day_start(first_day), end=_day_start(last_day + timedelta(days=1)))
+            }
+            values = _daily_bars(instrument_id, rows, existing_days)
+            stats.bars_deleted += replace_bars(session, instrument_id, [row.id for row in rows], values)
+            stats.daily_bars_written += len(values)
+            stats.chunks += 1
+
+
+def apply_retention(keep_days: Optional[dict] = None, chunk_size: Optional[int] = None,
+                    vacuum_mode: Optional[str] = None, now: Optional[datetime] = None) -> RetentionReportDTO:
+    """Compact the intraday bars past their retention; arguments left None come from the retention settings."""
+
+    settings = get_retention_settings()
+    keep_days = settings["keep_days"] if keep_days is None else keep_days
+    chunk_size = int(chunk_size or settings["chunk_size"])
+    vacuum_mode = vacuum_mode or settings["vacuum"]
+
+    for granularity, days in keep_days.items():
+        if granularity not in INTRADAY_GRANULARITIES:
+            raise PortfolioException("retention", f"{granularity} is not an intraday granularity ({', '.join(INTRADAY_GRANULARITIES)})")
+        if int(days) < 1:
+            raise PortfolioException("retention", f"Retention of {granularity} bars must be at least one day")
+    if vacuum_mode is not None and vacuum_mode not in VACUUM_MODES:
+        raise PortfolioException("retention", f"Unknown vacuum mode {vacuum_mode!r}, expected one of {', '.join(VACUUM_MODES)}")
+
+    today = (now or datetime.now(timezone.utc)).astimezone(timezone.utc).date()
+    report = RetentionReportDTO(file_bytes_before=database_file_bytes())
+    started = time.perf_counter()
+
+    raw = get_raw_connection()
+    try:
+        used_before = used_bytes(raw.driver_connection)
+    finally:
+        raw.close()
+
+    touched = set()
+    with get_session() as session:
+        for granularity, days in keep_days.items():
+            stats = GranularityRetentionDTO(granularity, int(days), _day_start(today - timedelta(days=int(days))))
+            with session.begin():
+                instrument_ids = get_instrument_ids_with_bars_before(session, granularity, stats.cutoff)
+            for instrument_id in instrument_ids:
+                _compact_series(session, instrument_id, stats, chunk_size)
+            stats.instruments = len(instrument_ids)
+            touched.update(instrument_ids)
+
+            report.granularities.append(stats)
+            report.bars_deleted += stats.bars_deleted
+            report.daily_bars_written += stats.daily_bars_written
+            log.info(f"🗜️ {granularity}: {stats.bars_deleted:,} bars before {stats.cutoff:%Y-%m-%d} compacted into "
+                     f"{stats.daily_bars_written:,} daily bars ({stats.instruments} instruments, {stats.chunks} chunks)")
+
+    raw = get_raw_connection()
+    try:
+        connection = raw.driver_connection
+        report.reclaimed_bytes = used_before - used_bytes(connection)
+        if vacuum_mode and report.bars_deleted:
+            report.vacuum = vacuum(connection, vacuum_mode)
+    finally:
+        raw.close()
+
+    if touched:
+        refresh_close_matrix_after_ingestion()
+        sync_ohlcv_store_after_ingestion(sorted(touched))
+
+    report.file_bytes_after = database_file_bytes()
+    report.seconds = round(time.perf_counter() - started, 3)
+    log.info(f"🗜️ Retention: {report.bars_deleted:,} intraday bars removed, {report.reclaimed_bytes / 1024:,.0f} KB reclaimed, "
+             f"file {report.file_bytes_before / 1024:,.0f} KB -> {report.file_bytes_after / 1024:,.0f} KB in {report.seconds:.1f}s")
+    return report
+
+
+def apply_retention_after_refresh() -> Optional[RetentionReportDTO]:
+    """Hook for the price refresh scheduler: runs when enabled, and a failure must never fail the refresh."""
+
+    if not get_retention_settings()["enabled"]:
+        return None
+    try:
+        return apply_retention()
+    except Exception:
+        log.exception("Intraday bar retention failed")
+        return None
@@ -0,0 +1,378 @@
+import threading
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from typing import Optional
+
+import numpy as np
+
+from lib.data_version import get_data_version
+from lib.database import read_from_db
+from lib.repo.ohlcvs_repository import get_closes_for_instrument_list
+from lib.repo.positions_repository import get_all_positions
+from lib.repo.trades_repository import get_trades_for_position_list
+from lib.repo.transactions_repository import get_transactions_for_position_list
+from lib.settings_manager import get_base_currency
+from logging_config import setup_logger
+from service import fx_service
+
+log = setup_logger(__name__)
+
+DAYS_PER_YEAR = 365.0
+DAILY_GRANULARITY = "1d"
+
+
+# -----------------------
+# -- DTO Models
+# -----------------------
+
+@dataclass
+class ReturnDTO:
+    """Money-weighted (XIRR) and time-weighted returns of a position or an account."""
+
+    position_id: Optional[int] = None
+    account_id: Optional[int] = None
+    instrument_ticker: str = ""
+    currency: str = ""
+    xirr: Optional[float] = None
+    twr: Optional[float] = None
+    twr_annualized: Optional[float] = None
+    first_date: Optional[date] = None
+    last_date: Optional[date] = None
+
+
+@dataclass
+class DailyValuations:
+    """
+    Dense (positions x days) valuation grid.
+        quantities: held quantity at the end of each day
+        closes: forward-filled daily close of the position's instrument
+        values: quantities * closes
+        flows: cash put into the position by trades on each day (buys positive, sells negative)
+        income: dividends net of fees and taxes paid on each day
+    """
+
+    days: np.ndarray
+    position_ids: list[int] = field(default_factory=list)
+    account_ids: list[int] = field(default_factory=list)
+    instrument_ids: list[int] = field(default_factory=list)
+    instrument_tickers: list[str] = field(default_factory=list)
+    currencies: list[str] = field(default_factory=list)
+    quantities: np.ndarray = None
+    closes: np.ndarray = None
+    values: np.ndarray = None
+    flows: np.ndarray = None
+    income: np.ndarray = None
+
+
+# -----------------------
+# -- Daily valuations
+# -----------------------
+
+def _day(dt: datetime) -> int:
+    return dt.astimezone(timezone.utc).date().toordinal()
+
+
+def build_daily_valuations(session, positions) -> DailyValuations:
+    """Build the valuation grid of all given positions with one query per table."""
+
+    position_ids = [position.id for position in positions]
+    instrument_ids = sorted({position.instrument_id for position in positions})
+
+    trades = get_trades_for_position_list(session, position_ids) if positions else []
+    transactions = get_transactions_for_position_list(session, position_ids) if positions else []
+    closes = get_closes_for_instrument_list(session, instrument_ids, DAILY_GRANULARITY) if positions else []
+
+    all_days = [_day(trade.date) for trade in trades]
+    all_days += [_day(transaction.date) for transaction in transactions]
+    all_days += [_day(timestamp) for _, timestamp, _ in closes]
+    days = np.unique(np.asarray(all_days, dtype=np.int64))
+
+    grid = DailyValuations(
+        days=days,
+        position_ids=position_ids,
+        account_ids=[position.account_id for position in positions],
+        instrument_ids=[position.instrument_id for position in positions],
+        instrument_tickers=[position.instrument.ticker or position.instrument.name for position in positions],
+        currencies=[position.instrument.currency.name for position in positions],
+    )
+
+    n_pos, n_days = len(positions), len(days)
+    pos_index = {position_id: i for i, position_id in enumerate(position_ids)}
+    inst_index = {instrument_id: i for i, instrument_id in enumerate(instrument_ids)}
+
+    # --- Forward-filled closes per instrument ---
+
+    inst_closes = np.full((len(instrument_ids), n_days), np.nan)
+    if closes:
+        rows = np.fromiter((inst_index[instrument_id] for instrument_id, _, _ in closes), dtype=np.int64, count=len(closes))
+        cols = np.searchsorted(days, [_day(timestamp) for _, timestamp, _ in closes])
+        inst_closes[rows, cols] = [read_from_db(close) if close else np.nan for _, _, close in closes]
+
+    if n_days:
+        idx = np.where(np.isnan(inst_closes), 0, np.arange(n_days))
+        np.maximum.accumulate(idx, axis=1, out=idx)
+        inst_closes = np.take_along_axis(inst_closes, idx, axis=1)
+        # Leading gaps (trades before the first stored close) use the first known close
+        first = np.argmax(~np.isnan(inst_closes), axis=1)
+        first_close = inst_closes[np.arange(len(instrument_ids)), first]
+        inst_closes = np.where(np.isnan(inst_closes), first_close[:, None], inst_closes)
+
+    grid.closes = inst_closes[[inst_index[instrument_id] for instrument_id in grid.instrument_ids]] if n_pos else np.zeros((0, n_days))
+
+    # --- Quantities, trade flows and income ---
+
+    qty_deltas = np.zeros((n_pos, n_days))
+    grid.flows = np.zeros((n_pos, n_days))
+    grid.income = np.zeros((n_pos, n_days))
+
+    if trades:
+        rows = [pos_index[trade.position_id] for trade in trades]
+        cols = np.searchsorted(days, [_day(trade.date) for trade in trades])
+        signs = np.array([1.0 if trade.type == "buy" else -1.0 for trade in trades])
+        qty = np.array([trade.quantity for trade in trades], dtype=np.float64) * signs
+        np.add.at(qty_deltas, (rows, cols), qty)
+        np.add.at(grid.flows, (rows, cols), qty * [read_from_db(trade.price) for trade in trades])
+
+    if transactions:
+        rows = [pos_index[transaction.position_id] for transaction in transactions]
+        cols = np.searchsorted(days, [_day(transaction.date) for transaction in transactions])
+        amounts = [
+            read_from_db(transaction.amount) if transaction.type == "div" else -read_from_db(transaction.amount)
+            for transaction in transactions
+        ]
+        np.add.at(grid.income, (rows, cols), amounts)
+
+    grid.quantities = np.cumsum(qty_deltas, axis=1)
+    grid.values = np.nan_to_num(grid.quantities * grid.closes)
+
+    return grid
+
+
+# -----------------------
+# -- Solvers
+# -----------------------
+
+def _compact(cash_flows: np.ndarray, days: np.ndarray):
+    """Turn a sparse (series x days) cash-flow matrix into padded (series x max flows) arrays."""
+
+    rows, cols = np.nonzero(cash_flows)
+    counts = np.bincount(rows, minlength=cash_flows.shape[0])
+    width = max(int(counts.max()) if counts.size else 0, 1)
+
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    amounts = np.zeros((cash_flows.shape[0], width))
+    flow_days = np.zeros((cash_flows.shape[0], width))
+    amounts[rows, offsets] = cash_flows[rows, cols]
+    flow_days[rows, offsets] = days[cols]
+
+    first_day = np.where(counts > 0, flow_days[:, 0], 0)
+    years = np.where(amounts != 0, (flow_days - first_day[:, None]) / DAYS_PER_YEAR, 0.0)
+    return amounts, years
+
+
+def _npv(amounts, years, rates):
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        return (amounts * (1.0 + rates)[:, None] ** -years).sum(axis=1)
+
+
+def solve_xirr(amounts: np.ndarray, years: np.ndarray, max_iter: int = 50, tol: float = 1e-9) -> np.ndarray:
+    """
+    Solve XIRR for every row at once: vectorized Newton, then bisection for the rows Newton did not settle.
+    Rows without both a positive and a negative flow have no solution and return NaN.
+    """
+
+    n = amounts.shape[0]
+    solvable = (amounts > 0).any(axis=1) & (amounts < 0).any(axis=1)
+    scale = np.abs(amounts).sum(axis=1) + 1e-12
+    rates = np.full(n, 0.1)
+
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        for _ in range(max_iter):
+            discount = (1.0 + rates)[:, None] ** -years
+            npv = (amounts * discount).sum(axis=1)
+            dnpv = (-years * amounts * discount).sum(axis=1) / (1.0 + rates)
+            step = np.where(np.isfinite(dnpv) & (dnpv != 0), npv / dnpv, 0.0)
+            rates = np.clip(rates - step, -0.9999, 1e6)
+            if np.all(np.abs(step[solvable]) < tol):
+                break
+
+        npv = _npv(amounts, years, rates)
+        pending = solvable & ~(np.isfinite(npv) & (np.abs(npv) <= 1e-7 * scale))
+
+        if pending.any():
+            a, y = amounts[pending], years[pending]
+            lo = np.full(a.shape[0], -0.9999)
+            hi = np.full(a.shape[0], 100.0)
+            f_lo = _npv(a, y, lo)
+            bracketed = np.sign(f_lo) != np.sign(_npv(a, y, hi))
+            for _ in range(200):
+                mid = (lo + hi) / 2.0
+                f_mid = _npv(a, y, mid)
+                same = np.sign(f_mid) == np.sign(f_lo)
+                lo = np.where(same, mid, lo)
+                f_lo = np.where(same, f_mid, f_lo)
+                hi = np.where(same, hi, mid)
+            rates[pending] = np.where(bracketed, (lo + hi) / 2.0, np.nan)
+
+    rates[~solvable] = np.nan
+    return rates
+
+
+def daily_returns(values: np.ndarray, flows: np.ndarray, income: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Daily returns of every row, r_t = (V_t + I_t - V_t-1 - F_t) / (V_t-1 + max(F_t, 0)),
+    and the mask of the days with capital at work (the others have r_t = 0).
+    """
+
+    previous = np.zeros_like(values)
+    previous[:, 1:] = values[:, :-1]
+    denominator = previous + np.maximum(flows, 0.0)
+    invested = denominator > 0
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        daily = np.where(invested, (values + income - previous - flows) / denominator, 0.0)
+    return daily, invested
+
+
+def compute_twr(values: np.ndarray, flows: np.ndarray, income: np.ndarray, days: np.ndarray):
+    """
+    Chain daily returns of every row: r_t = (V_t + I_t - V_t-1 - F_t) / (V_t-1 + max(F_t, 0)).
+    Returns cumulative and annualized TWR (NaN for rows without activity).
+    """
+
+    daily, _ = daily_returns(values, flows, income)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        twr = np.prod(1.0 + daily, axis=1) - 1.0
+
+        active = (values != 0) | (flows != 0)
+        has_activity = active.any(axis=1)
+        first = np.argmax(active, axis=1)
+        last = active.shape[1] - 1 - np.argmax(active[:, ::-1], axis=1)
+        span = (days[last] - days[first]) / DAYS_PER_YEAR
+        annualized = np.where(span > 0, np.power(np.maximum(1.0 + twr, 0.0), 1.0 / np.where(span > 0, span, 1.0)) - 1.0, twr)
+
+    twr[~has_activity] = np.nan
+    annualized[~has_activity] = np.nan
+    return twr, annualized
+
+
+# -----------------------
+# -- Service
+# -----------------------
+
+_cache_lock = threading.Lock()
+_cache = {}
+
+
+def _none_if_nan(value) -> Optional[float]:
+    return None if value is None or not np.isfinite(value) else float(value)
+
+
+def _to_base(session, grid: DailyValuations, base_currency: Optional[str]) -> np.ndarray:
+    """Per-position factor converting amounts into the base currency (latest rate); NaN when unknown."""
+
+    if not base_currency:
+        return np.ones(len(grid.position_ids))
+    _, rates = fx_service.convert_amounts(session, [1.0] * len(grid.currencies), grid.currencies, base_currency)
+    return np.array([rate if rate is not None else np.nan for rate in rates], dtype=np.float64)
+
+
+def account_membership(session, grid: DailyValuations, account_ids: list[int], base_currency: Optional[str]) -> np.ndarray:
+    """
+    (accounts x positions) matrix summing position series into account series in the base currency.
+    Positions without an FX rate into the base currency are left out.
+    """
+
+    factors = _to_base(session, grid, base_currency)
+    missing = np.isnan(factors)
+    if missing.any():
+        log.warning(f"⚠️ {int(missing.sum())} positions without FX rate into {base_currency} excluded from account figures")
+
+    membership = np.zeros((len(account_ids), len(grid.position_ids)))
+    account_index = {account_id: i for i, account_id in enumerate(account_ids)}
+    for i, account_id in enumerate(grid.account_ids):
+        if not missing[i]:
+            membership[account_index[account_id], i] = factors[i]
+    return membership
+
+
+def compute_returns(session, account=None) -> dict:
+    """
+    Compute XIRR and TWR for every position and every account in one vectorized pass.
+    Account figures are aggregated in the base currency from settings.
+    """
+
+    positions = get_all_positions(session, account)
+    grid = build_daily_valuations(session, positions)
+    days = grid.days
+    account_ids = sorted(set(grid.account_ids))
+
+    if not days.size:
+        return {
+            "positions": [ReturnDTO(position_id=position.id, account_id=position.account_id) for position in positions],
+            "accounts": [ReturnDTO(account_id=account_id) for account_id in account_ids],
+        }
+
+    # Investor perspective cash flows: money in is negative, income and final market value are positive
+    cash_flows = grid.income - grid.flows
+    cash_flows[:, -1] += grid.values[:, -1]
+
+    # --- Accounts: aggregate positions converted into the base currency ---
+
+    base_currency = get_base_currency()
+    membership = account_membership(session, grid, account_ids, base_currency)
+
+    series_cash_flows = np.vstack([cash_flows, membership @ cash_flows])
+    series_values = np.vstack([grid.values, membership @ grid.values])
+    series_flows = np.vstack([grid.flows, membership @ grid.flows])
+    series_income = np.vstack([grid.income, membership @ grid.income])
+
+    amounts, years = _compact(series_cash_flows, days)
+    xirr = solve_xirr(amounts, years)
+    twr, twr_annualized = compute_twr(series_values, series_flows, series_income, days)
+
+    active = (series_values != 0) | (series_flows != 0)
+    first = np.argmax(active, axis=1)
+    last = active.shape[1] - 1 - np.argmax(active[:, ::-1], axis=1)
+
+    def _dto(i, **kwargs):
+        has_activity = active[i].any()
+        return ReturnDTO(
+            xirr=_none_if_nan(xirr[i]),
+            twr=_none_if_nan(twr[i]),
+            twr_annualized=_none_if_nan(twr_annualized[i]),
+            first_date=date.fromordinal(int(days[first[i]])) if has_activity else None,
+            last_date=date.fromordinal(int(days[last[i]])) if has_activity else None,
+            **kwargs
+        )
+
+    position_returns = [
+        _dto(i, position_id=position_id, account_id=grid.account_ids[i],
+             instrument_ticker=grid.instrument_tickers[i], currency=grid.currencies[i])
+        for i, position_id in enumerate(grid.position_ids)
+    ]
+    account_returns = [
+        _dto(len(grid.position_ids) + i, account_id=account_id, currency=base_currency or "")
+        for i, account_id in enumerate(account_ids)
+    ]
+
+    return {"positions": position_returns, "accounts": account_returns}
+
+
+def get_returns(session, account=None) -> dict:
+    """Cached compute_returns(), keyed on the data version."""
+
+    key = (account.id if account else None, get_base_currency())
+    version = get_data_version(session)
+
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and cached[0] == version:
+            return cached[1]
+
+    result = compute_returns(session, account)
+
+    with _cache_lock:
+        _cache[key] = (version, result)
+    return result
@@ -0,0 +1,178 @@
+import sys
+import threading
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Optional
+
+import numpy as np
+
+from lib.data_version import get_data_version
+from lib.lru_cache import LRUCache
+from lib.repo.positions_repository import get_all_positions
+from lib.settings_manager import get_base_currency, get_cache_settings
+from logging_config import setup_logger
+from service.returns_service import account_membership, build_daily_valuations, daily_returns
+
+log = setup_logger(__name__)
+
+TRADING_DAYS_PER_YEAR = 252
+DEFAULT_CONFIDENCE = 0.95
+
+
+# -----------------------
+# -- DTO Models
+# -----------------------
+
+@dataclass
+class RiskDTO:
+    """
+    Risk figures of a position or an account from its daily returns.
+    VaR figures are one-day losses at the given confidence, as a fraction of the value
+    and as an amount on the latest value (positive numbers are losses).
+    """
+
+    position_id: Optional[int] = None
+    account_id: Optional[int] = None
+    instrument_ticker: str = ""
+    currency: str = ""
+    observations: int = 0
+    confidence: float = DEFAULT_CONFIDENCE
+    volatility: Optional[float] = None
+    max_drawdown: Optional[float] = None
+    var_historical: Optional[float] = None
+    var_parametric: Optional[float] = None
+    var_historical_amount: Optional[float] = None
+    var_parametric_amount: Optional[float] = None
+    latest_value: float = 0.0
+
+
+# -----------------------
+# -- Metrics
+# -----------------------
+
+def _none_if_nan(value) -> Optional[float]:
+    return None if value is None or not np.isfinite(value) else float(value)
+
+
+def max_drawdown(returns: np.ndarray) -> np.ndarray:
+    """Largest peak-to-trough fall of the wealth index of every row, as a negative fraction."""
+
+    wealth = np.cumprod(1.0 + returns, axis=1)
+    peaks = np.maximum.accumulate(np.maximum(wealth, 1.0), axis=1)
+    return (wealth / peaks - 1.0).min(axis=1, initial=0.0)
+
+
+def compute_risk_metrics(returns: np.ndarray, invested: np.ndarray, confidence: float) -> dict[str, np.ndarray]:
+    """
+    Volatility, drawdown and VaR of every row at once; only the invested days are observations.
+    Rows with fewer than two observations get NaN.
+    """
+
+    observed = np.where(invested, returns, np.nan)
+    observations = invested.sum(axis=1)
+    enough = observations >= 2
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.nanmean(observed[enough], axis=1) if enough.any() else np.empty(0)
+        std = np.nanstd(observed[enough], axis=1, ddof=1) if enough.any() else np.empty(0)
+        quantile = np.nanpercentile(observed[enough], (1.0 - confidence) * 100, axis=1) if enough.any() else np.empty(0)
+
+    z = NormalDist().inv_cdf(1.0 - confidence)
+    metrics = {name: np.full(returns.shape[0], np.nan) for name in ("volatility", "var_historical", "var_parametric")}
+    metrics["volatility"][enough] = std * np.sqrt(TRADING_DAYS_PER_YEAR)
+    metrics["var_historical"][enough] = -quantile
+    metrics["var_parametric"][enough] = -(mean + z * std)
+    metrics["max_drawdown"] = np.where(observations > 0, max_drawdown(returns), np.nan)
+    metrics["observations"] = observations
+    return metrics
+
+
+def compute_risk(session, account=None, confidence: float = DEFAULT_CONFIDENCE) -> dict:
+    """
+    Compute risk figures for every position and every account in one vectorized pass over
+    the daily valuation grid. Account figures are aggregated in the base currency from settings.
+    """
+
+    positions = get_all_positions(session, account)
+    grid = build_daily_valuations(session, positions)
+    account_ids = sorted(set(grid.account_ids))
+
+    if not grid.days.size:
+        return {
+            "positions": [RiskDTO(position_id=position.id, account_id=position.account_id, confidence=confidence) for position in positions],
+            "accounts": [RiskDTO(account_id=account_id, confidence=confidence) for account_id in account_ids],
+        }
+
+    base_currency = get_base_currency()
+    membership = account_membership(session, grid, account_ids, base_currency)
+
+    series_values = np.vstack([grid.values, membership @ grid.values])
+    series_flows = np.vstack([grid.flows, membership @ grid.flows])
+    series_income = np.vstack([grid.income, membership @ grid.income])
+
+    returns, invested = daily_returns(series_values, series_flows, series_income)
+    metrics = compute_risk_metrics(returns, invested, confidence)
+    latest_values = series_values[:, -1]
+
+    def _dto(i, **kwargs):
+        return RiskDTO(
+            observations=int(metrics["observations"][i]),
+            confidence=confidence,
+            volatility=_none_if_nan(metrics["volatility"][i]),
+            max_drawdown=_none_if_nan(metrics["max_drawdown"][i]),
+            var_historical=_none_if_nan(metrics["var_historical"][i]),
+            var_parametric=_none_if_nan(metrics["var_parametric"][i]),
+            var_historical_amount=_none_if_nan(metrics["var_historical"][i] * latest_values[i]),
+            var_parametric_amount=_none_if_nan(metrics["var_parametric"][i] * latest_values[i]),
+            latest_value=float(latest_values[i]),
+            **kwargs
+        )
+
+    position_risks = [
+        _dto(i, position_id=position_id, account_id=grid.account_ids[i],
+             instrument_ticker=grid.instrument_tickers[i], currency=grid.currencies[i])
+        for i, position_id in enumerate(grid.position_ids)
+    ]
+    account_risks = [
+        _dto(len(grid.position_ids) + i, account_id=account_id, currency=base_currency or "")
+        for i, account_id in enumerate(account_ids)
+    ]
+
+    return {"positions": position_risks, "accounts": account_risks}
+
+
+# -----------------------
+# -- Service
+# -----------------------
+
+_cache: Optional[LRUCache] = None
+_cache_lock = threading.Lock()
+
+
+def _estimate_size(result: dict) -> int:
+    risks = result["positions"] + result["accounts"]
+    per_risk = sys.getsizeof(risks[0]) + sys.getsizeof(vars(risks[0])) + 32 * len(vars(risks[0])) if risks else 0
+    return sys.getsizeof(result) + per_risk * len(risks)
+
+
+def get_risk_cache() -> LRUCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LRUCache(get_cache_settings()["risk_max_bytes"], _estimate_size)
+        return _cache
+
+
+def get_risk(session, account=None, confidence: float = DEFAULT_CONFIDENCE) -> dict:
+    """Cached compute_risk(), keyed on the data version; the LRU bounds the distinct confidence levels kept."""
+
+    scope = (account.id if account else None, confidence, get_base_currency())
+    key = scope + (get_data_version(session),)
+
+    cache = get_risk_cache()
+    result = cache.get(key)
+    if result is None:
+        result = compute_risk(session, account, confidence)
+        cache.invalidate(lambda k: k[:3] == scope and k != key)
+        cache.put(key, result)
+    return result
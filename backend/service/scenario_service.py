@@ -0,0 +1,207 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+
+from lib.repo.instruments_repository import get_instrument_categories
+from lib.settings_manager import get_base_currency
+from logging_config import setup_logger
+from service.custom_exceptions import PortfolioException
+from service.positions_service import convert_positions_to_base, get_positions_summary
+
+log = setup_logger(__name__)
+
+
+# -----------------------
+# -- DTO Models
+# -----------------------
+
+@dataclass
+class PriceShock:
+    """Relative price change (-0.2 = -20%) of the positions matching every selector given."""
+
+    change: float
+    currency: Optional[str] = None
+    category: Optional[str] = None
+    ticker: Optional[str] = None
+
+
+@dataclass
+class FxShock:
+    """Relative change of an FX pair: EURUSD +0.05 means 1 EUR buys 5% more USD."""
+
+    pair: str
+    change: float
+
+
+@dataclass
+class Scenario:
+    name: str
+    shocks: list[PriceShock] = field(default_factory=list)
+    fx_shocks: list[FxShock] = field(default_factory=list)
+
+
+@dataclass
+class ScenarioTotalDTO:
+    currency: str = ""
+    market_value: float = 0.0
+    pnl: float = 0.0
+    delta_pnl: float = 0.0
+
+
+@dataclass
+class ScenarioResultDTO:
+    """Totals per instrument currency, and in the base currency when one is configured."""
+
+    name: str = ""
+    totals: list[ScenarioTotalDTO] = field(default_factory=list)
+    base_currency: str = ""
+    market_value_base: Optional[float] = None
+    pnl_base: Optional[float] = None
+    delta_pnl_base: Optional[float] = None
+
+
+# -----------------------
+# -- Engine
+# -----------------------
+
+def _parse_pair(pair: str) -> tuple[str, str]:
+    code = pair.strip().upper().replace("/", "").removesuffix("=X")
+    if len(code) != 6 or not code.isalpha():
+        raise PortfolioException("scenario_service", f"Invalid FX pair {pair!r}, expected e.g. EURUSD or EUR/USD")
+    return code[:3], code[3:]
+
+
+def _parse_fx_shocks(scenarios: list[Scenario], base_currency: Optional[str]) -> dict[str, tuple[str, str]]:
+    """
+    {pair as given: (base, quote)} of every FX shock. Shocks only move values through the conversion
+    into the base currency: a pair without it would silently change nothing, so it is rejected.
+    """
+
+    pairs = {}
+    for scenario in scenarios:
+        for shock in scenario.fx_shocks:
+            if shock.pair in pairs:
+                continue
+            pair = _parse_pair(shock.pair)
+            if not base_currency:
+                raise PortfolioException("scenario_service", f"FX shock {shock.pair!r} needs a base currency (app.base_currency)")
+            if base_currency not in pair or pair[0] == pair[1]:
+                raise PortfolioException("scenario_service", f"FX shock {shock.pair!r} must pair {base_currency} with another currency")
+            pairs[shock.pair] = pair
+    return pairs
+
+
+def _log_multipliers(n_scenarios: int, entries: tuple[list, list, list], masks: list[np.ndarray]) -> np.ndarray:
+    """
+    exp(A @ M): A (scenarios x selectors) holds the summed log changes of each scenario per selector,
+    M (selectors x positions) the selector masks (signed for FX), so matching shocks compound.
+    """
+
+    scenario_indexes, selector_indexes, changes = entries
+    weights = np.zeros((n_scenarios, len(masks)))
+    np.add.at(weights, (scenario_indexes, selector_indexes), np.log1p(changes))
+    return np.exp(weights @ np.vstack(masks))
+
+
+def run_scenarios(session, scenarios: list[Scenario], account=None) -> list[ScenarioResultDTO]:
+    """
+    Evaluate every scenario against the current positions in one pass.
+    Only market values move: PnL changes by the shocked minus current value of the remaining quantities.
+    """
+
+    base_currency = get_base_currency()
+    pairs = _parse_fx_shocks(scenarios, base_currency)
+
+    positions = get_positions_summary(session, account=account)
+    if base_currency:
+        convert_positions_to_base(session, positions, base_currency)
+        missing = sorted({pos.instrument_currency for pos in positions if pos.fx_rate is None})
+        if missing:
+            raise PortfolioException("scenario_service", f"No FX rate available to convert {', '.join(missing)} into {base_currency}")
+
+    categories = get_instrument_categories(session, list({pos.instrument_id for pos in positions}))
+    currencies = np.array([pos.instrument_currency for pos in positions], dtype=object)
+    position_categories = np.array([(categories.get(pos.instrument_id) or "").lower() for pos in positions], dtype=object)
+    tickers = np.array([(pos.instrument_ticker or "").upper() for pos in positions], dtype=object)
+
+    values = np.array([pos.remaining_quantity * pos.latest_price for pos in positions], dtype=np.float64)
+    pnls = np.array([pos.pnl for pos in positions], dtype=np.float64)
+    rates = np.array([pos.fx_rate if base_currency else 1.0 for pos in positions], dtype=np.float64)
+
+    # --- Selector masks, shared by every scenario using the same selector ---
+
+    price_columns, price_masks, price_entries = {}, [], ([], [], [])
+    fx_columns, fx_masks, fx_entries = {}, [], ([], [], [])
+    for scenario_index, scenario in enumerate(scenarios):
+        for shock in scenario.shocks:
+            selector = (
+                shock.currency.upper() if shock.currency else None,
+                shock.category.lower() if shock.category else None,
+                shock.ticker.upper() if shock.ticker else None,
+            )
+            if selector not in price_columns:
+                mask = np.ones(len(positions), dtype=bool)
+                for column, wanted in zip((currencies, position_categories, tickers), selector):
+                    if wanted is not None:
+                        mask &= column == wanted
+                price_columns[selector] = len(price_masks)
+                price_masks.append(mask.astype(np.float64))
+            price_entries[0].append(scenario_index)
+            price_entries[1].append(price_columns[selector])
+            price_entries[2].append(shock.change)
+
+        for shock in scenario.fx_shocks:
+            pair = pairs[shock.pair]
+            if pair not in fx_columns:
+                # Value in base currency of a position in currency c: up with c/base, down with base/c
+                fx_columns[pair] = len(fx_masks)
+                fx_masks.append(np.select(
+                    [(currencies == pair[0]) & (pair[1] == base_currency), (currencies == pair[1]) & (pair[0] == base_currency)],
+                    [1.0, -1.0],
+                    0.0,
+                ))
+            fx_entries[0].append(scenario_index)
+            fx_entries[1].append(fx_columns[pair])
+            fx_entries[2].append(shock.change)
+
+    n = len(scenarios)
+    price_multipliers = _log_multipliers(n, price_entries, price_masks) if price_masks else np.ones((n, len(positions)))
+    fx_multipliers = _log_multipliers(n, fx_entries, fx_masks) if fx_masks else np.ones((n, len(positions)))
+
+    # --- Totals: one (scenarios x positions) @ (positions x currencies) product each ---
+
+    currency_codes = sorted(set(currencies))
+    one_hot = (currencies[:, None] == np.array(currency_codes, dtype=object)[None, :]).astype(np.float64)
+
+    shocked_values = price_multipliers @ (values[:, None] * one_hot) if positions else np.zeros((n, 0))
+    current_values = values @ one_hot
+    current_pnls = pnls @ one_hot
+
+    if base_currency:
+        # pnl' = (pnl - value + shocked value) * rate * fx multiplier, summed over positions
+        market_value_base = (price_multipliers * fx_multipliers) @ (values * rates)
+        pnl_base = fx_multipliers @ ((pnls - values) * rates) + market_value_base
+        delta_pnl_base = pnl_base - (pnls * rates).sum()
+
+    # --- DTOs (plain lists: per-element numpy access would dominate for many scenarios) ---
+
+    shocked_rows = shocked_values.tolist()
+    current_values, current_pnls = current_values.tolist(), current_pnls.tolist()
+    base_rows = list(zip(market_value_base.tolist(), pnl_base.tolist(), delta_pnl_base.tolist())) if base_currency else None
+
+    results = []
+    for s, scenario in enumerate(scenarios):
+        result = ScenarioResultDTO(
+            name=scenario.name,
+            totals=[
+                ScenarioTotalDTO(currency=code, market_value=value, pnl=current_pnls[k] + value - current_values[k], delta_pnl=value - current_values[k])
+                for k, (code, value) in enumerate(zip(currency_codes, shocked_rows[s]))
+            ],
+        )
+        if base_currency:
+            result.base_currency = base_currency
+            result.market_value_base, result.pnl_base, result.delta_pnl_base = base_rows[s]
+        results.append(result)
+
+    return results
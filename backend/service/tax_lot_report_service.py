@@ -0,0 +1,146 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+from lib.database import get_read_session, read_from_db
+from lib.models import Account, Instrument, Position
+from lib.repo.trades_repository import iter_trades_by_position
+from lib.settings_manager import get_valuation_mode
+from service.custom_exceptions import PortfolioException
+from service.lot_matching import new_lot_matcher
+
+REPORT_FIELDS = [
+    "account", "instrument_ticker", "instrument_isin", "currency", "lot_method",
+    "buy_date", "sell_date", "quantity", "cost", "proceeds", "gain",
+]
+
+CHUNK_SIZE = 64 * 1024
+
+
+# ==========================================================
+# Realized gains tax-lot report
+# ==========================================================
+#
+# Trades are streamed from SQLite position by position and replayed through the
+# account's lot matcher; every matched lot of a sell in the tax year is yielded as
+# soon as it is produced, so neither the trades nor the matches are held in memory.
+# Dates are UTC calendar dates. With average cost the buy date is the opening date
+# of the holding the sell was matched against.
+
+
+def _position_labels(session, account_id: Optional[int]) -> dict[int, dict]:
+    """Report columns that only depend on the position: {position_id: {...}}."""
+
+    query = (
+        session.query(Position.id, Account.name, Account.lot_method, Instrument.ticker, Instrument.isin, Instrument.currency)
+        .join(Account, Position.account_id == Account.id)
+        .join(Instrument, Position.instrument_id == Instrument.id)
+    )
+    if account_id is not None:
+        query = query.filter(Position.account_id == account_id)
+
+    return {
+        position_id: {
+            "account": account_name,
+            "instrument_ticker": ticker or "",
+            "instrument_isin": isin or "",
+            "currency": currency.name,
+            "lot_method": lot_method,
+        }
+        for position_id, account_name, lot_method, ticker, isin, currency in query.all()
+    }
+
+
+def iter_realized_lots(session, account_id: Optional[int] = None, year: Optional[int] = None) -> Iterator[dict]:
+    """Yield one report row per matched lot, for the sells of the given tax year (all years when None)."""
+
+    labels = _position_labels(session, account_id)
+    before = datetime(year + 1, 1, 1, tzinfo=timezone.utc) if year else None
+    exact = get_valuation_mode() == "micro"  # match in int micro-units, convert each row once
+    convert = read_from_db if exact else (lambda amount: amount)
+
+    position_id, matcher = None, None
+    for trade_position_id, date, trade_type, quantity, price in iter_trades_by_position(session, account_id, before):
+
+        if trade_position_id != position_id:
+            position_id = trade_position_id
+            matcher = new_lot_matcher(labels[position_id]["lot_method"], exact)
+
+        for match in matcher.apply(trade_type, quantity, price if exact else read_from_db(price), date):
+            if year and match.sell_date.year != year:
+                continue
+            cost, proceeds = round(convert(match.cost), 2), round(convert(match.proceeds), 2)
+            yield {
+                **labels[position_id],
+                "lot_method": matcher.method,
+                "buy_date": match.buy_date.date().isoformat() if match.buy_date else None,
+                "sell_date": match.sell_date.date().isoformat(),
+                "quantity": match.quantity,
+                "cost": cost,
+                "proceeds": proceeds,
+                "gain": round(proceeds - cost, 2),
+            }
+
+
+# -----------------------
+# -- Output formats
+# -----------------------
+
+def _chunked(lines: Iterator[str]) -> Iterator[str]:
+    """Group small lines into chunks of about CHUNK_SIZE characters."""
+
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def iter_ndjson(rows: Iterator[dict]) -> Iterator[str]:
+    return _chunked(json.dumps(row) + "\n" for row in rows)
+
+
+def iter_csv(rows: Iterator[dict]) -> Iterator[str]:
+
+    def lines():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    return _chunked(lines())
+
+
+REPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", iter_ndjson),
+    "csv": ("text/csv", iter_csv),
+}
+
+
+def stream_tax_lot_report(report_format: str, account_id: Optional[int] = None, year: Optional[int] = None,
+                          session_factory=get_read_session) -> Iterator[str]:
+    """
+    Text chunks of the report in the given format. The generator owns its session,
+    so it can outlive the request scope of a streaming response.
+    """
+
+    if report_format not in REPORT_FORMATS:
+        raise PortfolioException("tax_lot_report", f"Unknown report format {report_format!r}, expected one of {', '.join(REPORT_FORMATS)}")
+    _, writer = REPORT_FORMATS[report_format]
+
+    def chunks():
+        with session_factory() as session:
+            yield from writer(iter_realized_lots(session, account_id, year))
+
+    return chunks()
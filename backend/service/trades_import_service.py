@@ -0,0 +1,249 @@
+import csv
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Optional, TextIO
+
+from lib.data_version import bump_data_version_on_commit
+from lib.database import get_session, write_to_db
+from lib.enums import TradeType
+from lib.models import Account, Instrument, Position
+from lib.repo.trades_repository import bulk_insert_trades, get_open_positions_state, update_positions_state
+from lib.settings_manager import get_timezone
+from lib.utils import is_valid_isin
+from logging_config import setup_logger
+
+log = setup_logger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+# -----------------------
+# -- DTO Models
+# -----------------------
+
+@dataclass
+class ImportErrorDTO:
+    line: int
+    message: str
+
+
+@dataclass
+class ImportResultDTO:
+    """Outcome of a trades CSV import."""
+
+    rows: int = 0
+    inserted: int = 0
+    positions_created: int = 0
+    positions_closed: int = 0
+    committed: bool = False
+    errors: list[ImportErrorDTO] = field(default_factory=list)
+
+
+@dataclass
+class _PositionState:
+    """Running state of one position while streaming; id is None until the position is inserted."""
+
+    account_id: int
+    instrument_id: int
+    id: Optional[int] = None
+    quantity: int = 0
+    last_date: Optional[datetime] = None
+    closing_date: Optional[datetime] = None
+    touched: bool = False
+
+
+# -----------------------
+# -- Batch writer
+# -----------------------
+
+def parse_trade_date(value) -> datetime:
+    """Accept ISO strings or datetimes; naive values are in the app timezone."""
+    dt = datetime.fromisoformat(value.strip()) if isinstance(value, str) else value
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=get_timezone())
+    return dt.astimezone(timezone.utc)
+
+
+class TradeBatchWriter:
+    """
+    Validate and store many trades in the caller's transaction.
+    Accounts, instruments and open positions are resolved from in-memory maps loaded once;
+    trades are buffered and inserted with executemany on flush(); the positions touched are
+    closed / reopened once in finish(). Trades must come in chronological order per position.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.accounts = {name: account_id for name, account_id in session.query(Account.name, Account.id).all()}
+        self.instrument_ids = set()
+        self.by_isin, self.by_ticker = {}, {}
+        for instrument_id, isin, ticker in session.query(Instrument.id, Instrument.isin, Instrument.ticker).all():
+            self.instrument_ids.add(instrument_id)
+            if isin:
+                self.by_isin[isin.strip().upper()] = instrument_id
+            if ticker:
+                self.by_ticker[ticker.strip().upper()] = instrument_id
+
+        self.positions = {
+            key: _PositionState(key[0], key[1], id=position_id, quantity=quantity, last_date=last_date)
+            for key, (position_id, quantity, last_date) in get_open_positions_state(session).items()
+        }
+        self.touched: list[_PositionState] = []
+        self.pending: list[tuple[_PositionState, dict]] = []
+        self.positions_created = 0
+
+    def resolve_instrument(self, isin: Optional[str], ticker: Optional[str], instrument_id: Optional[int] = None) -> int:
+        if instrument_id is not None:
+            if instrument_id not in self.instrument_ids:
+                raise ValueError(f"unknown instrument id {instrument_id}")
+            return instrument_id
+
+        isin = (isin or "").strip().upper().replace(" ", "")
+        ticker = (ticker or "").strip().upper()
+        if isin:
+            if not is_valid_isin(isin):
+                raise ValueError(f"invalid ISIN {isin}")
+            instrument_id = self.by_isin.get(isin)
+        elif ticker:
+            instrument_id = self.by_ticker.get(ticker)
+        else:
+            raise ValueError("either isin or ticker is required")
+        if instrument_id is None:
+            raise ValueError(f"unknown instrument {isin or ticker}")
+        return instrument_id
+
+    def add(self, account_name: str, instrument_id: int, date: datetime, trade_type: str, quantity: int,
+            price: float, description: Optional[str] = None):
+        """Validate one trade against the running state and buffer it; raises ValueError when invalid."""
+
+        trade_type = (trade_type or "").strip().lower()
+        if trade_type not in (t.value for t in TradeType):
+            raise ValueError(f"invalid trade type {trade_type!r}")
+        if quantity <= 0 or price < 0:
+            raise ValueError("quantity must be positive and price not negative")
+
+        account_id = self.accounts.get((account_name or "").strip())
+        if account_id is None:
+            raise ValueError(f"unknown account {account_name!r}")
+
+        key = (account_id, instrument_id)
+        state = self.positions.get(key)
+        if state is None or state.closing_date is not None:
+            if trade_type == TradeType.SELL.value:
+                raise ValueError("sell without an open position")
+            state = _PositionState(account_id, instrument_id)
+            self.positions[key] = state
+
+        if state.last_date and date < state.last_date:
+            raise ValueError("trade older than the previous trade of the position")
+        if trade_type == TradeType.SELL.value and quantity > state.quantity:
+            raise ValueError(f"selling {quantity} but only {state.quantity} held")
+
+        state.quantity += quantity if trade_type == TradeType.BUY.value else -quantity
+        state.last_date = date
+        if state.quantity == 0:
+            state.closing_date = date
+        if not state.touched:
+            state.touched = True
+            self.touched.append(state)
+
+        self.pending.append((state, {
+            "date": date,
+            "type": trade_type,
+            "quantity": quantity,
+            "price": write_to_db(price),
+            "description": description or None,
+        }))
+
+    def flush(self) -> list[int]:
+        """Insert the buffered trades (creating their new positions in bulk); returns the trade ids in order."""
+
+        new_positions = {id(state): state for state, _ in self.pending if state.id is None}
+        if new_positions:
+            models = {key: Position(account_id=state.account_id, instrument_id=state.instrument_id, closed=False) for key, state in new_positions.items()}
+            self.session.add_all(models.values())
+            self.session.flush()
+            for key, model in models.items():
+                new_positions[key].id = model.id
+            self.positions_created += len(models)
+
+        rows = []
+        for state, row in self.pending:
+            row["position_id"] = state.id
+            rows.append(row)
+        self.pending.clear()
+        return bulk_insert_trades(self.session, rows)
+
+    def finish(self) -> list[int]:
+        """Write the closed flag and closing date of the positions touched; returns the affected account ids."""
+
+        update_positions_state(self.session, [
+            {"id": state.id, "closed": state.closing_date is not None, "closing_date": state.closing_date}
+            for state in self.touched
+        ])
+        return sorted({state.account_id for state in self.touched})
+
+    @property
+    def positions_closed(self) -> int:
+        return sum(1 for state in self.touched if state.closing_date is not None)
+
+
+# -----------------------
+# -- Import
+# -----------------------
+
+def import_trades_csv(file: TextIO, batch_size: int = DEFAULT_BATCH_SIZE, strict: bool = False) -> ImportResultDTO:
+    """
+    Stream a broker CSV (columns: date, account, isin or ticker, type, quantity, price, description)
+    and store its trades in one transaction, inserting them every batch_size rows.
+    Invalid rows are reported and skipped; with strict=True any error rolls the whole import back.
+    """
+
+    result = ImportResultDTO()
+
+    with get_session() as session:
+
+        reader = csv.DictReader(file)
+        missing = {"date", "account", "type", "quantity", "price"} - set(reader.fieldnames or [])
+        if missing:
+            result.errors.append(ImportErrorDTO(1, f"Missing columns: {', '.join(sorted(missing))}"))
+            return result
+
+        writer = TradeBatchWriter(session)
+
+        for line, raw in enumerate(reader, start=2):
+            result.rows += 1
+            try:
+                writer.add(
+                    raw["account"],
+                    writer.resolve_instrument(raw.get("isin"), raw.get("ticker")),
+                    parse_trade_date(raw["date"]),
+                    raw["type"],
+                    int(raw["quantity"]),
+                    float(raw["price"]),
+                    raw.get("description"),
+                )
+            except (ValueError, TypeError) as ex:
+                result.errors.append(ImportErrorDTO(line, str(ex)))
+                continue
+
+            if len(writer.pending) >= batch_size:
+                result.inserted += len(writer.flush())
+
+        result.inserted += len(writer.flush())
+
+        if strict and result.errors:
+            session.rollback()
+            log.error(f"❌ Trades import rolled back: {len(result.errors)} invalid rows")
+            return result
+
+        # --- Rebuild the positions touched by the import, once ---
+
+        bump_data_version_on_commit(session, writer.finish())
+        session.commit()
+        result.positions_created = writer.positions_created
+        result.positions_closed = writer.positions_closed
+        result.committed = True
+
+    log.info(f"📈 Imported {result.inserted} trades from {result.rows} rows ({len(result.errors)} errors)")
+    return result
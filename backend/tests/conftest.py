@@ -0,0 +1,31 @@
+import json
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def temp_settings(tmp_path, monkeypatch):
+    """
+    write(database=..., app=...) writes settings.json (the repo's, sections updated with the
+    given values, database in tmp_path) into tmp_path and makes it the working directory.
+    The summary and checkpoint caches are cleared around the test: they outlive the database.
+    """
+
+    from service.positions_service import get_history_cache, get_summary_cache
+
+    def write(**sections):
+        settings = json.loads((BACKEND_DIR / "settings.json").read_text(encoding="utf-8"))
+        settings["database"].update(url=f"sqlite:///{tmp_path / 'portfolio.db'}", serving_mode="disk", ohlcv_partitions=False)
+        for name, values in sections.items():
+            settings.setdefault(name, {}).update(values)
+        (tmp_path / "settings.json").write_text(json.dumps(settings), encoding="utf-8")
+        monkeypatch.chdir(tmp_path)
+
+    get_summary_cache().clear()
+    get_history_cache().clear()
+    yield write
+    get_summary_cache().clear()
+    get_history_cache().clear()
@@ -0,0 +1,147 @@
+import random
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from fractions import Fraction
+
+import pytest
+
+START = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def _synthetic_ledger(trades: int, seed: int) -> list[tuple]:
+    """Random (type, quantity, price in micro-units, date) trades that never sell more than is held."""
+
+    rng = random.Random(seed)
+    ledger, held = [], 0
+    date = START
+    for _ in range(trades):
+        date += timedelta(hours=rng.randint(1, 48))
+        price = rng.randint(1_000_000, 5_000_000_000)  # 1 to 5000 with 6 decimals
+        if held and rng.random() < 0.4:
+            quantity = rng.randint(1, held)
+            held -= quantity
+            ledger.append(("sell", quantity, price, date))
+        else:
+            quantity = rng.randint(1, 500)
+            held += quantity
+            ledger.append(("buy", quantity, price, date))
+    return ledger
+
+
+def _fifo_reference(ledger: list[tuple], latest_price: int, transactions: int) -> tuple[int, int]:
+    """(invested, pnl) in micro-units, replayed with plain ints independently of service.lot_matching."""
+
+    lots, invested, realized = deque(), 0, 0
+    for trade_type, quantity, price, _ in ledger:
+        if trade_type == "buy":
+            lots.append([quantity, price])
+            invested += quantity * price
+            continue
+        while quantity:
+            lot = lots[0]
+            matched = min(lot[0], quantity)
+            realized += matched * (price - lot[1])
+            lot[0] -= matched
+            quantity -= matched
+            if not lot[0]:
+                lots.popleft()
+    unrealized = sum(quantity * (latest_price - price) for quantity, price in lots)
+    return invested, realized + unrealized + transactions
+
+
+# -----------------------
+# -- Lot matchers
+# -----------------------
+
+def test_lot_matchers_stay_exact_in_micro_units():
+    from service.lot_matching import AVERAGE_COST, LOT_MATCHERS, new_lot_matcher
+
+    ledger = _synthetic_ledger(20_000, seed=1)
+    proceeds = sum(quantity * price for trade_type, quantity, price, _ in ledger if trade_type == "sell")
+
+    for method in LOT_MATCHERS:
+        micro, reference = new_lot_matcher(method, exact=True), new_lot_matcher(method, exact=True)
+        for trade_type, quantity, price, date in ledger:
+            micro.apply(trade_type, quantity, price, date)
+            reference.apply(trade_type, quantity, Fraction(price, 1_000_000), date)
+
+        basis = micro.remaining()[1]
+        assert all(type(total) is int for total in (micro.total_invested, micro.realized_pnl, basis)), method
+        if method == AVERAGE_COST:
+            # The cost removed by a sell is rounded: the basis must be conserved instead
+            assert basis - micro.realized_pnl == micro.total_invested - proceeds
+        else:
+            assert Fraction(micro.realized_pnl, 1_000_000) == reference.realized_pnl, method
+            assert Fraction(basis, 1_000_000) == reference.remaining()[1], method
+
+
+# -----------------------
+# -- Positions and totals pipeline
+# -----------------------
+
+@pytest.fixture
+def micro_db(temp_settings):
+    """Empty database in micro valuation mode."""
+
+    from lib.database import init_db
+
+    temp_settings(app={"valuation_mode": "micro"})
+    init_db()
+
+
+def test_micro_totals_are_exact(micro_db):
+    from lib.database import get_session, read_from_db
+    from lib.models import OHLCV, Account, Instrument, Position, Trade, Transaction
+    from service.positions_service import get_positions_summary, get_positions_totals
+
+    rng = random.Random(7)
+    expected = {}  # currency -> [invested, pnl] in micro-units
+    with get_session() as session:
+        account = Account(name="A")
+        session.add(account)
+        session.flush()
+
+        for index in range(6):
+            currency = ("USD", "EUR")[index % 2]
+            instrument = Instrument(name=f"Instrument {index}", ticker=f"T{index}", currency=currency)
+            session.add(instrument)
+            session.flush()
+
+            latest_price = rng.randint(1_000_000, 5_000_000_000)
+            session.add(OHLCV(instrument_id=instrument.id, timestamp=START, granularity="1d",
+                              open=latest_price, high=latest_price, low=latest_price, close=latest_price, volume=0))
+
+            position = Position(account_id=account.id, instrument_id=instrument.id, closed=False)
+            session.add(position)
+            session.flush()
+
+            ledger = _synthetic_ledger(2_000, seed=index)
+            session.add_all(Trade(position_id=position.id, date=date, type=trade_type, quantity=quantity, price=price)
+                            for trade_type, quantity, price, date in ledger)
+
+            dividend, fee = rng.randint(1, 10**9), rng.randint(1, 10**7)
+            session.add_all([
+                Transaction(account_id=account.id, position_id=position.id, date=START, type="div", amount=dividend),
+                Transaction(account_id=account.id, position_id=position.id, date=START, type="fee", amount=fee),
+            ])
+
+            invested, pnl = _fifo_reference(ledger, latest_price, dividend - fee)
+            totals = expected.setdefault(currency, [0, 0])
+            totals[0] += invested
+            totals[1] += pnl
+        session.commit()
+
+        positions = get_positions_summary(session)
+        assert len(positions) == 6
+        for pos in positions:
+            assert type(pos.total_invested_micro) is int and type(pos.pnl_micro) is int
+            assert pos.pnl == read_from_db(pos.pnl_micro)
+
+        totals = {total.currency: total for total in get_positions_totals(session)}
+        assert set(totals) == set(expected)
+        for currency, (invested, pnl) in expected.items():
+            assert sum(pos.total_invested_micro for pos in positions if pos.instrument_currency == currency) == invested
+            assert sum(pos.pnl_micro for pos in positions if pos.instrument_currency == currency) == pnl
+            # Converted once, from the exact sum
+            assert totals[currency].total_invested == read_from_db(invested)
+            assert totals[currency].total_pnl == read_from_db(pnl)
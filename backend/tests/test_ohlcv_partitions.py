@@ -0,0 +1,44 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import event
+
+
+def test_fingerprint_does_not_scan_partitions(temp_settings):
+    from lib import data_version
+    from lib.database import get_session, init_db
+    from lib.models import Instrument
+    from lib.ohlcv_partitions import create_partitions
+    from lib.repo.ohlcvs_repository import bulk_load_ohlcv
+
+    temp_settings(database={"ohlcv_partitions": True})
+    init_db()
+    create_partitions([2022, 2023, 2024])
+
+    with get_session() as session:
+        instrument = Instrument(name="Instrument", ticker="T", currency="USD")
+        session.add(instrument)
+        session.commit()
+        bulk_load_ohlcv(session, [
+            (instrument.id, datetime(year, month, 1, tzinfo=timezone.utc), "1d", 1.0, 1.0, 1.0, 1.0, 0)
+            for year in (2022, 2023, 2024) for month in range(1, 13)
+        ])
+        session.commit()
+
+    with get_session() as session:
+        connection = session.connection()
+        statements = []
+        listener = lambda conn, cursor, statement, parameters, context, executemany: statements.append((statement, parameters))
+        event.listen(connection, "before_cursor_execute", listener)
+        try:
+            fingerprint = data_version._read_fingerprint(session)
+        finally:
+            event.remove(connection, "before_cursor_execute", listener)
+
+        assert fingerprint[-1] is not None and fingerprint[-1] > 0
+        assert len(statements) == 1
+        statement, parameters = statements[0]
+        plan = [row[-1] for row in connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+
+    assert not [detail for detail in plan if detail.startswith("SCAN") and "ohlcvs" in detail], plan
+    searched = [detail for detail in plan if detail.startswith("SEARCH") and "ohlcvs" in detail]
+    assert len(searched) == 1 + 3 + 2   # main, the three years created here, this year and the next
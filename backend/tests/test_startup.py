@@ -0,0 +1,59 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Cold import cost of the API and CLI entry points, relative to importing fastapi and sqlalchemy
+# in the same interpreter first: both sides slow down together on a loaded machine.
+# Measured ~0.55 for main and ~0.2 for lib.console_handlers; pulling pandas back in adds ~1.0.
+REFERENCE_MODULES = ("fastapi", "sqlalchemy")
+STARTUP_BUDGETS = {
+    "main": 1.0,
+    "lib.console_handlers": 0.5,
+}
+REPEAT = 3
+
+# Market-data stack that must only be imported when actually downloading
+FORBIDDEN_STARTUP_MODULES = ("yfinance", "pandas")
+
+
+def _cold_import(module: str) -> tuple[float, float, set[str]]:
+    """
+    Import the reference modules, then module, in a fresh interpreter with -X importtime.
+    Return (reference cumulative ms, module cumulative ms on top of it, modules in sys.modules).
+    """
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         f"import sys, {', '.join(REFERENCE_MODULES)}; import {module}; print('\\n'.join(sys.modules))"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+
+    cumulative_us = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        cumulative_us[name.strip()] = int(cumulative)
+    reference_us = sum(cumulative_us[name] for name in REFERENCE_MODULES)
+    return reference_us / 1000, cumulative_us.get(module, 0) / 1000, set(result.stdout.split())
+
+
+@pytest.mark.parametrize("module", sorted(STARTUP_BUDGETS))
+def test_startup_does_not_import_market_data_stack(module):
+    modules = _cold_import(module)[2]
+    assert not [name for name in FORBIDDEN_STARTUP_MODULES if name in modules]
+
+
+@pytest.mark.parametrize("module", sorted(STARTUP_BUDGETS))
+def test_startup_within_budget(module):
+    ratios = []
+    for _ in range(REPEAT):
+        reference_ms, module_ms, _ = _cold_import(module)
+        ratios.append(module_ms / reference_ms)
+    best = min(ratios)
+    assert best <= STARTUP_BUDGETS[module], \
+        f"{module} cold import costs {best:.2f}x the fastapi + sqlalchemy import, budget {STARTUP_BUDGETS[module]}x"
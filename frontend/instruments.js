@@ -4,9 +4,15 @@ document.addEventListener('alpine:init', () => {
         isLoading: false,
         error: null,
         searchQuery: '',
+        searchResults: null,
+        searchTimer: null,
 
         async init() {
             this.fetchData();
+            this.$watch('searchQuery', () => {
+                clearTimeout(this.searchTimer);
+                this.searchTimer = setTimeout(() => this.search(), 200);
+            });
         },
 
         async fetchData() {
@@ -26,16 +32,31 @@ document.addEventListener('alpine:init', () => {
             }
         },
 
-        get filteredInstruments() {
-            if (this.searchQuery === '') return this.instruments;
+        // Prefix and fuzzy matching is done by the backend index
+        async search() {
+            const q = this.searchQuery.trim();
+            if (q === '') {
+                this.searchResults = null;
+                return;
+            }
+            try {
+                const response = await fetch(`http://localhost:8000/api/instruments/search?q=${encodeURIComponent(q)}&limit=100`);
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status}`);
+                }
+                const results = await response.json();
+                if (q === this.searchQuery.trim()) {  // ignore answers to outdated queries
+                    this.searchResults = results;
+                }
+            } catch (err) {
+                console.error("Failed to search instruments:", err);
+                this.error = "Failed to search instruments. Make sure the backend Server is running on port 8000.";
+            }
+        },
 
-            const q = this.searchQuery.toLowerCase();
-            return this.instruments.filter(inst => {
-                const nameMatch = (inst.name || '').toLowerCase().includes(q);
-                const tickerMatch = (inst.ticker || '').toLowerCase().includes(q);
-                const isinMatch = (inst.isin || '').toLowerCase().includes(q);
-                return nameMatch || tickerMatch || isinMatch;
-            });
+        get filteredInstruments() {
+            if (this.searchQuery === '' || this.searchResults === null) return this.instruments;
+            return this.searchResults;
         },
 
         // Exposing shared formatters just in case we need them in the template
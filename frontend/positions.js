@@ -11,6 +11,9 @@ document.addEventListener('alpine:init', () => {
         selectedAccount: '',
         accounts: [],
 
+        // Live updates (server-sent events)
+        eventSource: null,
+
         async init() {
             this.accounts = await window.utils.fetchAccounts();
             // Restore selection AFTER accounts are loaded so Alpine.js finds the option
@@ -38,6 +41,7 @@ document.addEventListener('alpine:init', () => {
                     this.fetchPositions(),
                     this.fetchTotals()
                 ]);
+                this.subscribe();
             } catch (err) {
                 console.error("Failed to fetch data:", err);
                 this.error = "Failed to load portfolio data. Make sure the backend Server is running on port 8000.";
@@ -64,6 +68,33 @@ document.addEventListener('alpine:init', () => {
             this.totals = await response.json();
         },
 
+        // Re-open the stream for the current account and status filter
+        subscribe() {
+            if (this.eventSource) this.eventSource.close();
+            const url = `http://localhost:8000/api/positions/stream?status_filter=${this.statusFilter}&account_name=${this.selectedAccount}`;
+            this.eventSource = new EventSource(url);
+            this.eventSource.addEventListener('positions', (e) => this.applyPatch(JSON.parse(e.data)));
+        },
+
+        // Patches only carry the changed fields of the changed positions
+        applyPatch(patch) {
+            const removed = new Set(patch.removed);
+            if (removed.size > 0) {
+                this.positions = this.positions.filter(pos => !removed.has(pos.position_id));
+            }
+            for (const update of patch.upserts) {
+                const pos = this.positions.find(p => p.position_id === update.position_id);
+                if (pos) {
+                    Object.assign(pos, update);
+                } else {
+                    this.positions.push(update);
+                }
+            }
+            if (patch.totals) {
+                this.totals = patch.totals;
+            }
+        },
+
         get filteredPositions() {
             if (this.searchQuery === '') return this.positions;
 